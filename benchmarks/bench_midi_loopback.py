@@ -0,0 +1,166 @@
+"""ループバックでのMidiNodeの送受信スループットとレイテンシのベンチマーク
+
+同一マシン内に限定したマルチキャストのセッションで送信ノードと受信ノードをつなぎ、
+- スループット: メッセージを連続送信し、受信側が処理できた件数と1秒あたりの処理数を計測
+- レイテンシ: 1件ずつ送信し、送信から受信コールバックまでの時間を計測
+を行う。受信は専用の受信スレッド（既定）と `ReceiveEngine`（"+engine"）の両方で計測する。
+
+使い方:
+    python -m benchmarks.bench_midi_loopback [--count N] [--pings N] [--json]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+from src.common.midi_utils import (
+    MidiMessage,
+    MidiNode,
+    MulticastTransport,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_JSON,
+)
+from src.common.receive_engine import ReceiveEngine
+
+
+def _percentile(sorted_values, ratio):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+class _Receiver:
+    """受信件数と受信時刻を記録するコールバック"""
+
+    def __init__(self):
+        self.count = 0
+        self.last_time = 0.0
+        self.latencies = []
+        self.event = threading.Event()
+
+    def __call__(self, msg: MidiMessage):
+        now = time.perf_counter()
+        self.count += 1
+        self.last_time = now
+        if msg.timestamp is not None:
+            self.latencies.append(now - msg.timestamp)
+        self.event.set()
+
+
+def _connect(wire_format: str, session: str, engine=None):
+    """同一マシン内のセッションで送信ノードと受信ノードを作る"""
+    receiver = _Receiver()
+    rx = MidiNode(
+        "bench_rx", receiver, transport=MulticastTransport.for_session(session, loopback_only=True), receive_engine=engine
+    )
+    tx = MidiNode(
+        "bench_tx", lambda msg: None, wire_format, transport=MulticastTransport.for_session(session, loopback_only=True)
+    )
+    return receiver, rx, tx
+
+
+def measure_throughput(wire_format: str, count: int, session: str, engine=None) -> dict:
+    """メッセージを連続送信し、受信側で処理できた件数と処理速度を計測する"""
+    receiver, rx, tx = _connect(wire_format, session, engine)
+    msg = MidiMessage(type="note_on", note=60, velocity=100, channel=1)
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            tx.send_message(msg)
+        send_sec = time.perf_counter() - start
+
+        # 受信が止まるまで待つ
+        while receiver.event.wait(0.2):
+            receiver.event.clear()
+            if receiver.count >= count:
+                break
+        elapsed = (receiver.last_time or time.perf_counter()) - start
+        stats = rx.receive_stats()
+    finally:
+        tx.close()
+        rx.close()
+
+    result = {
+        "sent": count,
+        "received": receiver.count,
+        "lost": count - receiver.count,
+        "send_per_sec": count / send_sec,
+        "receive_per_sec": receiver.count / elapsed if elapsed > 0 else 0.0,
+    }
+    if stats is not None:
+        result["wakeups"] = stats.wakeups
+        result["max_batch"] = stats.max_batch
+    return result
+
+
+def measure_latency(wire_format: str, pings: int, session: str, engine=None) -> dict:
+    """1件ずつ送信し、送信から受信コールバックまでの時間を計測する"""
+    receiver, rx, tx = _connect(wire_format, session, engine)
+    try:
+        for _ in range(pings):
+            receiver.event.clear()
+            # 同一プロセス内なのでperf_counterの時刻をタイムスタンプとして送る
+            tx.send_message(MidiMessage(type="clock", timestamp=time.perf_counter()))
+            receiver.event.wait(0.1)
+    finally:
+        tx.close()
+        rx.close()
+
+    latencies = sorted(latency * 1e6 for latency in receiver.latencies)
+    if not latencies:
+        return {"received": 0}
+    return {
+        "received": len(latencies),
+        "mean_us": sum(latencies) / len(latencies),
+        "p50_us": _percentile(latencies, 0.50),
+        "p95_us": _percentile(latencies, 0.95),
+        "p99_us": _percentile(latencies, 0.99),
+        "max_us": latencies[-1],
+    }
+
+
+def run(count: int = 20_000, pings: int = 1_000) -> dict:
+    """両方のワイヤーフォーマットと、受信スレッド・受信エンジンのそれぞれについて計測する"""
+    results = {}
+    for wire_format in (WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY):
+        # 他のパッチと混ざらないよう、プロセスごとに別のセッションを使う
+        session = f"bench-{os.getpid()}-{wire_format}"
+        results[wire_format] = {
+            "throughput": measure_throughput(wire_format, count, session),
+            "latency": measure_latency(wire_format, pings, session),
+        }
+        engine = ReceiveEngine()
+        engine.start()
+        try:
+            results[f"{wire_format}+engine"] = {
+                "throughput": measure_throughput(wire_format, count, session, engine),
+                "latency": measure_latency(wire_format, pings, session, engine),
+            }
+        finally:
+            engine.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20_000, help="スループットの計測で送信するメッセージ数")
+    parser.add_argument("--pings", type=int, default=1_000, help="レイテンシの計測で送信するメッセージ数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = run(args.count, args.pings)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'format':<15}{'send/s':>10}{'recv/s':>10}{'lost':>8}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    for fmt, r in results.items():
+        tp, lat = r["throughput"], r["latency"]
+        print(
+            f"{fmt:<15}{tp['send_per_sec']:>10.0f}{tp['receive_per_sec']:>10.0f}{tp['lost']:>8}"
+            f"{lat.get('p50_us', 0):>10.1f}{lat.get('p99_us', 0):>10.1f}{lat.get('max_us', 0):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
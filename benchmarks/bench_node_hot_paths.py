@@ -0,0 +1,179 @@
+"""ノードのホットパス（MIDI処理・ステップ処理・パーティクル更新）のベンチマーク
+
+すべてのノードをヘッドレスモード・プロセス内のバス（UDPなし）で作成し、
+- 各ノードクラスの `on_midi()` の1メッセージあたりの処理時間（クロックとノートの混在）
+- `AdvancedRhythmNode._process_step()` の1ステップあたりの処理時間（既定の4音色×16ステップと64音色×64ステップ）
+- 各ノードクラスの `draw()` の1フレームあたりの処理時間（ヘッドレスモードのメモリ上の画面への描画。文字は描画されない）
+- `VideoNode` のパーティクル群の1フレームあたりの更新・描画時間（パーティクル数・実装別）
+を計測する。
+
+使い方:
+    python -m benchmarks.bench_node_hot_paths [--count N] [--json]
+"""
+
+import argparse
+import json
+import time
+
+from src.common.midi_utils import LocalBus, MidiMessage
+from src.nodes._0000_rhythm_gen.rhythm_generator_node import RhythmGeneratorNode
+from src.nodes._0001_rhythm.rhythm_node import RhythmNode
+from src.nodes._0002_synth.synth_node import SynthNode
+from src.nodes._0003_advanced_rhythm.advanced_rhythm_node import AdvancedRhythmNode
+from src.nodes._0003_advanced_rhythm.patterns import DrumSound, steps_to_mask
+from src.nodes._0004_video.particles import ParticleSystem, np
+from src.nodes._0004_video.video_node import VideoNode
+
+NODE_CLASSES = [RhythmGeneratorNode, RhythmNode, SynthNode, AdvancedRhythmNode, VideoNode]
+PARTICLE_COUNTS = [1_000, 10_000, 50_000]
+
+
+def _message_mix():
+    """クロック24個ごとにノートオン/オフが1組入る、演奏中の典型的なメッセージ列"""
+    msgs = [MidiMessage(type="clock", source="gen") for _ in range(24)]
+    msgs.append(MidiMessage(type="note_on", note=60, velocity=100, channel=1, source="gen"))
+    msgs.append(MidiMessage(type="note_off", note=60, velocity=0, channel=1, source="gen"))
+    return msgs
+
+
+def bench_on_midi(node_class, count: int) -> dict:
+    """ノードクラスのon_midi()の1メッセージあたりの処理時間を計測する"""
+    bus = LocalBus(remote=False)
+    node = node_class(headless=True, bus=bus)
+    msgs = _message_mix()
+    try:
+        node.on_midi(MidiMessage(type="start", source="gen"))
+        on_midi = node.on_midi
+        rounds = max(1, count // len(msgs))
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for msg in msgs:
+                on_midi(msg)
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        node.close()
+    processed = rounds * len(msgs)
+    return {"messages": processed, "ns_per_message": elapsed / processed}
+
+
+def _many_drums(tracks: int, steps: int) -> dict:
+    """tracks音色×stepsステップの、ステップごとに数音色が鳴るドラム構成"""
+    return {
+        f"drum{i}": DrumSound(
+            name=f"D{i}",
+            note=36 + i % 48,
+            sound_id=i % 4,
+            volume=100,
+            pattern=steps_to_mask(step % 16 == i % 16 for step in range(steps)),
+            muted=False,
+        )
+        for i in range(tracks)
+    }
+
+
+def bench_draw(node_class, frames: int) -> dict:
+    """ノードクラスのdraw()の1フレームあたりの処理時間を計測する（静的なレイヤーは作成済みの状態）"""
+    bus = LocalBus(remote=False)
+    node = node_class(headless=True, bus=bus)
+    try:
+        node.draw()
+        start = time.perf_counter_ns()
+        for _ in range(frames):
+            node.draw()
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        node.close()
+    return {"us_per_frame": elapsed / frames / 1e3}
+
+
+def bench_process_step(count: int, tracks: int = 4, steps: int = 16) -> dict:
+    """AdvancedRhythmNode._process_step()の1ステップあたりの処理時間を計測する"""
+    bus = LocalBus(remote=False)
+    node = AdvancedRhythmNode(headless=True, bus=bus, emit_notes=True)
+    if tracks != 4 or steps != 16:
+        node.set_drums(_many_drums(tracks, steps), steps)
+    msg = MidiMessage(type="clock", source="gen")
+    try:
+        node.running = True
+        start = time.perf_counter_ns()
+        for _ in range(count):
+            node.step = (node.step + 1) % node.num_steps
+            node._process_step(msg)
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        node.close()
+    return {"steps": count, "us_per_step": elapsed / count / 1e3}
+
+
+def bench_particles(num: int, use_numpy: bool, frames: int) -> dict:
+    """num個のパーティクルの1フレームあたりの更新・描画時間を計測する"""
+    system = ParticleSystem(num, use_numpy=use_numpy)
+    # 寿命を十分に長くし、計測中に数が変わらないようにする
+    dx = [((i % 97) - 48) / 16 for i in range(num)]
+    dy = [((i % 89) - 60) / 16 for i in range(num)]
+    system.spawn(80, 60, dx, dy, life=frames + 10, color=7)
+    buffer = np.zeros((120, 160), dtype=np.uint8) if use_numpy else None
+
+    start = time.perf_counter_ns()
+    for _ in range(frames):
+        system.update()
+    update_ns = time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+    for _ in range(frames):
+        if use_numpy:
+            system._rasterize(buffer, len(system))
+        else:
+            system.draw()  # ヘッドレスモードのpyxel.circ（呼び出しのコストのみ）
+    draw_ns = time.perf_counter_ns() - start
+
+    return {"update_ms": update_ns / frames / 1e6, "draw_ms": draw_ns / frames / 1e6}
+
+
+def run(count: int = 50_000, frames: int = 30) -> dict:
+    """すべてのホットパスを計測する"""
+    results = {
+        "on_midi": {cls.__name__: bench_on_midi(cls, count) for cls in NODE_CLASSES},
+        "draw": {cls.__name__: bench_draw(cls, frames * 10) for cls in NODE_CLASSES},
+        "process_step": {
+            "4x16": bench_process_step(count // 10),
+            "64x64": bench_process_step(count // 10, tracks=64, steps=64),
+        },
+        "particles": {},
+    }
+    backends = ["numpy", "list"] if np is not None else ["list"]
+    for backend in backends:
+        results["particles"][backend] = {str(num): bench_particles(num, backend == "numpy", frames) for num in PARTICLE_COUNTS}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50_000, help="on_midi()の計測で処理するメッセージ数")
+    parser.add_argument("--frames", type=int, default=30, help="パーティクルの計測で処理するフレーム数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = run(args.count, args.frames)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'node':<24}{'ns/message':>12}")
+    for name, r in results["on_midi"].items():
+        print(f"{name:<24}{r['ns_per_message']:>12.0f}")
+    print(f"\n{'node':<24}{'us/frame':>12}")
+    for name, r in results["draw"].items():
+        print(f"{name:<24}{r['us_per_frame']:>12.1f}")
+    print()
+    for size, r in results["process_step"].items():
+        print(f"AdvancedRhythmNode._process_step ({size}): {r['us_per_step']:.2f} us/step")
+    print()
+    print(f"{'particles':<10}{'backend':<8}{'update ms':>12}{'draw ms':>12}")
+    for backend, sizes in results["particles"].items():
+        for num, r in sizes.items():
+            print(f"{num:<10}{backend:<8}{r['update_ms']:>12.3f}{r['draw_ms']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
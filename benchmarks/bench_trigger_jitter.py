@@ -0,0 +1,110 @@
+"""受信時に即発音する場合と、タイムスタンプ + lookahead に予約する場合の発音タイミングの揺らぎの比較
+
+クロックの理想時刻にネットワークの遅延（ランダムな揺らぎ）を加えた時刻にメッセージを受信したとみなし、
+それぞれの方式で実際に発音処理が実行された時刻の、理想のグリッドからの誤差を計測する。
+
+使い方:
+    python -m benchmarks.bench_trigger_jitter [--pulses N] [--bpm BPM] [--network-jitter-ms MS] [--lookahead-ms MS] [--json]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+from src.common.scheduler import EventScheduler
+
+
+def _summarize(errors):
+    """誤差 (秒) のリストを統計値 (ms) にまとめる"""
+    mean = sum(errors) / len(errors)
+    jitter = (sum((e - mean) ** 2 for e in errors) / len(errors)) ** 0.5
+    deviations = sorted(abs(e - mean) for e in errors)
+    return {
+        "mean_latency_ms": mean * 1e3,
+        "jitter_ms": jitter * 1e3,
+        "p95_deviation_ms": deviations[int(len(deviations) * 0.95)] * 1e3,
+        "max_deviation_ms": deviations[-1] * 1e3,
+    }
+
+
+def _deliver(pulses: int, interval: float, network_jitter: float, on_message):
+    """理想時刻に遅延を加えた時刻に、タイムスタンプ付きのメッセージを順に渡す"""
+    rng = random.Random(0)
+    start = time.time() + 0.05
+    deliveries = sorted((start + i * interval + rng.uniform(0, network_jitter), start + i * interval) for i in range(pulses))
+    for delivery_time, timestamp in deliveries:
+        delay = delivery_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        on_message(timestamp)
+
+
+def measure_immediate(pulses: int, interval: float, network_jitter: float) -> dict:
+    """受信した時点で発音する場合（従来の方式）"""
+    errors = []
+    _deliver(pulses, interval, network_jitter, lambda timestamp: errors.append(time.time() - timestamp))
+    return _summarize(errors)
+
+
+def measure_scheduled(pulses: int, interval: float, network_jitter: float, lookahead: float) -> dict:
+    """タイムスタンプ + lookahead の時刻に予約して発音する場合"""
+    errors = []
+    done = threading.Event()
+    scheduler = EventScheduler()
+
+    def on_message(timestamp):
+        def trigger():
+            errors.append(time.time() - timestamp)
+            if len(errors) == pulses:
+                done.set()
+
+        scheduler.schedule_at(timestamp + lookahead, trigger)
+
+    try:
+        _deliver(pulses, interval, network_jitter, on_message)
+        done.wait(lookahead + 1.0)
+        result = _summarize(errors)
+        result["late"] = scheduler.stats().late
+    finally:
+        scheduler.close()
+    return result
+
+
+def run(pulses: int = 480, bpm: float = 240, network_jitter_ms: float = 8.0, lookahead_ms: float = 20.0) -> dict:
+    """両方の方式を計測する"""
+    interval = 60.0 / bpm / 24
+    network_jitter = network_jitter_ms / 1e3
+    return {
+        "params": {"pulses": pulses, "bpm": bpm, "network_jitter_ms": network_jitter_ms, "lookahead_ms": lookahead_ms},
+        "immediate": measure_immediate(pulses, interval, network_jitter),
+        "scheduled": measure_scheduled(pulses, interval, network_jitter, lookahead_ms / 1e3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pulses", type=int, default=480, help="計測するクロック数")
+    parser.add_argument("--bpm", type=float, default=240)
+    parser.add_argument("--network-jitter-ms", type=float, default=8.0, help="受信遅延の揺らぎの幅 (ms)")
+    parser.add_argument("--lookahead-ms", type=float, default=20.0, help="先読み時間 (ms)")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = run(args.pulses, args.bpm, args.network_jitter_ms, args.lookahead_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<12}{'latency ms':>12}{'jitter ms':>12}{'p95 dev ms':>12}{'max dev ms':>12}")
+    for mode in ("immediate", "scheduled"):
+        r = results[mode]
+        print(
+            f"{mode:<12}{r['mean_latency_ms']:>12.2f}{r['jitter_ms']:>12.3f}"
+            f"{r['p95_deviation_ms']:>12.3f}{r['max_deviation_ms']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""MidiMessageのワイヤーフォーマット（JSON / バイナリ）のベンチマーク
+
+使い方:
+    python -m benchmarks.bench_wire_format [--count N] [--json]
+"""
+
+import argparse
+import json
+import time
+
+from src.common.midi_utils import (
+    MidiMessage,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_JSON,
+    decode_message,
+    encode_message,
+)
+
+SAMPLE_MESSAGES = {
+    "clock": MidiMessage(type="clock"),
+    "note_on": MidiMessage(type="note_on", note=60, velocity=127, channel=1),
+    "control_change": MidiMessage(type="control_change", control=7, value=100, channel=1),
+}
+
+
+def bench_format(msg: MidiMessage, wire_format: str, count: int) -> dict:
+    """1種類のメッセージについてエンコード/デコードの速度とサイズを計測する"""
+    source = "rhythmgenerator"
+
+    start = time.perf_counter()
+    for _ in range(count):
+        data = encode_message(msg, source, wire_format)
+    encode_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        decode_message(data)
+    decode_sec = time.perf_counter() - start
+
+    return {
+        "bytes": len(data),
+        "encode_per_sec": count / encode_sec,
+        "decode_per_sec": count / decode_sec,
+        "encode_us": encode_sec / count * 1e6,
+        "decode_us": decode_sec / count * 1e6,
+    }
+
+
+def run(count: int = 100_000) -> dict:
+    """すべてのサンプルメッセージ・形式の組み合わせを計測する"""
+    results = {}
+    for name, msg in SAMPLE_MESSAGES.items():
+        results[name] = {fmt: bench_format(msg, fmt, count) for fmt in (WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000, help="1計測あたりの繰り返し回数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = run(args.count)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'message':<16}{'format':<8}{'bytes':>6}{'encode us':>12}{'decode us':>12}")
+    for name, formats in results.items():
+        for fmt, r in formats.items():
+            print(f"{name:<16}{fmt:<8}{r['bytes']:>6}{r['encode_us']:>12.2f}{r['decode_us']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
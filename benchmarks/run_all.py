@@ -0,0 +1,115 @@
+"""すべてのベンチマークを実行し、結果をJSONで保存・比較する
+
+結果は `{"meta": 実行環境, "results": {ベンチマーク名: 結果}}` のJSON。
+`--compare` に以前の結果を指定すると、処理時間（*_us, *_ms, *_ns, ns_per_*）が閾値を超えて増えた項目と、
+処理速度（*_per_sec）が閾値を超えて減った項目を回帰として表示し、終了コード1で終了する。
+
+使い方:
+    python -m benchmarks.run_all [--quick] [--output results.json] [--compare baseline.json] [--threshold 1.25]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks import bench_midi_loopback, bench_node_hot_paths, bench_trigger_jitter, bench_wire_format
+
+# (名前, 通常の引数, --quickの引数)
+BENCHMARKS = [
+    ("wire_format", bench_wire_format.run, {"count": 100_000}, {"count": 10_000}),
+    ("midi_loopback", bench_midi_loopback.run, {"count": 20_000, "pings": 1_000}, {"count": 2_000, "pings": 200}),
+    ("node_hot_paths", bench_node_hot_paths.run, {"count": 50_000, "frames": 30}, {"count": 5_000, "frames": 5}),
+    ("trigger_jitter", bench_trigger_jitter.run, {"pulses": 480}, {"pulses": 96}),
+]
+
+
+def run(quick: bool = False, only: List[str] = None) -> dict:
+    """ベンチマークを実行し、実行環境とともに結果を返す"""
+    results = {}
+    for name, func, params, quick_params in BENCHMARKS:
+        if only and name not in only:
+            continue
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = func(**(quick_params if quick else params))
+    return {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """入れ子の結果を "a.b.c" をキーとする数値の辞書にする"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def _direction(path: str) -> int:
+    """値が小さいほど良い項目は1、大きいほど良い項目は-1、比較しない項目は0"""
+    name = path.rsplit(".", 1)[-1]
+    if name.endswith("_per_sec"):
+        return -1
+    if name.endswith(("_us", "_ms", "_ns")) or name.startswith("ns_per_"):
+        return 1
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[Tuple[str, float, float]]:
+    """baselineよりthreshold倍以上悪化した項目を (キー, 以前の値, 今回の値) のリストで返す"""
+    before = flatten(baseline["results"])
+    after = flatten(current["results"])
+    regressions = []
+    for path, old in before.items():
+        new = after.get(path)
+        direction = _direction(path)
+        if new is None or direction == 0 or old <= 0 or new <= 0:
+            continue
+        ratio = new / old if direction > 0 else old / new
+        if ratio >= threshold:
+            regressions.append((path, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="繰り返し回数を減らして短時間で実行")
+    parser.add_argument("--only", nargs="*", help="実行するベンチマーク名")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", help="比較する以前の結果のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=1.25, help="回帰とみなす悪化の倍率")
+    args = parser.parse_args()
+
+    current = run(args.quick, args.only)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for path, old, new in regressions:
+            print(f"REGRESSION {path}: {old:.4g} -> {new:.4g}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,102 @@
-import pyxel
-from src.common.midi_utils import MidiMessage, MidiNode, MIDI_CLOCK, MIDI_START, MIDI_STOP
+import os
+import threading
+import time
+from dataclasses import asdict, replace
+
+from src.common.event_queue import EventInbox
+from src.common.metrics import NodeMetrics, StatsExporter
+from src.common.midi_utils import (
+    ClockSync,
+    MidiMessage,
+    MidiNode,
+    Subscription,
+    MIDI_CLOCK,
+    MIDI_PING,
+    MIDI_PONG,
+    MIDI_START,
+    MIDI_STOP,
+)
+from src.common.pyxel_backend import pyxel
+from src.common.scheduler import EventScheduler
 
 
 class Node:
     """PyxelPatchのすべてのノードが継承する基底クラス。"""
 
-    def __init__(self, name, window_size=(160, 120), in_channels=None):
+    def __init__(
+        self,
+        name,
+        window_size=(160, 120),
+        in_channels=None,
+        inbox=False,
+        inbox_capacity=1024,
+        headless=False,
+        fps=30,
+        wire_format=None,
+        bus=None,
+        subscribe_types=None,
+        transport=None,
+        lookahead=None,
+        clock_sync=False,
+        clock_master=False,
+        ping_interval=1.0,
+        metrics=False,
+        metrics_overlay=False,
+        metrics_export=None,
+        metrics_interval=1.0,
+        idle_fps=None,
+        idle_after=1.0,
+        reliable=False,
+        receive_engine=None,
+    ):
+        """ノードの初期化
+
+        Args:
+            name: ノード名
+            window_size: Pyxelウィンドウのサイズ
+            in_channels: 受信するMIDIチャンネル一覧。チャンネルを持つメッセージのうち、これ以外は受信しない
+            inbox: Trueの場合、受信したメッセージを受信キューに溜め、フレームループでまとめて処理する。
+                on_midi()がフレームループのスレッドからのみ呼ばれるようになる
+            inbox_capacity: 受信キューの最大長
+            headless: Trueの場合、ウィンドウを開かずに動作する。描画と音声は何もせず、
+                run()はupdate()を一定間隔で呼ぶループになる。プロセス内のすべてのノードに影響する
+            fps: ヘッドレスモードでupdate()を呼ぶ頻度
+            wire_format: 送信時のシリアライズ形式 (WIRE_FORMAT_JSON / WIRE_FORMAT_BINARY)
+            bus: 同一プロセス内のノードと共有するLocalBus
+            subscribe_types: 受信するメッセージタイプ一覧。Noneの場合はすべて受信する
+            transport: 送受信に使う転送方式 (BroadcastTransport / MulticastTransport)
+            lookahead: 発音の先読み時間（秒）。指定した場合、タイムスタンプ付きのメッセージによる発音を
+                「タイムスタンプ + lookahead」の時刻に予約し、ネットワークやスレッドの揺らぎを吸収する
+            clock_sync: Trueの場合、マスタークロックとの時刻オフセット・往復時間・テンポを推定する。
+                欠落したクロックを補い、クロックが途絶えた間は推定したテンポで自走する
+            clock_master: Trueの場合、マスタークロックとしてフォロワーの時刻同期の問い合わせに応答する
+            ping_interval: clock_sync時に時刻同期の問い合わせを送る間隔（秒）
+            metrics: Trueの場合、フレーム時間・受信処理時間・受信頻度・クロックの受信ジッタを計測する
+            metrics_overlay: Trueの場合、計測結果を画面に重ねて表示する（F1キーで切り替え）。metricsを有効にする
+            metrics_export: 計測結果の書き出し先。"udp://host:port" またはJSONLファイルのパス。metricsを有効にする
+            metrics_interval: 計測結果を書き出す間隔（秒）
+            idle_fps: 指定した場合、再生していない・無効な状態が続く間はupdate()/draw()をこの頻度に下げ、
+                フレームの間は眠る。MIDIを受信するとすぐに通常の頻度に戻る
+            idle_after: 最後にMIDIを受信してから、フレームレートを下げるまでの時間（秒）
+            reliable: Trueの場合、送信するメッセージに連番を付け、start/stopなどのトランスポートのメッセージを
+                後続のデータグラム（送信がなければ次のフレーム）で繰り返し送る。受信側は重複を捨て、欠落を数える
+            receive_engine: 受信に使うReceiveEngine。指定した場合は専用の受信スレッドを持たず、
+                エンジンのスレッドで他のノードのソケットとまとめて受信する（busを指定した場合はバスの設定に従う）
+        """
         self.name = name
         self.enabled = True
         # ノードが受信するMIDIチャンネル一覧 (None or [] は全チャンネル受信の例)
         self.in_channels = in_channels if in_channels else []
-        # このノードが発生させるMIDIイベントの一時キュー
+        # このノードが発生させるMIDIイベントの一時キュー（flush_output()でまとめて送信）
         self.output_events = []
+        self._output_lock = threading.Lock()
 
-        # Pyxelの初期化
+        # Pyxelの初期化（ヘッドレスモードではウィンドウを開かない）
+        self.headless = headless
+        self.fps = fps
+        self._quit_requested = False
+        if headless:
+            pyxel.use_headless()
         self.window_width, self.window_height = window_size
         pyxel.init(self.window_width, self.window_height, title=f"PyxelPatch - {name}")
 
@@ -22,8 +105,53 @@ class Node:
         self.ppq_count = 0  # Pulses Per Quarter note カウンタ
         self.running = False
 
+        # 受信キュー（inboxモードのみ）
+        # LocalBus経由ではローカル配信とUDP受信の2つのスレッドから書き込まれる
+        self.inbox = EventInbox(inbox_capacity, multi_producer=bus is not None) if inbox else None
+
+        # 発音の予約（lookahead指定時のみ）
+        self.lookahead = lookahead
+        self.scheduler = EventScheduler() if lookahead is not None else None
+
+        # マスタークロックとの時刻同期（clock_sync / clock_master指定時のみ）
+        self.clock_sync = None
+        if clock_master:
+            self.clock_sync = ClockSync(master=True)
+        elif clock_sync:
+            self.clock_sync = ClockSync(ping_interval=ping_interval)
+
         # MIDIノードの初期化
-        self.midi_node = MidiNode(name.lower(), self.on_midi)
+        self._deliver = self.inbox.push if self.inbox is not None else self.on_midi
+        callback = self._receive if self.clock_sync is not None else self._deliver
+        subscription = None
+        if subscribe_types or self.in_channels:
+            if subscribe_types and self.clock_sync is not None:
+                subscribe_types = list(subscribe_types) + [MIDI_PING if clock_master else MIDI_PONG]
+            subscription = Subscription(types=subscribe_types, channels=self.in_channels)
+        # アイドル時のフレームレート（idle_fps指定時のみ）。受信スレッドから眠っているフレームループを起こす
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        self.idle = False
+        self._wake = threading.Event()
+        self._last_activity = time.perf_counter()
+        self._next_idle_frame = 0.0
+        self._frame_skipped = False
+        if idle_fps is not None:
+            self._receive_callback = callback
+            callback = self._receive_and_wake
+        self.midi_node = MidiNode(
+            name.lower(), callback, wire_format, bus, subscription, transport, reliable=reliable, receive_engine=receive_engine
+        )
+
+        # 計測（metrics / metrics_overlay / metrics_export指定時のみ）
+        self.metrics = None
+        self.metrics_overlay = metrics_overlay
+        self.stats_exporter = None
+        if metrics or metrics_overlay or metrics_export:
+            self.metrics = NodeMetrics()
+            self.midi_node.metrics = self.metrics
+        if metrics_export:
+            self.stats_exporter = StatsExporter(metrics_export, metrics_interval)
 
     def set_enabled(self, state: bool):
         """ノードの有効/無効を設定"""
@@ -33,6 +161,95 @@ class Node:
         """ノードの有効/無効を切り替え"""
         self.enabled = not self.enabled
 
+    def _receive(self, msg: MidiMessage):
+        """時刻同期を行う場合の受信処理。受信スレッドから呼ばれる。
+
+        時刻同期のメッセージは受信時刻の精度を保つため受信スレッドで即座に処理し、on_midi()には渡さない。
+        クロックは欠落していたパルスを補い、自走で先に進めていた分は差し引いてから渡す。
+        """
+        sync = self.clock_sync
+        if msg.type == MIDI_PING:
+            reply = sync.on_ping(msg, time.time())
+            if reply is not None:
+                self.midi_node.send_message(reply)
+            return
+        if msg.type == MIDI_PONG:
+            sync.on_pong(msg, time.time())
+            return
+
+        if msg.type == MIDI_CLOCK:
+            pulses = sync.on_clock(msg, time.time())
+            # 補ったパルスはクロック間隔ずつ遡ったタイムスタンプを付け、古いものから渡す
+            for back in range(pulses - 1, 0, -1):
+                self._deliver(replace(msg, timestamp=msg.timestamp - back * sync.interval))
+            if pulses:
+                self._deliver(msg)
+            return
+        if msg.type in (MIDI_START, MIDI_STOP):
+            sync.reset_clock()
+        self._deliver(msg)
+
+    def _update_clock_sync(self):
+        """時刻同期の問い合わせを送り、クロックが途絶えていれば自走でパルスを進める"""
+        now = time.time()
+        ping = self.clock_sync.poll(now)
+        if ping is not None:
+            self.midi_node.send_message(ping)
+
+        if self.running:
+            for _ in range(self.clock_sync.flywheel(now)):
+                self.on_midi(MidiMessage(type=MIDI_CLOCK))
+
+    def _receive_and_wake(self, msg: MidiMessage):
+        """idle_fps指定時の受信処理。受信スレッドから呼ばれ、眠っているフレームループを起こす"""
+        self._receive_callback(msg)
+        self._last_activity = time.perf_counter()
+        self._wake.set()
+
+    def is_idle(self) -> bool:
+        """フレームレートを下げてよい状態かどうか。サブクラスでアニメーション中などの条件を追加できる"""
+        return not (self.running and self.enabled)
+
+    def is_ready(self) -> bool:
+        """パッチに加わる準備ができたか。クロックを受信したか、クロック源として再生を始めていれば準備完了。
+
+        クロックを購読しないノードはクロックを待たない。サブクラスで読み込み中などの条件を追加できる
+        """
+        subscription = self.midi_node.subscription
+        if subscription is not None and subscription.types is not None and MIDI_CLOCK not in subscription.types:
+            return True
+        return self.synced or self.running
+
+    def _skip_idle_frame(self) -> bool:
+        """アイドル状態を判定し、アイドル中は idle_fps の間隔になるまでフレームを飛ばす"""
+        # 判定より後に受信したメッセージで必ず起きるよう、先にクリアする
+        self._wake.clear()
+        now = time.perf_counter()
+        self.idle = now - self._last_activity >= self.idle_after and self.is_idle()
+        if not self.idle:
+            self._next_idle_frame = 0.0
+            return False
+        if now < self._next_idle_frame:
+            return True
+        self._next_idle_frame = now + 1.0 / self.idle_fps
+        return False
+
+    def _idle_wait(self):
+        """アイドル中は次のアイドルフレームまで眠る。MIDIを受信したらすぐに戻る"""
+        delay = self._next_idle_frame - time.perf_counter()
+        if delay > 0:
+            self._wake.wait(delay)
+
+    def sequence_stats(self):
+        """他のノードから受信したメッセージの、送信元ごとの連番の追跡結果（SequenceStats）を返す"""
+        return self.midi_node.sequence_stats()
+
+    def sync_stats(self):
+        """マスタークロックとの同期状態（SyncStats）を返す。時刻同期を行わない場合はNone。"""
+        if self.clock_sync is None:
+            return None
+        return self.clock_sync.stats()
+
     def on_midi(self, msg: MidiMessage):
         """外部または他ノードから来るMIDIイベントを処理。サブクラスでオーバーライド。"""
         if not self.enabled:
@@ -49,11 +266,135 @@ class Node:
         elif msg.type == MIDI_STOP:
             self.running = False
             self.ppq_count = 0
+            # 予約済みの発音を取り消す
+            if self.scheduler is not None:
+                self.scheduler.clear()
+
+    def schedule_trigger(self, msg: MidiMessage, trigger):
+        """メッセージに対応する発音を実行する
+
+        lookaheadが指定されていてメッセージにタイムスタンプがある場合は、
+        「タイムスタンプ + lookahead」の時刻に予約する（予約した処理はスケジューラのスレッドで実行される）。
+        時刻同期を行っている場合、タイムスタンプはマスターとの時刻オフセットで自分の時計に換算する。
+        それ以外の場合はすぐに実行する。
+
+        Args:
+            msg: 発音のきっかけになったメッセージ
+            trigger: 発音処理
+        """
+        if self.scheduler is not None and msg.timestamp is not None:
+            timestamp = msg.timestamp
+            if self.clock_sync is not None:
+                timestamp = self.clock_sync.to_local_time(timestamp)
+            self.scheduler.schedule_at(timestamp + self.lookahead, trigger)
+        else:
+            trigger()
+
+    def emit(self, msg: MidiMessage):
+        """送信するMIDIイベントを一時キューに追加する。送信はflush_output()でまとめて行う。"""
+        with self._output_lock:
+            self.output_events.append(msg)
+
+    def flush_output(self) -> int:
+        """一時キューのMIDIイベントを1つのデータグラムにまとめて送信する"""
+        with self._output_lock:
+            if not self.output_events:
+                return 0
+            events = self.output_events
+            self.output_events = []
+        self.midi_node.send_batch(events)
+        return len(events)
+
+    def process_inbox(self) -> int:
+        """受信キューに溜まったメッセージをまとめてon_midi()で処理する"""
+        if self.inbox is None:
+            return 0
+        return self.inbox.drain(self.on_midi)
 
     def update(self):
         """Pyxelのupdate()内で毎フレーム呼ばれる。各ノード固有のロジックを処理。"""
         pass
 
+    def _frame_update(self):
+        """1フレーム分の更新処理。受信キューを処理してからupdate()を呼び、発生したイベントを送信する。"""
+        if self.idle_fps is not None:
+            # Pyxelは眠っていた間の遅れを取り戻すためupdate()を続けて呼ぶため、その間のフレームは飛ばす
+            self._frame_skipped = self._skip_idle_frame()
+            if self._frame_skipped:
+                return
+        metrics = self.metrics
+        if metrics is None:
+            self._update_frame()
+            return
+
+        start = time.perf_counter_ns()
+        metrics.on_frame(start)
+        self._update_frame()
+        metrics.update.add_ns(time.perf_counter_ns() - start)
+
+        if pyxel.btnp(pyxel.KEY_F1):
+            self.metrics_overlay = not self.metrics_overlay
+        if self.stats_exporter is not None:
+            self.stats_exporter.maybe_export(self.stats_snapshot())
+
+    def _update_frame(self):
+        """計測対象の更新処理本体"""
+        self.process_inbox()
+        if self.clock_sync is not None:
+            self._update_clock_sync()
+        self.update()
+        self.flush_output()
+        self.midi_node.resend_pending()
+
+    def _frame_draw(self):
+        """1フレーム分の描画処理。計測中はdraw()の時間を記録し、計測結果を重ねて表示する。
+
+        アイドル中は描画の後で次のアイドルフレームまで眠り、Pyxelのループ全体の頻度を下げる。
+        """
+        if not self._frame_skipped:
+            self._draw_frame()
+        if self.idle:
+            self._idle_wait()
+
+    def _draw_frame(self):
+        """計測対象の描画処理本体"""
+        metrics = self.metrics
+        if metrics is None:
+            self.draw()
+            return
+
+        start = time.perf_counter_ns()
+        self.draw()
+        metrics.draw.add_ns(time.perf_counter_ns() - start)
+        if self.metrics_overlay:
+            self.draw_metrics_overlay()
+
+    def draw_metrics_overlay(self):
+        """計測結果を画面下部に重ねて表示する"""
+        lines = self.metrics.overlay_lines()
+        top = self.window_height - len(lines) * 7 - 1
+        pyxel.rect(0, top, self.window_width, self.window_height - top, 0)
+        for i, line in enumerate(lines):
+            pyxel.text(2, top + 1 + i * 7, line, 11)
+
+    def stats_snapshot(self) -> dict:
+        """計測結果をノード名・再生状態・受信キュー・時刻同期の状態とともに辞書で返す（計測していない場合は計測値を除く）"""
+        record = {"node": self.name, "pid": os.getpid(), "ready": self.is_ready(), "running": self.running}
+        if self.metrics is not None:
+            record.update(self.metrics.snapshot())
+        record["filtered"] = self.midi_node.filtered
+        if self.inbox is not None:
+            record["inbox"] = asdict(self.inbox.stats())
+        if self.clock_sync is not None:
+            record["sync"] = asdict(self.clock_sync.stats())
+        receive = self.midi_node.receive_stats()
+        if receive is not None:
+            record["receive"] = asdict(receive)
+        sequences = self.sequence_stats()
+        if sequences:
+            record["sequences"] = {source: asdict(stats) for source, stats in sequences.items()}
+        return record
+
     def draw(self):
         """Pyxelのdraw()内で毎フレーム呼ばれる。各ノード固有の描画処理。"""
         pyxel.cls(0)
@@ -63,7 +404,8 @@ class Node:
 
         # 状態表示
         status = []
-        if not self.synced:
+        # クロックを購読しないノードはクロックを待たない（is_ready()）
+        if not self.is_ready():
             status.append("WAITING FOR SYNC")
         elif not self.running:
             status.append("STOPPED")
@@ -78,10 +420,66 @@ class Node:
         # PPQカウント表示（デバッグ用）
         pyxel.text(5, 15, f"PPQ: {self.ppq_count}", 7)
 
+    def quit(self):
+        """run()のループを終了する"""
+        self._quit_requested = True
+        if not self.headless:
+            pyxel.quit()
+
+    def _run_headless(self):
+        """ヘッドレスモードの実行ループ
+
+        update()はfpsで指定した一定間隔で呼ぶ。inboxモードでは次のフレームまでの待ち時間に
+        受信したメッセージをすぐに処理するため、MIDIの処理はフレーム間隔を待たない。
+        idle_fps指定時のアイドル中は次のアイドルフレームまで眠り、MIDIを受信したらすぐに次のフレームに進む。
+        """
+        interval = 1.0 / self.fps
+        next_frame = time.perf_counter()
+        while not self._quit_requested:
+            self._frame_update()
+            pyxel.frame_count += 1
+
+            next_frame += interval
+            idle = self.idle
+            if idle:
+                next_frame = max(next_frame, self._next_idle_frame)
+            while not self._quit_requested:
+                delay = next_frame - time.perf_counter()
+                if delay <= 0:
+                    break
+                if self.inbox is not None:
+                    woke = self.inbox.wait(delay)
+                    if woke:
+                        self.process_inbox()
+                        self.flush_output()
+                elif idle:
+                    woke = self._wake.wait(delay)
+                else:
+                    time.sleep(delay)
+                    woke = False
+                if idle and woke:
+                    # アイドル中にMIDIを受信したら、すぐに通常の間隔のフレームに戻る
+                    next_frame = time.perf_counter()
+                    break
+
+            # 処理が間に合わなかった場合は遅れを持ち越さない
+            next_frame = max(next_frame, time.perf_counter() - interval)
+
+    def close(self):
+        """ノードが使っているリソースを解放する。サブクラスでオーバーライド。"""
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.stats_exporter is not None:
+            self.stats_exporter.close()
+        self.midi_node.close()
+
     def run(self):
         """アプリケーションの実行"""
         try:
-            pyxel.run(self.update, self.draw)
+            if self.headless:
+                self._run_headless()
+            else:
+                pyxel.run(self._frame_update, self._frame_draw)
         finally:
             # 終了時にMIDIノードをクローズ
-            self.midi_node.close()
+            self.close()
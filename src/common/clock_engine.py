@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass
+class ClockStats:
+    """クロックエンジンの計測結果"""
+
+    pulses: int  # 送出したパルス数
+    late_pulses: int  # 1パルス以上遅れて送出したパルス数
+    jitter_ms: float  # 直近ウィンドウの送出誤差の標準偏差 (ms)
+    max_jitter_ms: float  # 直近ウィンドウの送出誤差の最大値 (ms)
+    last_error_ms: float  # 直近パルスの理想時刻からのずれ (ms)。締め切りはアンカーからの絶対時刻のため累積しない
+
+
+class ClockEngine:
+    """24PPQのMIDIクロックを専用スレッドで生成するエンジン。
+
+    描画フレームとは独立したスレッドで `time.perf_counter_ns` を基準に次のパルスの締め切り時刻を計算し、
+    各パルスをその時刻に送出する。締め切りは開始時刻（アンカー）からの絶対時刻で求めるため、
+    送出の遅れが次のパルスに累積しない（ドリフト補正）。
+    """
+
+    PPQ = 24  # 1拍あたりのパルス数
+
+    def __init__(
+        self,
+        bpm: float,
+        on_pulse: Callable[[int, int], None],
+        spin_ns: int = 1_000_000,
+        stats_window: int = 96,
+    ):
+        """クロックエンジンの初期化
+
+        Args:
+            bpm: 初期テンポ
+            on_pulse: パルスごとに呼ばれるコールバック。引数はパルス番号と理想送出時刻 (perf_counter_ns)
+            spin_ns: 締め切り直前にsleepをやめてスピン待ちに切り替える時間 (ns)
+            stats_window: ジッタ計算に使う直近パルス数
+        """
+        self.on_pulse = on_pulse
+        self.spin_ns = spin_ns
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._interval_ns = self._calculate_interval_ns(bpm)
+        self._anchor_ns = 0
+        self._wall_offset_ns = 0  # UNIX時間とperf_counterの差
+        self._pulse_index = 0  # アンカーからのパルス数
+        self._pulses = 0
+        self._late_pulses = 0
+        self._errors_ns = deque(maxlen=stats_window)
+        self._last_error_ns = 0
+
+        self.running = False
+        self._closed = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @classmethod
+    def _calculate_interval_ns(cls, bpm: float) -> int:
+        """BPMからパルス間隔 (ns) を計算"""
+        return int(60_000_000_000 / (bpm * cls.PPQ))
+
+    @property
+    def interval(self) -> float:
+        """現在のパルス間隔（秒）"""
+        return self._interval_ns / 1e9
+
+    def set_bpm(self, bpm: float):
+        """テンポを変更する。次のパルスの締め切りを起点に新しい間隔で再アンカーする。"""
+        with self._lock:
+            interval_ns = self._calculate_interval_ns(bpm)
+            if self.running:
+                last_deadline = self._anchor_ns + (self._pulse_index - 1) * self._interval_ns
+                self._anchor_ns = last_deadline + interval_ns
+                self._pulse_index = 0
+            self._interval_ns = interval_ns
+        self._wake.set()
+
+    def to_wall_time(self, perf_ns: int) -> float:
+        """perf_counter_nsの時刻をUNIX時間（秒）に換算する。メッセージのタイムスタンプに使う。"""
+        return (perf_ns + self._wall_offset_ns) / 1e9
+
+    def start(self) -> float:
+        """クロックの送出を開始する。最初のパルスは1間隔後に送出される。
+
+        Returns:
+            float: 開始時刻（UNIX時間）
+        """
+        with self._lock:
+            now = time.perf_counter_ns()
+            self._wall_offset_ns = time.time_ns() - now
+            self._anchor_ns = now + self._interval_ns
+            self._pulse_index = 0
+            self._pulses = 0
+            self._late_pulses = 0
+            self._errors_ns.clear()
+            self._last_error_ns = 0
+            self.running = True
+        self._wake.set()
+        return self.to_wall_time(now)
+
+    def stop(self):
+        """クロックの送出を停止する"""
+        with self._lock:
+            self.running = False
+        self._wake.set()
+
+    def close(self):
+        """スレッドを終了する"""
+        self._closed = True
+        self.stop()
+        self.thread.join(timeout=1.0)
+
+    def stats(self) -> ClockStats:
+        """直近の計測結果を返す"""
+        with self._lock:
+            errors = list(self._errors_ns)
+            pulses = self._pulses
+            late = self._late_pulses
+            last_error = self._last_error_ns
+        if errors:
+            mean = sum(errors) / len(errors)
+            jitter = (sum((e - mean) ** 2 for e in errors) / len(errors)) ** 0.5
+            max_jitter = max(abs(e) for e in errors)
+        else:
+            jitter = max_jitter = 0.0
+        return ClockStats(
+            pulses=pulses,
+            late_pulses=late,
+            jitter_ms=jitter / 1e6,
+            max_jitter_ms=max_jitter / 1e6,
+            last_error_ms=last_error / 1e6,
+        )
+
+    def _next_deadline(self) -> Optional[int]:
+        """次のパルスの締め切り時刻を返す。停止中はNone。"""
+        with self._lock:
+            if not self.running:
+                return None
+            return self._anchor_ns + self._pulse_index * self._interval_ns
+
+    def _run(self):
+        """クロック送出ループ"""
+        while not self._closed:
+            deadline = self._next_deadline()
+            if deadline is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            # 締め切り直前まではsleepし、残りはスピン待ちで精度を確保
+            remaining = deadline - time.perf_counter_ns()
+            if remaining > self.spin_ns:
+                if self._wake.wait((remaining - self.spin_ns) / 1e9):
+                    # BPM変更や停止で締め切りが変わった
+                    self._wake.clear()
+                    continue
+            while time.perf_counter_ns() < deadline:
+                time.sleep(0)  # GILを手放しつつ待つ
+
+            with self._lock:
+                # 待機中に停止・再アンカーされていたら送出しない
+                if not self.running or deadline != self._anchor_ns + self._pulse_index * self._interval_ns:
+                    continue
+                now = time.perf_counter_ns()
+                error = now - deadline
+                self._errors_ns.append(error)
+                self._last_error_ns = error
+                if error > self._interval_ns:
+                    self._late_pulses += 1
+                pulse = self._pulses
+                self._pulses += 1
+                self._pulse_index += 1
+
+            self.on_pulse(pulse, deadline)
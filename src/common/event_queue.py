@@ -0,0 +1,133 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from src.common.midi_utils import MidiMessage
+
+
+@dataclass
+class InboxStats:
+    """受信キューの計測結果"""
+
+    pending: int  # 未処理のメッセージ数
+    delivered: int  # 処理済みのメッセージ数
+    overflows: int  # キューが満杯で破棄したメッセージ数
+    last_latency_ms: float  # 直近メッセージの受信から処理までの時間 (ms)
+    mean_latency_ms: float  # 受信から処理までの平均時間 (ms)
+    max_latency_ms: float  # 受信から処理までの最大時間 (ms)
+
+
+class EventInbox:
+    """受信スレッドからフレームループへMIDIメッセージを受け渡す固定長のリングバッファ。
+
+    書き込みは1つの受信スレッド、読み出しはフレームループのスレッドのみが行う
+    （単一プロデューサ・単一コンシューマ）前提で、ロックを使わずに受け渡す。
+    書き込み側は要素を格納してから `_head` を進め、読み出し側は `_tail` のみを進めるため、
+    それぞれのインデックスは片方のスレッドからしか更新されない。
+    複数のスレッドから書き込む場合は `multi_producer=True` とし、書き込み側だけをロックで直列化する。
+    """
+
+    def __init__(self, capacity: int = 1024, multi_producer: bool = False):
+        """受信キューの初期化
+
+        Args:
+            capacity: 保持できる未処理メッセージの最大数
+            multi_producer: 複数のスレッドからpush()する場合はTrue
+        """
+        self.capacity = capacity
+        self._producer_lock = threading.Lock() if multi_producer else None
+        self._messages = [None] * capacity
+        self._timestamps = [0] * capacity
+        self._head = 0  # 次に書き込む位置（受信スレッドのみが更新）
+        self._tail = 0  # 次に読み出す位置（フレームループのみが更新）
+        self._ready = threading.Event()  # 待機中の読み出し側を起こすための通知
+
+        self.overflows = 0
+        self.delivered = 0
+        self._last_latency_ns = 0
+        self._total_latency_ns = 0
+        self._max_latency_ns = 0
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def push(self, msg: MidiMessage) -> bool:
+        """メッセージを受信時刻とともに追加する。満杯の場合は破棄してFalseを返す。"""
+        if self._producer_lock is not None:
+            with self._producer_lock:
+                return self._push(msg)
+        return self._push(msg)
+
+    def _push(self, msg: MidiMessage) -> bool:
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.overflows += 1
+            return False
+
+        index = head % self.capacity
+        self._messages[index] = msg
+        self._timestamps[index] = time.perf_counter_ns()
+        # 要素を書き込んでから公開する
+        self._head = head + 1
+        if not self._ready.is_set():
+            self._ready.set()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """メッセージが届くまで最大timeout秒待つ。未処理のメッセージがあればTrueを返す。"""
+        if self._head == self._tail:
+            self._ready.wait(timeout)
+        self._ready.clear()
+        return self._head != self._tail
+
+    def drain(self, handler: Callable[[MidiMessage], None], max_items: Optional[int] = None) -> int:
+        """溜まっているメッセージを受信順にまとめて処理する
+
+        Args:
+            handler: 各メッセージを処理する関数
+            max_items: 1回で処理する最大数。Noneの場合は呼び出し時点の全メッセージ
+
+        Returns:
+            int: 処理したメッセージ数
+        """
+        tail = self._tail
+        head = self._head
+        if max_items is not None:
+            head = min(head, tail + max_items)
+        if head == tail:
+            return 0
+
+        now = time.perf_counter_ns()
+        messages = self._messages
+        timestamps = self._timestamps
+        capacity = self.capacity
+        for position in range(tail, head):
+            index = position % capacity
+            msg = messages[index]
+            messages[index] = None
+
+            latency = now - timestamps[index]
+            self._total_latency_ns += latency
+            if latency > self._max_latency_ns:
+                self._max_latency_ns = latency
+            self._last_latency_ns = latency
+
+            # 処理中の例外で同じメッセージを再処理しないよう、先に読み出し位置を進める
+            self._tail = position + 1
+            self.delivered += 1
+            handler(msg)
+
+        return head - tail
+
+    def stats(self) -> InboxStats:
+        """計測結果を返す"""
+        delivered = self.delivered
+        return InboxStats(
+            pending=len(self),
+            delivered=delivered,
+            overflows=self.overflows,
+            last_latency_ms=self._last_latency_ns / 1e6,
+            mean_latency_ms=self._total_latency_ns / delivered / 1e6 if delivered else 0.0,
+            max_latency_ms=self._max_latency_ns / 1e6,
+        )
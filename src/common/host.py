@@ -0,0 +1,171 @@
+"""複数のノードを1つのプロセスで動かすホスト
+
+使い方:
+    python -m src.common.host src.nodes._0000_rhythm_gen:RhythmGeneratorNode src.nodes._0001_rhythm:RhythmNode
+"""
+
+import argparse
+import importlib
+import time
+from typing import Iterable, List, Optional, Tuple, Type, Union
+
+from src.common.base_node import Node
+from src.common.midi_utils import LocalBus, MulticastTransport, WIRE_FORMAT_JSON, WIRE_FORMATS
+from src.common.pyxel_backend import pyxel
+from src.common.receive_engine import ReceiveEngine
+
+NodeSpec = Union[Type[Node], Tuple[Type[Node], dict]]
+
+
+def load_node_class(path: str) -> Type[Node]:
+    """ "モジュール名:クラス名" 形式の文字列からノードクラスを読み込む"""
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError(f"Node class must be given as 'module:Class': {path}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class NodeHost:
+    """複数のノードを1つのプロセス・1つのイベントループで動かすホスト。
+
+    ノード間の通信は `LocalBus` によるプロセス内配信（シリアライズなし）で行い、
+    UDPは他プロセスのノードとの通信にのみ使う。Pyxelのウィンドウはプロセスに1つしか開けないため、
+    ホスト上のノードはすべてヘッドレスモード・inboxモードで動作する。
+    """
+
+    def __init__(
+        self,
+        node_specs: Iterable[NodeSpec],
+        fps: int = 30,
+        wire_format: Optional[str] = None,
+        remote: bool = True,
+        transport=None,
+        idle_fps: Optional[float] = None,
+        reliable: bool = False,
+        receive_engine: bool = False,
+    ):
+        """ホストの初期化
+
+        Args:
+            node_specs: ノードクラス、または (ノードクラス, 追加のキーワード引数) のリスト
+            fps: update()を呼ぶ頻度
+            wire_format: 他プロセスへ送信する際のシリアライズ形式
+            remote: Falseの場合、UDPを使わずプロセス内だけで通信する
+            transport: 他プロセスとの送受信に使う転送方式
+            idle_fps: 指定した場合、各ノードのアイドル時のフレームレート（ノードごとの指定が優先）。
+                すべてのノードがアイドルの間はループ全体が眠る
+            reliable: Trueの場合、各ノードが送信するメッセージに連番を付け、トランスポートのメッセージを繰り返し送る
+            receive_engine: Trueの場合、他プロセスからの受信にReceiveEngine（ノンブロッキングでまとめて読み出す）を使う
+        """
+        self.fps = fps
+        self.receive_engine = ReceiveEngine() if receive_engine and remote else None
+        self.bus = LocalBus(wire_format, remote, transport, self.receive_engine)
+        if self.receive_engine is not None:
+            self.receive_engine.start()
+        self._quit_requested = False
+
+        self.nodes: List[Node] = []
+        for spec in node_specs:
+            node_class, kwargs = spec if isinstance(spec, tuple) else (spec, {})
+            if idle_fps is not None:
+                kwargs = {"idle_fps": idle_fps, **kwargs}
+            if reliable:
+                kwargs = {"reliable": True, **kwargs}
+            node = node_class(headless=True, inbox=True, fps=fps, wire_format=wire_format, bus=self.bus, **kwargs)
+            self.nodes.append(node)
+
+    def process_messages(self) -> int:
+        """すべてのノードの受信キューを処理する"""
+        count = 0
+        for node in self.nodes:
+            count += node.process_inbox()
+            node.flush_output()
+        return count
+
+    def step(self):
+        """すべてのノードを1フレーム分更新する"""
+        for node in self.nodes:
+            node._frame_update()
+        pyxel.frame_count += 1
+
+    def quit(self):
+        """run()のループを終了する"""
+        self._quit_requested = True
+        self.bus.activity.set()
+
+    def close(self):
+        """すべてのノードとバスを終了する"""
+        for node in self.nodes:
+            node.close()
+        self.bus.close()
+        if self.receive_engine is not None:
+            self.receive_engine.close()
+
+    def run(self):
+        """すべてのノードを同じループで実行する
+
+        update()はfpsで指定した一定間隔で呼び、フレーム間に届いたメッセージはすぐに処理する。
+        すべてのノードがアイドルの間は次のアイドルフレームまで眠り、メッセージが届いたらすぐに通常の間隔に戻る。
+        """
+        interval = 1.0 / self.fps
+        next_frame = time.perf_counter()
+        try:
+            while not self._quit_requested:
+                self.step()
+
+                next_frame += interval
+                idle = bool(self.nodes) and all(node.idle for node in self.nodes)
+                if idle:
+                    next_frame = max(next_frame, min(node._next_idle_frame for node in self.nodes))
+                while not self._quit_requested:
+                    delay = next_frame - time.perf_counter()
+                    if delay <= 0:
+                        break
+                    if self.bus.activity.wait(delay):
+                        self.bus.activity.clear()
+                        self.process_messages()
+                        if idle:
+                            next_frame = time.perf_counter()
+                            break
+
+                # 処理が間に合わなかった場合は遅れを持ち越さない
+                next_frame = max(next_frame, time.perf_counter() - interval)
+        finally:
+            self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数のノードを1つのプロセスで実行する")
+    parser.add_argument("nodes", nargs="+", help="実行するノードクラス (例: src.nodes._0001_rhythm:RhythmNode)")
+    parser.add_argument("--fps", type=int, default=30, help="update()を呼ぶ頻度")
+    parser.add_argument("--wire-format", choices=WIRE_FORMATS, default=WIRE_FORMAT_JSON)
+    parser.add_argument("--local-only", action="store_true", help="UDPを使わずプロセス内だけで通信する")
+    parser.add_argument("--session", help="セッションID。指定した場合はセッションごとのマルチキャストグループで通信する")
+    parser.add_argument("--loopback-only", action="store_true", help="マルチキャストのパケットを同一マシン内に限定する")
+    parser.add_argument("--idle-fps", type=float, help="再生していない間のフレームレート（既定は下げない）")
+    parser.add_argument("--reliable", action="store_true", help="連番を付け、start/stopなどを繰り返し送る")
+    parser.add_argument("--receive-engine", action="store_true", help="ノンブロッキングの受信エンジンでまとめて受信する")
+    args = parser.parse_args()
+
+    transport = None
+    if args.session is not None:
+        transport = MulticastTransport.for_session(args.session, loopback_only=args.loopback_only)
+
+    host = NodeHost(
+        [load_node_class(path) for path in args.nodes],
+        fps=args.fps,
+        wire_format=args.wire_format,
+        remote=not args.local_only,
+        transport=transport,
+        idle_fps=args.idle_fps,
+        reliable=args.reliable,
+        receive_engine=args.receive_engine,
+    )
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""パッチファイルに書いたノードをまとめて起動し、監視するランチャー
+
+使い方:
+    python -m src.common.launcher patches/basic.json
+"""
+
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.common.midi_utils import MulticastTransport, WIRE_FORMAT_JSON, WIRE_FORMATS
+
+# パッチファイルの "bus" に書ける設定
+BUS_KEYS = ("session", "loopback_only", "wire_format", "reliable", "receive_engine")
+
+# 子プロセスが src パッケージを読み込めるよう PYTHONPATH に加えるリポジトリのルート
+_ROOT = Path(__file__).resolve().parents[2]
+
+
+@dataclass
+class NodeEntry:
+    """パッチファイルに書いたノード1つ分の設定"""
+
+    name: str  # パッチ内で一意な名前（ログと監視に使う）
+    node_class: str  # "モジュール名:クラス名"
+    params: Dict[str, object] = field(default_factory=dict)  # ノードクラスに渡すキーワード引数
+    bus: Dict[str, object] = field(default_factory=dict)  # パッチ全体の "bus" にこのノードの "bus" を重ねた設定
+    restart: bool = True  # Falseの場合、落ちても再起動しない
+    health_timeout: float = 5.0  # 応答なしとみなすまでの時間（idle_fps指定時はアイドル中の状態の間隔に合わせて延ばした値）
+
+
+@dataclass
+class SupervisorSettings:
+    """ノードの起動・監視の設定（時間はすべて秒）"""
+
+    heartbeat: float = 1.0  # ノードが状態を送る間隔
+    start_timeout: float = 15.0  # 起動してから最初の状態が届くまで待つ時間
+    health_timeout: float = 5.0  # 状態が途絶えてから応答なしとみなすまでの時間
+    restart_delay: float = 0.5  # 最初の再起動までの待ち時間。続けて落ちるたびに2倍にする
+    max_restart_delay: float = 30.0  # 再起動までの待ち時間の上限
+    stable_after: float = 10.0  # この時間動き続けたら、再起動までの待ち時間を最初の値に戻す
+
+
+@dataclass
+class Patch:
+    """パッチファイルの内容（起動するノードの一覧とバス・監視の設定）"""
+
+    nodes: List[NodeEntry]
+    bus: Dict[str, object] = field(default_factory=dict)
+    supervisor: SupervisorSettings = field(default_factory=SupervisorSettings)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Patch":
+        """パッチファイルのJSONを読み込んだ辞書からパッチを作る
+
+        ノードは状態をフレームループで送るため、`idle_fps` を指定したノードはアイドル中に状態の間隔が
+        `1 / idle_fps` 秒まで延びる。そのようなノードの応答なしとみなすまでの時間は
+        `heartbeat + 2 / idle_fps` 秒以上に延ばす（アイドル中のノードを落ちたとみなして再起動し続けないように）。
+
+        Raises:
+            ValueError: ノード名の重複・クラスの書式・未知の設定など、パッチの内容が不正な場合
+        """
+        bus = _check_bus(data.get("bus", {}), "bus")
+        settings = data.get("supervisor", {})
+        known = {f.name for f in fields(SupervisorSettings)}
+        unknown = set(settings) - known
+        if unknown:
+            raise ValueError(f"unknown supervisor settings: {sorted(unknown)}")
+        settings = SupervisorSettings(**settings)
+
+        nodes = []
+        for item in data.get("nodes", []):
+            name = item.get("name")
+            node_class = item.get("class", "")
+            if not name:
+                raise ValueError(f"node without name: {item}")
+            if any(node.name == name for node in nodes):
+                raise ValueError(f"duplicate node name: {name}")
+            if ":" not in node_class:
+                raise ValueError(f"node class must be given as 'module:Class': {name}")
+            unknown = set(item) - {"name", "class", "params", "bus", "restart"}
+            if unknown:
+                raise ValueError(f"unknown keys in node {name}: {sorted(unknown)}")
+            node_bus = {**bus, **_check_bus(item.get("bus", {}), f"bus of {name}")}
+            params = dict(item.get("params", {}))
+            health_timeout = settings.health_timeout
+            idle_fps = params.get("idle_fps")
+            if idle_fps is not None:
+                if idle_fps <= 0:
+                    raise ValueError(f"idle_fps must be positive: {name}")
+                health_timeout = max(health_timeout, settings.heartbeat + 2.0 / idle_fps)
+            nodes.append(NodeEntry(name, node_class, params, node_bus, item.get("restart", True), health_timeout))
+        if not nodes:
+            raise ValueError("patch has no nodes")
+        return cls(nodes, bus, settings)
+
+    @classmethod
+    def load(cls, path: str) -> "Patch":
+        """パッチファイル（JSON）を読み込む"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def _check_bus(bus: dict, where: str) -> dict:
+    unknown = set(bus) - set(BUS_KEYS)
+    if unknown:
+        raise ValueError(f"unknown keys in {where}: {sorted(unknown)}")
+    if bus.get("wire_format", WIRE_FORMAT_JSON) not in WIRE_FORMATS:
+        raise ValueError(f"unknown wire format in {where}: {bus['wire_format']}")
+    return dict(bus)
+
+
+@dataclass
+class ManagedNode:
+    """監視中のノード1つ分の状態"""
+
+    entry: NodeEntry
+    process: Optional[subprocess.Popen] = None
+    started_at: float = 0.0  # 最後に起動した時刻 (time.monotonic)
+    last_heartbeat: Optional[float] = None  # 最後に状態が届いた時刻。起動してから届いていなければNone
+    ready: bool = False  # ノードが準備完了を知らせたか（クロックを受信したか、クロック源として再生を始めたか）
+    restarts: int = 0  # 再起動した回数
+    failures: int = 0  # 続けて落ちた回数（再起動までの待ち時間を決める）
+    next_start: Optional[float] = None  # 再起動する時刻。待っていなければNone
+
+
+class Supervisor:
+    """パッチのノードをそれぞれ別のプロセスで並列に起動し、監視して落ちたノードを再起動する。
+
+    各ノードは `metrics_export` でランチャーのUDPポートへ `heartbeat` 秒ごとに状態（`stats_snapshot()`）を送る。
+    状態に準備完了 (`ready`、`Node.is_ready()`) と書かれていれば準備完了とみなし、
+    プロセスが終了するか状態が途絶えたノードは、続けて落ちるたびに2倍に延ばした待ち時間の後で再起動する。
+    終了コード0で終わったノード（ウィンドウを閉じたなど）は再起動しない。
+    """
+
+    def __init__(self, patch: Patch, python: str = sys.executable, log: Callable[[str], None] = print):
+        """ランチャーの初期化
+
+        Args:
+            patch: 起動するノードの一覧と設定
+            python: ノードを起動するPythonの実行ファイル
+            log: 起動・準備完了・再起動などを知らせる関数
+        """
+        self.patch = patch
+        self.settings = patch.supervisor
+        self.python = python
+        self.log = log
+        self.nodes = {entry.name: ManagedNode(entry) for entry in patch.nodes}
+        self._by_pid: Dict[int, ManagedNode] = {}
+        self._started_at: Optional[float] = None
+        self._unready_since: Optional[float] = None  # 準備完了でないノードが出た時刻
+
+        # ノードの状態を受け取るソケット（ポートはOSに任せる）
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.setblocking(False)
+        self.stats_port = self._socket.getsockname()[1]
+
+    def command(self, entry: NodeEntry) -> List[str]:
+        """ノードを子プロセスとして起動するコマンドライン"""
+        spec = {
+            "name": entry.name,
+            "class": entry.node_class,
+            "params": entry.params,
+            "bus": entry.bus,
+            "metrics_export": f"udp://127.0.0.1:{self.stats_port}",
+            "metrics_interval": self.settings.heartbeat,
+        }
+        return [self.python, "-m", "src.common.launcher", "--run-node", json.dumps(spec)]
+
+    @property
+    def ready(self) -> bool:
+        """すべてのノードが準備完了か"""
+        return all(node.ready for node in self.nodes.values())
+
+    def start(self):
+        """すべてのノードを並列に起動する（起動を待たない）"""
+        for entry in self.patch.nodes:
+            if entry.health_timeout > self.settings.health_timeout:
+                self.log(f"[launcher] {entry.name}: health_timeout extended to {entry.health_timeout:.1f}s for idle_fps")
+        now = time.monotonic()
+        self._started_at = now
+        self._unready_since = now
+        for node in self.nodes.values():
+            self._spawn(node, now)
+
+    def poll(self, now: Optional[float] = None) -> bool:
+        """届いた状態を処理し、落ちたノードの再起動と、再起動待ちのノードの起動を行う
+
+        Returns:
+            bool: すべてのノードが準備完了か
+        """
+        now = time.monotonic() if now is None else now
+        self._receive(now)
+        for node in self.nodes.values():
+            self._check(node, now)
+        ready = self.ready
+        if ready and self._unready_since is not None:
+            # 起動時はコールドスタート、再起動時は落ちてから復帰するまでの時間
+            self.log(f"[launcher] all {len(self.nodes)} nodes ready in {now - self._unready_since:.2f}s")
+            self._unready_since = None
+        elif not ready and self._unready_since is None:
+            self._unready_since = now
+        return ready
+
+    def wait(self, timeout: float) -> bool:
+        """状態が届くかtimeout秒経つまで待ってから、poll()する"""
+        try:
+            select.select([self._socket], [], [], max(0.0, timeout))
+        except (OSError, ValueError):
+            # 閉じたソケット
+            return False
+        return self.poll()
+
+    def wait_ready(self, timeout: float) -> bool:
+        """すべてのノードが準備完了になるまで待つ
+
+        Returns:
+            bool: timeout秒以内に準備完了になったか
+        """
+        deadline = time.monotonic() + timeout
+        while not self.poll():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.wait(min(0.05, remaining))
+        return True
+
+    def run(self):
+        """すべてのノードを起動し、Ctrl+Cで止めるまで監視を続ける"""
+        if self._started_at is None:
+            self.start()
+        try:
+            if not self.wait_ready(self.settings.start_timeout):
+                waiting = [node.entry.name for node in self.nodes.values() if not node.ready]
+                self.log(f"[launcher] still waiting for clock: {', '.join(waiting)}")
+            while True:
+                self.wait(0.1)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 3.0):
+        """すべてのノードを終了させ、状態の受信を止める"""
+        processes = [node.process for node in self.nodes.values() if node.process is not None]
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        for node in self.nodes.values():
+            node.process = None
+            node.next_start = None
+        self._by_pid.clear()
+        self._socket.close()
+
+    def _spawn(self, node: ManagedNode, now: float):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(_ROOT), env.get("PYTHONPATH")]))
+        node.process = subprocess.Popen(self.command(node.entry), env=env)
+        node.started_at = now
+        node.last_heartbeat = None
+        node.ready = False
+        node.next_start = None
+        self._by_pid[node.process.pid] = node
+        self.log(f"[launcher] {node.entry.name}: started (pid {node.process.pid})")
+
+    def _receive(self, now: float):
+        """届いている状態をすべて読み出す"""
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # 閉じたソケット
+                return
+            try:
+                record = json.loads(data)
+            except ValueError:
+                continue
+            node = self._by_pid.get(record.get("pid"))
+            if node is None:
+                # 終了させたプロセスから遅れて届いた状態
+                continue
+            node.last_heartbeat = now
+            if not node.ready and record.get("ready"):
+                node.ready = True
+                self.log(f"[launcher] {node.entry.name}: ready in {now - node.started_at:.2f}s")
+
+    def _check(self, node: ManagedNode, now: float):
+        """ノードのプロセスと状態を確かめ、必要なら終了させて再起動を予約する"""
+        if node.process is None:
+            if node.next_start is not None and now >= node.next_start:
+                node.restarts += 1
+                self._spawn(node, now)
+            return
+
+        code = node.process.poll()
+        if code is None:
+            if node.last_heartbeat is None:
+                silent, timeout = now - node.started_at, self.settings.start_timeout
+            else:
+                silent, timeout = now - node.last_heartbeat, node.entry.health_timeout
+            if silent < timeout:
+                if node.failures and node.last_heartbeat is not None and now - node.started_at >= self.settings.stable_after:
+                    node.failures = 0
+                return
+            reason = f"no heartbeat for {silent:.1f}s"
+            node.process.kill()
+            node.process.wait()
+        elif code == 0:
+            self._forget(node)
+            self.log(f"[launcher] {node.entry.name}: exited")
+            return
+        else:
+            reason = f"exited with code {code}"
+
+        self._forget(node)
+        if not node.entry.restart:
+            self.log(f"[launcher] {node.entry.name}: {reason}")
+            return
+        delay = min(self.settings.max_restart_delay, self.settings.restart_delay * 2**node.failures)
+        node.failures += 1
+        node.next_start = now + delay
+        self.log(f"[launcher] {node.entry.name}: {reason}, restarting in {delay:.2f}s")
+
+    def _forget(self, node: ManagedNode):
+        self._by_pid.pop(node.process.pid, None)
+        node.process = None
+        node.ready = False
+
+
+def run_node(spec: dict):
+    """子プロセスでノードを1つ実行する（Supervisor.command()のコマンドラインから呼ばれる）"""
+    # 読み込みに時間のかかるノードとPyxelは子プロセスでだけ読み込む
+    from src.common.host import load_node_class
+    from src.common.receive_engine import ReceiveEngine
+
+    bus = spec.get("bus", {})
+    kwargs = dict(spec.get("params", {}))
+    if bus.get("session") is not None:
+        kwargs["transport"] = MulticastTransport.for_session(bus["session"], loopback_only=bus.get("loopback_only", False))
+    if bus.get("wire_format") is not None:
+        kwargs["wire_format"] = bus["wire_format"]
+    if bus.get("reliable"):
+        kwargs["reliable"] = True
+    engine = None
+    if bus.get("receive_engine"):
+        engine = ReceiveEngine()
+        engine.start()
+        kwargs["receive_engine"] = engine
+    kwargs["metrics_export"] = spec["metrics_export"]
+    kwargs["metrics_interval"] = spec["metrics_interval"]
+
+    def terminate(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise KeyboardInterrupt
+
+    # 終了はランチャーが決める。端末のCtrl+Cはランチャーだけが受け取り、
+    # ランチャーからの終了要求 (SIGTERM) ではnode.run()の後始末（ソケットのクローズ）を行う
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        node = load_node_class(spec["class"])(**kwargs)
+        node.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パッチファイルのノードを並列に起動し、落ちたノードを再起動する")
+    parser.add_argument("patch", nargs="?", help="パッチファイル (JSON)")
+    parser.add_argument("--check", action="store_true", help="パッチファイルを確かめ、起動するノードを表示して終了する")
+    parser.add_argument("--run-node", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_node is not None:
+        run_node(json.loads(args.run_node))
+        return
+    if args.patch is None:
+        parser.error("the patch file is required")
+
+    patch = Patch.load(args.patch)
+    if args.check:
+        for entry in patch.nodes:
+            print(f"{entry.name}: {entry.node_class} params={entry.params} bus={entry.bus}")
+            if entry.health_timeout > patch.supervisor.health_timeout:
+                print(f"  health_timeout extended to {entry.health_timeout:.1f}s for idle_fps")
+        return
+
+    supervisor = Supervisor(patch)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from typing import Any, Callable, Hashable, Optional
+
+from src.common.pyxel_backend import pyxel
+
+
+class StaticLayer:
+    """状態が変わったときだけ描き直すオフスクリーンの画像（静的なレイヤー）
+
+    テキストのラベルや操作説明、パターンのセルなど毎フレームは変わらない要素を `pyxel.Image` に描いておき、
+    毎フレームは画面へ1回の `blt()` で転送する。描き直すのは `invalidate()` の後か、`draw()` に渡すkeyが
+    変わったときだけで、一部の要素が変わった場合は `patch()` でその部分だけを描き直せる。
+
+    色0は透明として転送するため、`cls()` した背景や先に描いた表示の上に重ねられる（レイヤーに色0は描けない）。
+    """
+
+    TRANSPARENT = 0
+
+    def __init__(self, width: int, height: int, render: Callable[[Any], None]):
+        """レイヤーの初期化（pyxel.init()の後に作成すること）
+
+        Args:
+            width: レイヤーの幅
+            height: レイヤーの高さ
+            render: レイヤー全体を描く関数。描画先の画像を引数に呼ばれる
+        """
+        self.width = width
+        self.height = height
+        self.image = pyxel.Image(width, height)
+        self.render = render
+        self.dirty = True
+        self.key: Optional[Hashable] = None
+        self.rebuilds = 0  # レイヤー全体を描き直した回数
+
+    def invalidate(self):
+        """次のdraw()でレイヤー全体を描き直す（どのスレッドから呼んでもよい）"""
+        self.dirty = True
+
+    def patch(self, func: Callable[..., None], *args):
+        """レイヤーの一部だけを描き直す。全体の描き直しが予定されている場合は何もしない
+
+        Args:
+            func: 描画先の画像と残りの引数を受け取って描く関数
+            *args: funcに渡す引数
+        """
+        if not self.dirty:
+            func(self.image, *args)
+
+    def draw(self, x: int = 0, y: int = 0, key: Optional[Hashable] = None):
+        """必要なら描き直してから、レイヤーを画面に転送する
+
+        Args:
+            x: 転送先のx座標
+            y: 転送先のy座標
+            key: レイヤーの内容を決める状態。前回と異なる場合は描き直す
+        """
+        if key != self.key:
+            self.key = key
+            self.dirty = True
+        if self.dirty:
+            # 描いている間に無効化された場合は次のフレームで描き直す
+            self.dirty = False
+            self.image.cls(self.TRANSPARENT)
+            self.render(self.image)
+            self.rebuilds += 1
+        pyxel.blt(x, y, self.image, 0, 0, self.width, self.height, self.TRANSPARENT)
@@ -0,0 +1,268 @@
+"""ノードの処理時間とMIDIの受信状況の計測
+
+使い方（エクスポートされた統計データグラムの表示）:
+    python -m src.common.metrics [--port PORT]
+"""
+
+import argparse
+import json
+import socket
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from src.common.midi_utils import MidiMessage, MIDI_CLOCK
+
+DEFAULT_STATS_PORT = 5010  # 統計データグラムの既定のポート
+
+
+@dataclass
+class HistogramSummary:
+    """直近の計測値の分布 (ms)"""
+
+    count: int  # 直近ウィンドウ内の計測数
+    mean: float
+    stdev: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+class RollingHistogram:
+    """直近window個の計測値 (ms) を保持し、分布を求める。
+
+    値の追加は受信スレッド、集計はフレームループから行ってよい（dequeの追加とコピーはスレッドセーフ）。
+    """
+
+    def __init__(self, window: int = 256):
+        self._values = deque(maxlen=window)
+        self.total = 0  # これまでの計測数
+
+    def add(self, value: float):
+        """計測値 (ms) を追加する"""
+        self._values.append(value)
+        self.total += 1
+
+    def add_ns(self, elapsed_ns: int):
+        """計測値 (ns) をmsに換算して追加する"""
+        self.add(elapsed_ns / 1e6)
+
+    def summary(self) -> HistogramSummary:
+        """直近ウィンドウの分布を返す"""
+        values = sorted(self._values)
+        if not values:
+            return HistogramSummary(0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        count = len(values)
+        mean = sum(values) / count
+        stdev = (sum((v - mean) ** 2 for v in values) / count) ** 0.5
+        return HistogramSummary(
+            count=count,
+            mean=mean,
+            stdev=stdev,
+            p50=values[int(count * 0.50)],
+            p95=values[min(count - 1, int(count * 0.95))],
+            p99=values[min(count - 1, int(count * 0.99))],
+            max=values[-1],
+        )
+
+    def buckets(self, edges: List[float]) -> List[int]:
+        """直近ウィンドウの値を、edgesで区切った区間ごとの件数にする（最後の区間はedges[-1]以上）"""
+        counts = [0] * (len(edges) + 1)
+        for value in list(self._values):
+            index = 0
+            while index < len(edges) and value >= edges[index]:
+                index += 1
+            counts[index] += 1
+        return counts
+
+
+class RateMeter:
+    """直近window秒間の発生回数から、1秒あたりの発生頻度を求める"""
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self._times = deque()
+
+    def mark(self, now: Optional[float] = None):
+        """1回の発生を記録する"""
+        now = time.perf_counter() if now is None else now
+        times = self._times
+        times.append(now)
+        while times[0] < now - self.window:
+            times.popleft()
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """1秒あたりの発生頻度を返す"""
+        now = time.perf_counter() if now is None else now
+        return sum(1 for t in list(self._times) if t >= now - self.window) / self.window
+
+
+class NodeMetrics:
+    """1つのノードの計測値をまとめる
+
+    - frame_interval: フレームの間隔（フレームレートの低下の検出）
+    - update: 1フレーム分の更新処理（受信キューの処理・update()・送信）の時間
+    - draw: draw()の時間
+    - callback: 受信したメッセージ1件あたりのコールバックの処理時間
+    - decode: 受信したパケット1件あたりのデコード時間
+    - clock_interval: クロックの受信間隔（標準偏差がクロックの受信ジッタ）
+    - messages: 1秒あたりの受信メッセージ数
+    """
+
+    HISTOGRAMS = ("frame_interval", "update", "draw", "callback", "decode", "clock_interval")
+
+    def __init__(self, window: int = 256):
+        """計測値の初期化
+
+        Args:
+            window: 分布を求める直近の計測数
+        """
+        self.frame_interval = RollingHistogram(window)
+        self.update = RollingHistogram(window)
+        self.draw = RollingHistogram(window)
+        self.callback = RollingHistogram(window)
+        self.decode = RollingHistogram(window)
+        self.clock_interval = RollingHistogram(window)
+        self.messages = RateMeter()
+        self._last_frame_ns: Optional[int] = None
+        self._last_clock_ns: Optional[int] = None
+
+    def on_frame(self, now_ns: int):
+        """フレームの開始時に呼ばれる"""
+        if self._last_frame_ns is not None:
+            self.frame_interval.add_ns(now_ns - self._last_frame_ns)
+        self._last_frame_ns = now_ns
+
+    def on_message(self, msg: MidiMessage, start_ns: int, end_ns: int):
+        """受信したメッセージのコールバックが終わった時に呼ばれる（受信スレッド）"""
+        self.callback.add_ns(end_ns - start_ns)
+        self.messages.mark(start_ns / 1e9)
+        if msg.type == MIDI_CLOCK:
+            if self._last_clock_ns is not None:
+                self.clock_interval.add_ns(start_ns - self._last_clock_ns)
+            self._last_clock_ns = start_ns
+
+    def snapshot(self) -> Dict[str, object]:
+        """全計測値の分布を辞書で返す（エクスポート用）"""
+        result: Dict[str, object] = {name: asdict(getattr(self, name).summary()) for name in self.HISTOGRAMS}
+        result["message_rate"] = self.messages.rate(time.perf_counter_ns() / 1e9)
+        return result
+
+    def overlay_lines(self) -> List[str]:
+        """画面に重ねて表示する計測結果"""
+        frame = self.frame_interval.summary()
+        update = self.update.summary()
+        draw = self.draw.summary()
+        callback = self.callback.summary()
+        decode = self.decode.summary()
+        clock = self.clock_interval.summary()
+        rate = self.messages.rate(time.perf_counter_ns() / 1e9)
+        return [
+            f"FRM {frame.mean:.1f} p99 {frame.p99:.1f}ms",
+            f"UPD {update.p95:.2f} DRW {draw.p95:.2f}ms",
+            f"MSG {rate:.0f}/s CB {callback.p95:.3f}ms",
+            f"DEC {decode.p95:.3f}ms CLK+-{clock.stdev:.2f}ms",
+        ]
+
+
+class StatsExporter:
+    """計測値を一定間隔でUDPデータグラムまたはJSONLファイルへ書き出す
+
+    1回の書き出しは `{"node": ノード名, "time": UNIX時間, ...計測値}` のJSON1行。
+    """
+
+    def __init__(self, target: str, interval: float = 1.0):
+        """エクスポータの初期化
+
+        Args:
+            target: 書き出し先。"udp://host:port" の場合はUDPデータグラム、それ以外はJSONLファイルのパス
+            interval: 書き出す間隔（秒）
+        """
+        self.target = target
+        self.interval = interval
+        self._next_export = 0.0
+        self._socket = None
+        self._file = None
+        if target.startswith("udp://"):
+            host, _, port = target[len("udp://") :].rpartition(":")
+            self._address = (host or "127.0.0.1", int(port or DEFAULT_STATS_PORT))
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._file = open(target, "a", encoding="utf-8")
+
+    def maybe_export(self, record: Dict[str, object], now: Optional[float] = None) -> bool:
+        """前回の書き出しからinterval秒経っていれば書き出す"""
+        now = time.time() if now is None else now
+        if now < self._next_export:
+            return False
+        self._next_export = now + self.interval
+        self.export(record, now)
+        return True
+
+    def export(self, record: Dict[str, object], now: Optional[float] = None):
+        """計測値を1件書き出す"""
+        line = json.dumps({"time": time.time() if now is None else now, **record})
+        if self._socket is not None:
+            self._socket.sendto(line.encode(), self._address)
+        else:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        """書き出し先を閉じる"""
+        if self._socket is not None:
+            self._socket.close()
+        if self._file is not None:
+            self._file.close()
+
+
+# main()で表示する列（見出し, 幅, 書式, 値を取り出すキー）
+_COLUMNS = [
+    ("frame ms", 10, ".2f", ("frame_interval", "mean")),
+    ("upd p95", 10, ".3f", ("update", "p95")),
+    ("draw p95", 10, ".3f", ("draw", "p95")),
+    ("msg/s", 8, ".0f", ("message_rate",)),
+    ("cb p95", 10, ".3f", ("callback", "p95")),
+    ("clk jit", 10, ".3f", ("clock_interval", "stdev")),
+]
+
+
+def format_header() -> str:
+    """main()で表示する見出しの行"""
+    return f"{'node':<20}" + "".join(f"{title:>{width}}" for title, width, _, _ in _COLUMNS)
+
+
+def format_row(stats: Dict[str, object]) -> str:
+    """統計データグラム1件を表示する行にする。計測していないノードの値は "-" にする"""
+    row = f"{str(stats.get('node', '-')):<20}"
+    for _, width, spec, keys in _COLUMNS:
+        value = stats
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        row += f"{value:>{width}{spec}}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+    return row
+
+
+def main():
+    """エクスポートされた統計データグラムを受信し、ノードごとに表示する"""
+    parser = argparse.ArgumentParser(description="ノードの統計データグラムを表示")
+    parser.add_argument("--port", type=int, default=DEFAULT_STATS_PORT, help="受信するポート")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("", args.port))
+    print(format_header())
+    try:
+        while True:
+            data, _ = sock.recvfrom(65536)
+            print(format_row(json.loads(data.decode())))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import socket
 import json
-from dataclasses import dataclass, asdict
-from typing import Optional, Callable
+import random
+import struct
+import sys
+import zlib
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Callable, Tuple, Union
 import threading
 import time
 
@@ -15,38 +19,254 @@ class MidiMessage:
     control: Optional[int] = None
     value: Optional[int] = None
     source: Optional[str] = None  # メッセージの送信元ノード名
+    timestamp: Optional[float] = None  # マスタークロック上の目標時刻（UNIX時間, 秒）
+    seq: Optional[int] = None  # 送信元ごとの連番（reliable指定時のみ。0-2^32-1で一周する）
+
+
+class Subscription:
+    """ノードが受信するメッセージの条件。
+
+    条件を指定しない項目はすべて受信する。チャンネルの条件はチャンネルを持つメッセージにのみ適用し、
+    clockなどチャンネルを持たないメッセージは通す。バイナリ形式のパケットはヘッダだけを見て判定できるため、
+    対象外のパケットはデコードせずに捨てられる。
+    """
+
+    def __init__(
+        self,
+        types: Optional[Iterable[str]] = None,
+        channels: Optional[Iterable[int]] = None,
+        sources: Optional[Iterable[str]] = None,
+    ):
+        """受信条件の初期化
+
+        Args:
+            types: 受信するメッセージタイプ
+            channels: 受信するMIDIチャンネル
+            sources: 受信する送信元ノード名
+        """
+        self.types = frozenset(types) if types else None
+        self.channels = frozenset(channels) if channels else None
+        self.sources = frozenset(sources) if sources else None
+
+        # バイナリヘッダで判定するための値
+        self._statuses = None
+        if self.types is not None:
+            self._statuses = frozenset(MESSAGE_STATUS[t] for t in self.types if t in MESSAGE_STATUS)
+        self._source_bytes = frozenset(src.encode() for src in self.sources) if self.sources else None
+
+    def matches(self, msg: MidiMessage) -> bool:
+        """メッセージが受信条件に合うかを返す"""
+        if self.types is not None and msg.type not in self.types:
+            return False
+        if self.channels is not None and msg.channel is not None and msg.channel not in self.channels:
+            return False
+        if self.sources is not None and msg.source not in self.sources:
+            return False
+        return True
+
+    def matches_header(self, status: int, channel: Optional[int], source: bytes) -> bool:
+        """バイナリパケットのヘッダの値が受信条件に合うかを返す"""
+        if self._statuses is not None and status not in self._statuses:
+            return False
+        if self.channels is not None and channel is not None and channel not in self.channels:
+            return False
+        if self._source_bytes is not None and source not in self._source_bytes:
+            return False
+        return True
+
+
+class BroadcastTransport:
+    """UDPブロードキャストによる転送（従来の方式）。LAN上のすべてのホストにパケットが届く。"""
+
+    def __init__(self, port: int = 5000, address: str = "255.255.255.255"):
+        """ブロードキャスト転送の初期化
+
+        Args:
+            port: 送受信に使うポート番号
+            address: 送信先のブロードキャストアドレス
+        """
+        self.port = port
+        self.address = address
+
+    @property
+    def destination(self) -> Tuple[str, int]:
+        """送信先アドレス"""
+        return (self.address, self.port)
+
+    def create_receiver(self) -> socket.socket:
+        """受信用ソケットを作成"""
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # ソケットオプションの設定
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):  # macOSとLinuxでのみ利用可能
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # ワイルドカードアドレスにバインド
+        receiver.bind(("0.0.0.0", self.port))
+        return receiver
+
+    def create_sender(self) -> socket.socket:
+        """送信用ソケットを作成"""
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return sender
+
+
+class MulticastTransport:
+    """IPマルチキャストによる転送。
+
+    グループに参加したホストにだけパケットが届くため、パッチ（セッション）ごとにグループを分ければ
+    同じLANや同じマシン上の複数のパッチを分離できる。TTLを0にするとパケットはマシンの外に出ない。
+    """
+
+    def __init__(
+        self,
+        group: str = "239.255.80.1",
+        port: int = 5000,
+        ttl: int = 1,
+        loopback: bool = True,
+        interface: str = "0.0.0.0",
+    ):
+        """マルチキャスト転送の初期化
+
+        Args:
+            group: マルチキャストグループのアドレス（239.0.0.0/8 の組織内スコープを推奨）
+            port: 送受信に使うポート番号
+            ttl: 送信パケットのTTL。1は同一サブネット内、0は同一マシン内のみ
+            loopback: 同じマシン上の受信者にも送信パケットを届けるか
+            interface: 送受信に使うネットワークインタフェースのアドレス
+        """
+        self.group = group
+        self.port = port
+        self.ttl = ttl
+        self.loopback = loopback
+        self.interface = interface
+
+    @classmethod
+    def for_session(cls, session: Union[int, str], port: int = 5000, loopback_only: bool = False, **kwargs):
+        """セッションID（パッチ名など）に対応するグループの転送を作成
+
+        Args:
+            session: セッションID
+            port: 送受信に使うポート番号
+            loopback_only: Trueの場合、パケットを同一マシン内に限定する
+            **kwargs: MulticastTransportへ渡す引数
+        """
+        if loopback_only:
+            kwargs.update(ttl=0, loopback=True)
+        return cls(group=session_group(session), port=port, **kwargs)
+
+    @property
+    def destination(self) -> Tuple[str, int]:
+        """送信先アドレス"""
+        return (self.group, self.port)
+
+    def create_receiver(self) -> socket.socket:
+        """グループに参加した受信用ソケットを作成"""
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Linuxではグループのアドレスにバインドすると、同じポートの他のグループのパケットを受信しない
+        receiver.bind((self.group if sys.platform.startswith("linux") else "", self.port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton(self.interface))
+        receiver.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return receiver
+
+    def create_sender(self) -> socket.socket:
+        """送信用ソケットを作成"""
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1 if self.loopback else 0)
+        if self.interface != "0.0.0.0":
+            sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+        return sender
+
+
+def session_group(session: Union[int, str]) -> str:
+    """セッションIDから組織内スコープ (239.255.0.0/16) のマルチキャストグループを求める"""
+    if isinstance(session, str):
+        session = zlib.crc32(session.encode())
+    # .0 と .255 を避ける
+    index = session % (254 * 254)
+    return f"239.255.{index // 254 + 1}.{index % 254 + 1}"
 
 
 class MidiNode:
     BROADCAST_PORT = 5000  # すべてのノードで共通のポート
     BROADCAST_ADDR = "255.255.255.255"  # ブロードキャストアドレス
 
-    def __init__(self, node_name: str, callback: Callable[[MidiMessage], None]):
+    def __init__(
+        self,
+        node_name: str,
+        callback: Callable[[MidiMessage], None],
+        wire_format: Optional[str] = None,
+        bus: Optional["LocalBus"] = None,
+        subscription: Optional[Subscription] = None,
+        transport=None,
+        reliable: bool = False,
+        repeats: int = 2,
+        receive_engine=None,
+    ):
         """MIDIノードの初期化
 
         Args:
             node_name: ノードの識別名
             callback: MIDIメッセージを受信した時のコールバック関数
+            wire_format: 送信時のシリアライズ形式 (WIRE_FORMAT_JSON / WIRE_FORMAT_JSON_EXT / WIRE_FORMAT_BINARY)。
+                受信側は形式を自動判別するため、JSONのノードとバイナリのノードを混在できる。
+                WIRE_FORMAT_JSONではタイムスタンプと連番を送らない（従来のノードが受信できるように）
+            bus: 同一プロセス内のノードと共有するバス。指定した場合は自前のソケットを持たず、
+                送受信をバスに任せる
+            subscription: 受信するメッセージの条件。Noneの場合はすべて受信する
+            transport: 送受信に使う転送方式 (BroadcastTransport / MulticastTransport)。
+                Noneの場合は従来のブロードキャスト
+            reliable: Trueの場合、送信するメッセージに連番を付け、トランスポートのメッセージ
+                (start/stop/continue/song_position) を後続のデータグラムに含めてrepeats回繰り返し送る。
+                受信側は連番で重複を捨て、欠落を数える。WIRE_FORMAT_JSONの場合は連番を送るためWIRE_FORMAT_JSON_EXTになる
+            repeats: reliable指定時にトランスポートのメッセージを繰り返し送る回数
+            receive_engine: 受信に使うReceiveEngine。指定した場合は専用の受信スレッドを持たず、
+                エンジンのスレッド（またはイベントループ）で他のノードのソケットとまとめて受信する
         """
         self.node_name = node_name
         self.callback = callback
+        self.wire_format = wire_format or WIRE_FORMAT_JSON
+        if reliable and self.wire_format == WIRE_FORMAT_JSON:
+            # 連番のない繰り返しは受信側で重複として捨てられないため、reliableは拡張フィールド付きのJSONを要求する
+            self.wire_format = WIRE_FORMAT_JSON_EXT
+        self.bus = bus
+        self.transport = None
+        self.subscription = subscription
+        self.filtered = 0  # 受信条件に合わず捨てたメッセージ数
+        self.metrics = None  # 受信処理の計測値（NodeMetrics）。Noneの場合は計測しない
+        self._name_bytes = node_name.encode()
+        self.running = True
 
-        # 受信用ソケット
-        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # ソケットオプションの設定
-        self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if hasattr(socket, "SO_REUSEPORT"):  # macOSとLinuxでのみ利用可能
-            self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        # ワイルドカードアドレスにバインド
-        self.receiver.bind(("0.0.0.0", self.BROADCAST_PORT))
+        # 送信側の連番と、繰り返し送るトランスポートのメッセージ（reliable指定時のみ）
+        self.reliable = reliable
+        self.repeats = repeats
+        self._next_seq = random.getrandbits(32)  # 再起動した送信元を受信側で見分けられるよう乱数から始める
+        self._pending_repeats: List[List] = []  # [メッセージ, 残りの回数]
+        self._send_lock = threading.Lock()
+        # 受信側の連番の追跡（連番付きのメッセージのみ）
+        self.sequences = SequenceTracker()
+        self.receive_engine = receive_engine
 
-        # 送信用ソケット
-        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sender.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if bus is not None:
+            bus.register(self)
+            return
+
+        # 送受信用ソケット
+        self.transport = transport or BroadcastTransport(self.BROADCAST_PORT, self.BROADCAST_ADDR)
+        self.destination = self.transport.destination
+        self.receiver = self.transport.create_receiver()
+        self.sender = self.transport.create_sender()
+
+        if receive_engine is not None:
+            receive_engine.register(self)
+            return
 
         # 受信スレッド
-        self.running = True
         self.thread = threading.Thread(target=self._receive_loop)
         self.thread.daemon = True
         self.thread.start()
@@ -55,37 +275,580 @@ class MidiNode:
         """メッセージ受信ループ"""
         while self.running:
             try:
-                data, _ = self.receiver.recvfrom(1024)
-                msg_dict = json.loads(data.decode())
-
-                # 自分自身が送信したメッセージは無視
-                if msg_dict.get("source") == self.node_name:
-                    continue
-
-                msg = MidiMessage(**msg_dict)
-                self.callback(msg)
-            except (json.JSONDecodeError, socket.error, ValueError) as e:
+                data, _ = self.receiver.recvfrom(MAX_DATAGRAM_SIZE)
+                # close()で起こされた
+                if not self.running:
+                    break
+                self.handle_packet(data)
+            except (json.JSONDecodeError, socket.error, ValueError, TypeError, struct.error) as e:
+                if not self.running:
+                    break
                 print(f"Error in MIDI receive loop: {e}")
                 time.sleep(0.001)
 
+    def handle_packet(self, data: bytes):
+        """受信したパケットをデコードしてコールバックへ渡す。バッチは含まれる順に渡す。"""
+        if data[:1] == _BATCH_PREFIX:
+            for packet in split_batch(data):
+                self._handle_single(packet)
+        elif data[:1] == b"[":
+            start = time.perf_counter_ns()
+            msgs = [MidiMessage(**msg_dict) for msg_dict in json.loads(data.decode())]
+            if self.metrics is not None:
+                self.metrics.decode.add_ns(time.perf_counter_ns() - start)
+            for msg in msgs:
+                self._deliver(msg)
+        else:
+            self._handle_single(data)
+
+    def _handle_single(self, data: bytes):
+        """1メッセージ分のパケットを処理する"""
+        if not self._accept_packet(data):
+            return
+        # バイナリパケットの連番はヘッダの判定で追跡済み
+        check_seq = data[:1] != _BINARY_PREFIX
+        if self.metrics is None:
+            self._deliver(decode_message(data), check_seq)
+            return
+        start = time.perf_counter_ns()
+        msg = decode_message(data)
+        self.metrics.decode.add_ns(time.perf_counter_ns() - start)
+        self._deliver(msg, check_seq)
+
+    def _deliver(self, msg: MidiMessage, check_seq: bool = True):
+        """デコード済みのメッセージをコールバックへ渡す"""
+        # 自分自身が送信したメッセージは無視
+        if msg.source == self.node_name:
+            return
+        # 繰り返し送られたメッセージの2回目以降は捨てる
+        if check_seq and msg.seq is not None and not self.sequences.accept(msg.source, msg.seq):
+            return
+        if self.accepts(msg):
+            self.invoke(msg)
+
+    def invoke(self, msg: MidiMessage):
+        """受信条件に合ったメッセージでコールバックを呼ぶ。計測中は処理時間を記録する。"""
+        metrics = self.metrics
+        if metrics is None:
+            self.callback(msg)
+            return
+        start = time.perf_counter_ns()
+        self.callback(msg)
+        metrics.on_message(msg, start, time.perf_counter_ns())
+
+    def accepts(self, msg: MidiMessage) -> bool:
+        """デコード済みのメッセージが受信条件に合うかを返す"""
+        if self.subscription is None or self.subscription.matches(msg):
+            return True
+        self.filtered += 1
+        return False
+
+    def _accept_packet(self, data: bytes) -> bool:
+        """バイナリパケットをヘッダだけで判定する。JSONパケットはデコード後に判定する。"""
+        if len(data) < BINARY_HEADER_SIZE or data[0] != BINARY_MAGIC:
+            return True
+
+        source = data[BINARY_HEADER_SIZE : BINARY_HEADER_SIZE + data[BINARY_HEADER_SIZE - 1]]
+        # 自分自身が送信したメッセージ
+        if source == self._name_bytes:
+            return False
+
+        # 受信条件で捨てるメッセージも欠落と区別できるよう、判定の前に連番を追跡する
+        flags = data[3]
+        if flags & _FLAG_SEQ:
+            offset = BINARY_HEADER_SIZE + len(source) + (_TIMESTAMP_FIELD.size if flags & _FLAG_TIMESTAMP else 0)
+            (seq,) = _SEQ_FIELD.unpack_from(data, offset)
+            if not self.sequences.accept(_source_str(source), seq):
+                return False
+
+        subscription = self.subscription
+        if subscription is None:
+            return True
+        # ヘッダは magic, version, status, flags, channel の順
+        channel = data[4] if flags & _FLAG_CHANNEL else None
+        if subscription.matches_header(data[2], channel, source):
+            return True
+        self.filtered += 1
+        return False
+
+    def sequence_outgoing(self, msgs: List[MidiMessage]) -> List[MidiMessage]:
+        """送信するメッセージに連番を付け、繰り返し送るメッセージを前に加えたリストを返す（reliable指定時のみ）
+
+        トランスポートのメッセージは、この後のrepeats回の送信のデータグラムにも含める。
+        繰り返し分は元のメッセージより前に並ぶため、受信側では送信順（連番の順）に処理される。
+        """
+        if not self.reliable:
+            return msgs
+        with self._send_lock:
+            outgoing = [entry[0] for entry in self._pending_repeats]
+            for entry in self._pending_repeats:
+                entry[1] -= 1
+            self._pending_repeats = [entry for entry in self._pending_repeats if entry[1] > 0]
+            for msg in msgs:
+                msg.seq = self._next_seq
+                self._next_seq = (self._next_seq + 1) & SEQ_MASK
+                if msg.type in TRANSPORT_MESSAGES and self.repeats > 0:
+                    # 送信後に書き換えられても同じ内容を送るよう複製しておく
+                    self._pending_repeats.append([replace(msg, source=self.node_name), self.repeats])
+            return outgoing + msgs
+
+    def resend_pending(self) -> int:
+        """繰り返し送るメッセージが残っていれば、それだけを送信する（フレームごとに呼ぶ）
+
+        停止後などでしばらく送信がない場合にも、トランスポートのメッセージの繰り返しを遅らせない。
+        """
+        if not self._pending_repeats:
+            return 0
+        msgs = self.sequence_outgoing([])
+        self._send_datagrams(msgs)
+        return len(msgs)
+
+    def _send_datagrams(self, msgs: List[MidiMessage]):
+        """連番を付け終えたメッセージをUDPで送信する（1つなら単独、複数ならバッチ）"""
+        if self.bus is not None:
+            self.bus.send_remote(self, msgs)
+            return
+        if len(msgs) == 1:
+            self.sender.sendto(encode_message(msgs[0], self.node_name, self.wire_format), self.destination)
+            return
+        for data in encode_batch(msgs, self.node_name, self.wire_format):
+            self.sender.sendto(data, self.destination)
+
+    def receive_stats(self):
+        """受信の計測結果（ReceiveStats）。ReceiveEngineで受信していない場合はNone"""
+        if self.bus is not None:
+            return self.bus.receive_stats()
+        if self.receive_engine is None:
+            return None
+        return self.receive_engine.stats(self)
+
+    def sequence_stats(self) -> Dict[str, "SequenceStats"]:
+        """送信元ごとの連番の追跡結果。LocalBus経由ではバスが他プロセスから受信した分を返す"""
+        if self.bus is not None:
+            return self.bus.sequence_stats()
+        return self.sequences.stats()
+
     def send_message(self, msg: MidiMessage):
         """MIDIメッセージをブロードキャスト送信
 
         Args:
             msg: 送信するMIDIメッセージ
         """
-        # 送信元ノード名を設定
-        msg_dict = asdict(msg)
-        msg_dict["source"] = self.node_name
+        if self.bus is not None:
+            self.bus.publish(self, msg)
+            return
+
+        if self.reliable:
+            self._send_datagrams(self.sequence_outgoing([msg]))
+            return
+        data = encode_message(msg, self.node_name, self.wire_format)
+        self.sender.sendto(data, self.destination)
+
+    def send_batch(self, msgs: List[MidiMessage]):
+        """複数のMIDIメッセージを1つのデータグラムにまとめて送信する
+
+        受信側ではメッセージが送信順にコールバックへ渡される。
+        1つのデータグラムに収まらない場合は複数に分割する。
+
+        Args:
+            msgs: 送信するMIDIメッセージのリスト
+        """
+        if not msgs:
+            return
+        if self.bus is not None:
+            self.bus.publish_batch(self, msgs)
+            return
 
-        msg_json = json.dumps(msg_dict)
-        self.sender.sendto(msg_json.encode(), (self.BROADCAST_ADDR, self.BROADCAST_PORT))
+        for data in encode_batch(self.sequence_outgoing(msgs), self.node_name, self.wire_format):
+            self.sender.sendto(data, self.destination)
 
     def close(self):
         """ノードを終了"""
         self.running = False
+        if self.bus is not None:
+            self.bus.unregister(self)
+            return
+        if self.receive_engine is not None:
+            # エンジンがソケットを読まなくなってから閉じる
+            self.receive_engine.unregister(self)
+        else:
+            # 受信待ちの受信スレッドを起こす（Linuxでは未接続のUDPソケットでもrecvfromが戻る）
+            try:
+                self.receiver.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
         self.receiver.close()
         self.sender.close()
+        if self.receive_engine is None and self.thread is not threading.current_thread():
+            self.thread.join(0.5)
+
+
+class LocalBus:
+    """同一プロセス内の複数のMidiNodeをつなぐバス。
+
+    プロセス内のノード間ではMidiMessageオブジェクトをそのまま受け渡し（シリアライズなし）、
+    UDPは他プロセスのノードとの通信にのみ使う。受け渡したメッセージは複数のノードで共有されるため、
+    受信側で書き換えてはならない。
+    """
+
+    def __init__(self, wire_format: Optional[str] = None, remote: bool = True, transport=None, receive_engine=None):
+        """バスの初期化
+
+        Args:
+            wire_format: 他プロセスへ送信する際のシリアライズ形式
+            remote: Falseの場合、UDPを使わずプロセス内だけで配信する
+            transport: 他プロセスとの送受信に使う転送方式
+            receive_engine: 他プロセスからの受信に使うReceiveEngine。Noneの場合は専用の受信スレッドで受信する
+        """
+        self.nodes: List[MidiNode] = []
+        self._local_names = set()
+        self._lock = threading.Lock()
+        # ローカル配信が発生したことをイベントループへ知らせる
+        self.activity = threading.Event()
+
+        # 他プロセスとの送受信を担当するMidiNode
+        self.uplink = None
+        if remote:
+            self.uplink = MidiNode(
+                "localbus", self._on_remote_message, wire_format, transport=transport, receive_engine=receive_engine
+            )
+
+    def register(self, node: MidiNode):
+        """MidiNodeをバスに接続"""
+        with self._lock:
+            self.nodes = self.nodes + [node]
+            self._local_names.add(node.node_name)
+
+    def unregister(self, node: MidiNode):
+        """MidiNodeをバスから切り離す"""
+        with self._lock:
+            self.nodes = [n for n in self.nodes if n is not node]
+            self._local_names.discard(node.node_name)
+
+    def _dispatch(self, msg: MidiMessage):
+        """送信元以外のローカルノードへメッセージを渡す"""
+        for node in self.nodes:
+            if node.node_name != msg.source and node.accepts(msg):
+                node.invoke(msg)
+        self.activity.set()
+
+    def publish(self, sender: MidiNode, msg: MidiMessage):
+        """ローカルノードへ配信し、他プロセスへはUDPで送信する"""
+        msg.source = sender.node_name
+        # 連番は他プロセスへの送信のためのもので、プロセス内の配信では欠落も重複もしない
+        outgoing = sender.sequence_outgoing([msg]) if self.uplink is not None else None
+        self._dispatch(msg)
+        if outgoing is not None:
+            self.send_remote(sender, outgoing)
+
+    def publish_batch(self, sender: MidiNode, msgs: List[MidiMessage]):
+        """複数のメッセージを順にローカルノードへ配信し、他プロセスへはまとめてUDPで送信する"""
+        for msg in msgs:
+            msg.source = sender.node_name
+        outgoing = sender.sequence_outgoing(msgs) if self.uplink is not None else None
+        for msg in msgs:
+            self._dispatch(msg)
+        if outgoing is not None:
+            self.send_remote(sender, outgoing)
+
+    def send_remote(self, sender: MidiNode, msgs: List[MidiMessage]):
+        """ローカルノードへは配信せず、他プロセスへだけUDPで送信する（1つなら単独、複数ならバッチ）"""
+        if self.uplink is None or not msgs:
+            return
+        if len(msgs) == 1:
+            self.uplink.sender.sendto(encode_message(msgs[0], sender.node_name, sender.wire_format), self.uplink.destination)
+            return
+        for data in encode_batch(msgs, sender.node_name, sender.wire_format):
+            self.uplink.sender.sendto(data, self.uplink.destination)
+
+    def receive_stats(self):
+        """他プロセスからの受信の計測結果（ReceiveStats）。ReceiveEngineで受信していない場合はNone"""
+        if self.uplink is None:
+            return None
+        return self.uplink.receive_stats()
+
+    def sequence_stats(self) -> Dict[str, "SequenceStats"]:
+        """他プロセスから受信したメッセージの、送信元ごとの連番の追跡結果"""
+        if self.uplink is None:
+            return {}
+        return self.uplink.sequences.stats()
+
+    def _on_remote_message(self, msg: MidiMessage):
+        """他プロセスから受信したメッセージをローカルノードへ配信する"""
+        # ローカルノードが送信したメッセージはすでに配信済み
+        if msg.source in self._local_names:
+            return
+        self._dispatch(msg)
+
+    def close(self):
+        """バスを終了"""
+        if self.uplink is not None:
+            self.uplink.close()
+
+
+@dataclass
+class SequenceStats:
+    """送信元1つ分の連番の追跡結果"""
+
+    received: int = 0  # 受け取ったメッセージ数（重複を除く）
+    lost: int = 0  # 連番の欠けから推定した、届いていないメッセージ数
+    duplicates: int = 0  # 捨てた重複（繰り返し送られた2回目以降）
+    reordered: int = 0  # 後から届いて欠けを埋めたメッセージ数
+    resets: int = 0  # 送信元の再起動などで連番が飛んだ回数
+
+
+class SequenceTracker:
+    """送信元ごとの連番から、欠落・重複・順序の入れ替わりを検出する。
+
+    最後に受け取った連番より先の連番は、間の数を欠落として数える。最後の連番より前でも直近WINDOW個以内で
+    まだ受け取っていないものは遅れて届いたとして受け取り（欠落から差し引く）、受け取り済みのものは重複として捨てる。
+    それ以上離れた連番は送信元が再起動したとみなして追跡し直す。受信スレッドからのみ呼ばれる。
+    """
+
+    WINDOW = 64  # 重複を判定する直近の連番の数
+    MAX_GAP = 1024  # 欠落とみなす連番の飛びの上限（超えた場合は送信元の再起動とみなす）
+
+    def __init__(self):
+        # 送信元 -> [最後の連番, 受け取った連番のビットマスク（ビットiが最後の連番 - i）, SequenceStats]
+        self._sources: Dict[Optional[str], List] = {}
+
+    def accept(self, source: Optional[str], seq: int) -> bool:
+        """連番のメッセージを受け取るかどうかを返す。重複の場合はFalse"""
+        state = self._sources.get(source)
+        if state is None:
+            # 最初の連番より前は受け取り済みとして扱う
+            self._sources[source] = [seq, (1 << self.WINDOW) - 1, SequenceStats(received=1)]
+            return True
+        highest, window, stats = state
+
+        ahead = (seq - highest) & SEQ_MASK
+        if ahead == 0:
+            stats.duplicates += 1
+            return False
+        if ahead <= self.MAX_GAP:
+            stats.lost += ahead - 1
+            state[0] = seq
+            state[1] = ((window << ahead) | 1) & ((1 << self.WINDOW) - 1)
+            stats.received += 1
+            return True
+
+        behind = (highest - seq) & SEQ_MASK
+        if behind < self.WINDOW:
+            bit = 1 << behind
+            if window & bit:
+                stats.duplicates += 1
+                return False
+            state[1] = window | bit
+            stats.lost -= 1
+            stats.reordered += 1
+            stats.received += 1
+            return True
+
+        stats.resets += 1
+        stats.received += 1
+        state[0] = seq
+        state[1] = (1 << self.WINDOW) - 1
+        return True
+
+    def stats(self) -> Dict[str, SequenceStats]:
+        """送信元ごとの追跡結果を返す"""
+        return {source: replace(state[2]) for source, state in list(self._sources.items())}
+
+
+@dataclass
+class SyncStats:
+    """マスタークロックとの同期状態の推定値"""
+
+    offset_ms: Optional[float]  # マスターの時計 - 自分の時計 (ms)
+    rtt_ms: Optional[float]  # 問い合わせの往復時間 (ms)
+    latency_ms: Optional[float]  # クロックの片道遅延 (ms)
+    bpm: Optional[float]  # クロック間隔から推定したテンポ
+    pings_sent: int  # 送信した問い合わせ数
+    pongs_received: int  # 受信した応答数
+    recovered_pulses: int  # 欠落を検出して補ったクロック数
+    flywheel_pulses: int  # クロックが途絶えた間に自走で生成したクロック数
+
+
+class ClockSync:
+    """マスタークロックとの時刻オフセット・往復時間・テンポを推定する。
+
+    NTPと同様に、フォロワーは送信時刻 t0 を付けた ping を送り、マスターは受信時刻 t1 を付けた pong を返す。
+    フォロワーが pong を受信した時刻を t3 とすると、往復時間は t3 - t0、オフセットは t1 - (t0 + t3) / 2 となる
+    （マスターはpingを受信スレッドで即座に返すため、処理時間は無視する）。
+    オフセットは直近の往復時間が最小のサンプルを採用し、キューイングによる誤差を抑える。
+
+    テンポはクロックのタイムスタンプ（なければ受信間隔）から推定する。クロックのタイムスタンプから
+    欠落したパルス数を求めて補い、クロックが途絶えた場合は推定したテンポで一定数のパルスを自走で生成する。
+    """
+
+    PPQ = 24
+
+    def __init__(
+        self,
+        master: bool = False,
+        ping_interval: Optional[float] = 1.0,
+        smoothing: float = 0.125,
+        filter_size: int = 8,
+        max_flywheel_pulses: int = 24,
+    ):
+        """時刻同期の初期化
+
+        Args:
+            master: Trueの場合、pingに応答する（リズムジェネレータ）
+            ping_interval: pingを送る間隔（秒）。Noneの場合は送らない
+            smoothing: 往復時間・遅延・クロック間隔の指数移動平均の係数
+            filter_size: オフセットの推定に使う直近のサンプル数
+            max_flywheel_pulses: クロックが途絶えた際に自走で生成する最大パルス数
+        """
+        self.master = master
+        self.ping_interval = ping_interval
+        self.smoothing = smoothing
+        self.max_flywheel_pulses = max_flywheel_pulses
+
+        self._lock = threading.Lock()
+        self._pending: Dict[int, float] = {}  # 問い合わせID -> 送信時刻
+        self._samples = []  # (往復時間, オフセット)
+        self._filter_size = filter_size
+        self._next_ping = 0.0
+
+        self.offset: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.interval: Optional[float] = None  # クロック間隔（秒）
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.recovered_pulses = 0
+        self.flywheel_pulses = 0
+
+        self._last_arrival: Optional[float] = None
+        self._last_timestamp: Optional[float] = None
+        self._synthetic = 0  # 自走で先に進めたパルス数
+
+    def poll(self, now: float) -> Optional[MidiMessage]:
+        """pingを送るタイミングであればpingメッセージを返す"""
+        if self.master or self.ping_interval is None or now < self._next_ping:
+            return None
+        self._next_ping = now + self.ping_interval
+
+        ping_id = random.getrandbits(31)
+        with self._lock:
+            # 応答のなかった古い問い合わせは捨てる
+            if len(self._pending) > 16:
+                self._pending.clear()
+            self._pending[ping_id] = now
+        self.pings_sent += 1
+        return MidiMessage(type=MIDI_PING, value=ping_id, timestamp=now)
+
+    def on_ping(self, msg: MidiMessage, now: float) -> Optional[MidiMessage]:
+        """pingを受信した。マスターの場合は応答するpongメッセージを返す。"""
+        if not self.master:
+            return None
+        return MidiMessage(type=MIDI_PONG, value=msg.value, timestamp=now)
+
+    def on_pong(self, msg: MidiMessage, now: float):
+        """pongを受信した。自分の問い合わせへの応答であれば推定値を更新する。"""
+        with self._lock:
+            sent = self._pending.pop(msg.value, None)
+            # 従来のJSON形式ではタイムスタンプを送れないため、応答時刻はcontrolで届く
+            master_time = msg.timestamp if msg.timestamp is not None else msg.control
+            if sent is None or master_time is None:
+                return
+            rtt = now - sent
+            offset = master_time - (sent + now) / 2
+
+            self._samples.append((rtt, offset))
+            if len(self._samples) > self._filter_size:
+                self._samples.pop(0)
+            self.offset = min(self._samples)[1]
+            self.rtt = rtt if self.rtt is None else self.rtt + (rtt - self.rtt) * self.smoothing
+            self.pongs_received += 1
+
+    def to_local_time(self, master_time: float) -> float:
+        """マスターの時計の時刻を自分の時計の時刻に換算する"""
+        return master_time - (self.offset or 0.0)
+
+    def reset_clock(self):
+        """start/stop時にクロックの追跡状態をリセットする"""
+        with self._lock:
+            self._last_arrival = None
+            self._last_timestamp = None
+            self._synthetic = 0
+
+    def on_clock(self, msg: MidiMessage, now: float) -> int:
+        """クロックを受信した。推定値を更新し、このクロックで進めるべきパルス数を返す。
+
+        タイムスタンプから前回のクロックとの間に欠落したパルスがあれば、その分を含めた数を返す。
+        自走で先に進めていた場合は、その分を差し引く（0の場合はこのクロックを処理しない）。
+        """
+        with self._lock:
+            pulses = 1
+            if msg.timestamp is not None and self._last_timestamp is not None and self.interval:
+                pulses = max(1, round((msg.timestamp - self._last_timestamp) / self.interval))
+
+            # 連続したクロックからのみ間隔を推定する
+            if pulses == 1:
+                if msg.timestamp is not None and self._last_timestamp is not None:
+                    sample = msg.timestamp - self._last_timestamp
+                elif self._last_arrival is not None:
+                    sample = now - self._last_arrival
+                else:
+                    sample = None
+                if sample is not None and sample > 0:
+                    self.interval = (
+                        sample if self.interval is None else self.interval + (sample - self.interval) * self.smoothing
+                    )
+
+            if msg.timestamp is not None and self.offset is not None:
+                latency = now - self.to_local_time(msg.timestamp)
+                self.latency = latency if self.latency is None else self.latency + (latency - self.latency) * self.smoothing
+
+            self._last_arrival = now
+            if msg.timestamp is not None:
+                self._last_timestamp = msg.timestamp
+
+            balance = pulses - self._synthetic
+            if balance >= 0:
+                self._synthetic = 0
+                self.recovered_pulses += max(0, balance - 1)
+                return balance
+            # 自走で先に進めすぎていた分は以降のクロックで相殺する
+            self._synthetic = -balance
+            return 0
+
+    def flywheel(self, now: float) -> int:
+        """クロックが途絶えている場合に、自走で進めるべきパルス数を返す"""
+        with self._lock:
+            if self.master or self.interval is None or self._last_arrival is None:
+                return 0
+            # 1.5間隔以上遅れたパルスを補う
+            due = int((now - self._last_arrival) / self.interval - 0.5)
+            due = min(due, self.max_flywheel_pulses)
+            count = due - self._synthetic
+            if count <= 0:
+                return 0
+            self._synthetic += count
+            self.flywheel_pulses += count
+            return count
+
+    @property
+    def bpm(self) -> Optional[float]:
+        """クロック間隔から推定したテンポ"""
+        if not self.interval:
+            return None
+        return 60.0 / (self.interval * self.PPQ)
+
+    def stats(self) -> SyncStats:
+        """推定値を返す"""
+        return SyncStats(
+            offset_ms=self.offset * 1e3 if self.offset is not None else None,
+            rtt_ms=self.rtt * 1e3 if self.rtt is not None else None,
+            latency_ms=self.latency * 1e3 if self.latency is not None else None,
+            bpm=self.bpm,
+            pings_sent=self.pings_sent,
+            pongs_received=self.pongs_received,
+            recovered_pulses=self.recovered_pulses,
+            flywheel_pulses=self.flywheel_pulses,
+        )
 
 
 # MIDIメッセージタイプ
@@ -94,3 +857,317 @@ MIDI_START = "start"  # 再生開始
 MIDI_STOP = "stop"  # 再生停止
 MIDI_CONTINUE = "continue"  # 再開
 MIDI_SONG_POSITION = "song_position"  # 曲位置
+MIDI_NOTE_ON = "note_on"  # ノートオン
+MIDI_NOTE_OFF = "note_off"  # ノートオフ
+MIDI_CONTROL_CHANGE = "control_change"  # コントロールチェンジ
+MIDI_PROGRAM_CHANGE = "program_change"  # プログラムチェンジ
+MIDI_PING = "ping"  # 時刻同期の問い合わせ（value: 問い合わせID, timestamp: 送信時刻）
+MIDI_PONG = "pong"  # 時刻同期の応答（value: 問い合わせID, timestamp: マスターの受信時刻。従来のJSON形式ではcontrol）
+
+# 失うとフォロワーの再生状態がずれるため、reliable指定時に繰り返し送るメッセージタイプ
+TRANSPORT_MESSAGES = frozenset([MIDI_START, MIDI_STOP, MIDI_CONTINUE, MIDI_SONG_POSITION])
+
+# 連番の範囲（32ビットで一周する）
+SEQ_MASK = 0xFFFFFFFF
+
+
+# ワイヤーフォーマット
+WIRE_FORMAT_JSON = "json"  # 従来のJSON形式（既定）。タイムスタンプと連番は含めない
+WIRE_FORMAT_JSON_EXT = "json-ext"  # タイムスタンプと連番も含めるJSON形式（受信側がすべてこの版以降の場合のみ）
+WIRE_FORMAT_BINARY = "binary"  # 固定レイアウトのバイナリ形式
+WIRE_FORMATS = (WIRE_FORMAT_JSON, WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY)
+
+# 従来のJSON形式では送らないフィールド。従来のノードは `MidiMessage(**辞書)` で復元するため、
+# 知らないキーがあると受信できない（バイナリ形式ではフラグ付きの拡張フィールドとして読み飛ばされる）
+JSON_EXTENSION_FIELDS = frozenset(["timestamp", "seq"])
+
+# バイナリ形式のヘッダ
+# JSONの先頭バイト "{" (0x7B) と衝突しない値を先頭に置き、受信側で形式を判別する
+BINARY_MAGIC = 0xF5
+BINARY_VERSION = 1
+_BINARY_PREFIX = bytes([BINARY_MAGIC])
+
+# バッチ（複数メッセージを1データグラムにまとめたもの）のヘッダ
+BATCH_MAGIC = 0xF6
+_BATCH_PREFIX = bytes([BATCH_MAGIC])
+# magic, version, メッセージ数
+_BATCH_HEADER = struct.Struct("!BBB")
+# 各メッセージの長さ
+_BATCH_LENGTH = struct.Struct("!H")
+
+# 1データグラムの最大サイズ（受信バッファの大きさ）
+MAX_DATAGRAM_SIZE = 1024
+
+# メッセージタイプとMIDIステータスバイトの対応
+MESSAGE_STATUS = {
+    MIDI_NOTE_OFF: 0x80,
+    MIDI_NOTE_ON: 0x90,
+    MIDI_CONTROL_CHANGE: 0xB0,
+    MIDI_PROGRAM_CHANGE: 0xC0,
+    MIDI_SONG_POSITION: 0xF2,
+    MIDI_CLOCK: 0xF8,
+    MIDI_START: 0xFA,
+    MIDI_CONTINUE: 0xFB,
+    MIDI_STOP: 0xFC,
+    # MIDIで未定義のシステムリアルタイムメッセージを時刻同期に流用
+    MIDI_PING: 0xF9,
+    MIDI_PONG: 0xFD,
+}
+STATUS_MESSAGE = {status: msg_type for msg_type, status in MESSAGE_STATUS.items()}
+
+# フィールドの有無を表すフラグ
+_FLAG_CHANNEL = 0x01
+_FLAG_NOTE = 0x02
+_FLAG_VELOCITY = 0x04
+_FLAG_CONTROL = 0x08
+_FLAG_VALUE = 0x10
+_FLAG_TIMESTAMP = 0x20
+_FLAG_SEQ = 0x40
+
+# 送信元名の後ろに続く拡張フィールド（フラグの順に並ぶ）
+_TIMESTAMP_FIELD = struct.Struct("!d")
+_SEQ_FIELD = struct.Struct("!I")
+_EXTENSIONS = [
+    (_FLAG_TIMESTAMP, "timestamp", _TIMESTAMP_FIELD),
+    (_FLAG_SEQ, "seq", _SEQ_FIELD),
+]
+
+# magic, version, status, flags, channel, note, velocity, control, value, source長
+_BINARY_HEADER = struct.Struct("!BBBBBBBBiB")
+BINARY_HEADER_SIZE = _BINARY_HEADER.size
+
+# 送信元名のエンコード/デコード結果のキャッシュ（ノード名の種類は少ない）
+_source_bytes_cache: Dict[str, bytes] = {}
+_source_str_cache: Dict[bytes, str] = {}
+
+
+def _source_str(source_bytes: bytes) -> str:
+    """送信元名をデコードする（キャッシュを使う）"""
+    source = _source_str_cache.get(source_bytes)
+    if source is None:
+        source = source_bytes.decode()
+        if len(_source_str_cache) < 256:
+            _source_str_cache[source_bytes] = source
+    return source
+
+
+def _encode_binary(msg: MidiMessage, source: Optional[str]) -> Optional[bytes]:
+    """MidiMessageをバイナリ形式に変換する。表現できない場合はNoneを返す。"""
+    status = MESSAGE_STATUS.get(msg.type)
+    if status is None:
+        return None
+
+    flags = 0
+    if msg.channel is not None:
+        flags |= _FLAG_CHANNEL
+    if msg.note is not None:
+        flags |= _FLAG_NOTE
+    if msg.velocity is not None:
+        flags |= _FLAG_VELOCITY
+    if msg.control is not None:
+        flags |= _FLAG_CONTROL
+    if msg.value is not None:
+        flags |= _FLAG_VALUE
+
+    extensions = b""
+    for flag, name, field in _EXTENSIONS:
+        ext_value = getattr(msg, name)
+        if ext_value is not None:
+            flags |= flag
+            extensions += field.pack(ext_value)
+
+    source_bytes = b""
+    if source is not None:
+        source_bytes = _source_bytes_cache.get(source)
+        if source_bytes is None:
+            source_bytes = source.encode()[:255]
+            _source_bytes_cache[source] = source_bytes
+
+    header = _BINARY_HEADER.pack(
+        BINARY_MAGIC,
+        BINARY_VERSION,
+        status,
+        flags,
+        msg.channel or 0,
+        msg.note or 0,
+        msg.velocity or 0,
+        msg.control or 0,
+        msg.value or 0,
+        len(source_bytes),
+    )
+    return header + source_bytes + extensions
+
+
+def _decode_binary(data: bytes) -> MidiMessage:
+    """バイナリ形式のパケットをMidiMessageに変換する"""
+    magic, version, status, flags, channel, note, velocity, control, value, source_len = _BINARY_HEADER.unpack_from(data)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported binary wire version: {version}")
+    msg_type = STATUS_MESSAGE.get(status)
+    if msg_type is None:
+        raise ValueError(f"Unknown MIDI status: {status:#x}")
+
+    source = None
+    if source_len:
+        source = _source_str(data[BINARY_HEADER_SIZE : BINARY_HEADER_SIZE + source_len])
+
+    msg = MidiMessage(
+        type=msg_type,
+        note=note if flags & _FLAG_NOTE else None,
+        velocity=velocity if flags & _FLAG_VELOCITY else None,
+        channel=channel if flags & _FLAG_CHANNEL else None,
+        control=control if flags & _FLAG_CONTROL else None,
+        value=value if flags & _FLAG_VALUE else None,
+        source=source,
+    )
+
+    offset = BINARY_HEADER_SIZE + source_len
+    for flag, name, field in _EXTENSIONS:
+        if flags & flag:
+            setattr(msg, name, field.unpack_from(data, offset)[0])
+            offset += field.size
+    return msg
+
+
+def encode_message(msg: MidiMessage, source: Optional[str] = None, wire_format: str = WIRE_FORMAT_JSON) -> bytes:
+    """MidiMessageを送信用のバイト列に変換する
+
+    Args:
+        msg: 変換するMIDIメッセージ
+        source: 送信元ノード名。Noneの場合はmsg.sourceを使う
+        wire_format: WIRE_FORMAT_JSON / WIRE_FORMAT_JSON_EXT / WIRE_FORMAT_BINARY。
+            バイナリで表現できないメッセージタイプは従来のJSON形式で送信する
+
+    Returns:
+        bytes: 送信するパケット
+    """
+    if source is None:
+        source = msg.source
+
+    if wire_format == WIRE_FORMAT_BINARY:
+        data = _encode_binary(msg, source)
+        if data is not None:
+            return data
+
+    # 値のないフィールドは省略する（受信側では既定値のNoneになるため、古いノードとも互換）
+    if wire_format != WIRE_FORMAT_JSON_EXT:
+        msg_dict = {
+            key: value for key, value in msg.__dict__.items() if value is not None and key not in JSON_EXTENSION_FIELDS
+        }
+        if msg.type == MIDI_PONG and msg.timestamp is not None:
+            # 時刻同期の応答時刻は従来のノードも受け付けるcontrolで運ぶ（ClockSync.on_pong()が読む）
+            msg_dict["control"] = msg.timestamp
+    else:
+        msg_dict = {key: value for key, value in msg.__dict__.items() if value is not None}
+    msg_dict["source"] = source
+    return json.dumps(msg_dict).encode()
+
+
+def decode_message(data: bytes) -> MidiMessage:
+    """受信したパケットをMidiMessageに変換する。形式は先頭バイトで自動判別する。
+
+    Args:
+        data: 受信したパケット
+
+    Returns:
+        MidiMessage: 復元したMIDIメッセージ
+
+    Raises:
+        ValueError: パケットが不正な場合 (json.JSONDecodeErrorを含む)
+        struct.error: バイナリパケットが短すぎる場合
+    """
+    if data and data[0] == BINARY_MAGIC:
+        return _decode_binary(data)
+    return MidiMessage(**json.loads(data.decode()))
+
+
+def encode_batch(msgs: List[MidiMessage], source: Optional[str] = None, wire_format: str = WIRE_FORMAT_JSON) -> List[bytes]:
+    """複数のMidiMessageを送信用のデータグラムにまとめる
+
+    WIRE_FORMAT_JSON_EXTではメッセージの配列、バイナリ形式では各メッセージのパケットを長さ付きで連結する。
+    MAX_DATAGRAM_SIZEを超える場合は複数のデータグラムに分割する。
+    WIRE_FORMAT_JSONでは従来のノードが配列を受信できないため、1メッセージずつのデータグラムにする。
+
+    Args:
+        msgs: 変換するMIDIメッセージのリスト
+        source: 送信元ノード名。Noneの場合は各メッセージのsourceを使う
+        wire_format: WIRE_FORMAT_JSON / WIRE_FORMAT_JSON_EXT / WIRE_FORMAT_BINARY
+
+    Returns:
+        List[bytes]: 送信するデータグラムのリスト
+    """
+    if wire_format == WIRE_FORMAT_BINARY:
+        packets = [encode_message(msg, source, wire_format) for msg in msgs]
+        datagrams = []
+        chunk = []
+        size = _BATCH_HEADER.size
+        for packet in packets:
+            item_size = _BATCH_LENGTH.size + len(packet)
+            if chunk and (size + item_size > MAX_DATAGRAM_SIZE or len(chunk) == 255):
+                datagrams.append(_join_batch(chunk))
+                chunk = []
+                size = _BATCH_HEADER.size
+            chunk.append(packet)
+            size += item_size
+        if chunk:
+            datagrams.append(_join_batch(chunk))
+        return datagrams
+
+    items = [encode_message(msg, source, wire_format) for msg in msgs]
+    if wire_format != WIRE_FORMAT_JSON_EXT:
+        return items
+    datagrams = []
+    chunk = []
+    size = 2  # "[" と "]"
+    for item in items:
+        item_size = len(item) + (2 if chunk else 0)  # 区切りの ", "
+        if chunk and size + item_size > MAX_DATAGRAM_SIZE:
+            datagrams.append(b"[" + b", ".join(chunk) + b"]")
+            chunk = []
+            size = 2
+            item_size = len(item)
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        datagrams.append(b"[" + b", ".join(chunk) + b"]")
+    return datagrams
+
+
+def _join_batch(packets: List[bytes]) -> bytes:
+    """バイナリのバッチを組み立てる"""
+    parts = [_BATCH_HEADER.pack(BATCH_MAGIC, BINARY_VERSION, len(packets))]
+    for packet in packets:
+        parts.append(_BATCH_LENGTH.pack(len(packet)))
+        parts.append(packet)
+    return b"".join(parts)
+
+
+def split_batch(data: bytes) -> List[bytes]:
+    """バイナリのバッチを1メッセージずつのパケットに分割する
+
+    Raises:
+        ValueError: バッチが不正な場合
+    """
+    magic, version, count = _BATCH_HEADER.unpack_from(data)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported batch version: {version}")
+
+    packets = []
+    offset = _BATCH_HEADER.size
+    for _ in range(count):
+        (length,) = _BATCH_LENGTH.unpack_from(data, offset)
+        offset += _BATCH_LENGTH.size
+        packets.append(data[offset : offset + length])
+        offset += length
+    if offset != len(data):
+        raise ValueError("Malformed batch")
+    return packets
+
+
+def decode_packet(data: bytes) -> List[MidiMessage]:
+    """受信したパケットを、バッチかどうかにかかわらずMidiMessageのリストに変換する"""
+    if data[:1] == _BATCH_PREFIX:
+        return [decode_message(packet) for packet in split_batch(data)]
+    if data[:1] == b"[":
+        return [MidiMessage(**msg_dict) for msg_dict in json.loads(data.decode())]
+    return [decode_message(data)]
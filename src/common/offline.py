@@ -0,0 +1,221 @@
+"""仮想時間によるオフラインレンダリング
+
+使い方:
+    python -m src.common.offline src.nodes._0004_video:VideoNode src.nodes._0003_advanced_rhythm:AdvancedRhythmNode \
+        --bpm 128 --beats 64 --frames-dir frames --note-log notes.pxlog
+"""
+
+import argparse
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from src.common.host import NodeHost, NodeSpec, load_node_class
+from src.common.midi_utils import MidiMessage, MidiNode, MIDI_CLOCK, MIDI_START, MIDI_STOP
+from src.common.pyxel_backend import pyxel
+from src.common.recorder import BusRecorder
+
+
+@dataclass
+class RenderStats:
+    """オフラインレンダリングの結果"""
+
+    pulses: int  # 送出したクロック数
+    frames: int  # 更新したフレーム数
+    captured: int  # 保存した画像の数
+    simulated_sec: float  # 仮想時間での長さ（秒）
+    elapsed_sec: float  # 実際にかかった時間（秒）
+
+    @property
+    def speedup(self) -> float:
+        """実時間に対する速さの倍率"""
+        return self.simulated_sec / self.elapsed_sec if self.elapsed_sec > 0 else float("inf")
+
+
+class OfflineRenderer:
+    """ノードを実時間ではなく仮想時間で、CPUが許す限りの速さで動かす。
+
+    ノードは `NodeHost` と同じくプロセス内のバス（UDPなし）でつなぎ、クロックはレンダラが仮想時間の
+    パルス時刻に送る（`RhythmGeneratorNode` がある場合は、そのノードのテンポと送信元名を使い、
+    クロックエンジンのスレッドは使わない）。パルスごとに各ノードの受信キューを処理し、フレーム時刻ごとに
+    update() を呼ぶため、ノードから見たメッセージとフレームの順序は実時間で動かした場合と同じになる。
+
+    フレームごとに指定したノードの draw() をメモリ上の画面に描画してPNGで保存でき、
+    バスを流れたメッセージは仮想時間のタイムスタンプ付きで `BusRecorder` のログに記録できる。
+    ノードは仮想時間で動くため、lookaheadや時刻同期など実時間に依存するオプションは使わないこと。
+    """
+
+    def __init__(
+        self,
+        node_specs: Iterable[NodeSpec],
+        bpm: Optional[float] = None,
+        fps: int = 30,
+        frames_dir: Optional[str] = None,
+        capture: Optional[List[str]] = None,
+        note_log: Optional[str] = None,
+        scale: int = 1,
+    ):
+        """オフラインレンダリングの初期化
+
+        Args:
+            node_specs: ノードクラス、または (ノードクラス, 追加のキーワード引数) のリスト
+            bpm: テンポ。Noneの場合はRhythmGeneratorNodeのテンポ（なければ120）
+            fps: 仮想時間での1秒あたりのフレーム数
+            frames_dir: フレームの画像を保存するディレクトリ。Noneの場合は保存しない
+            capture: 画像を保存するノード名の一覧。Noneの場合はすべてのノード
+            note_log: バスを流れたメッセージを記録するログファイル。Noneの場合は記録しない
+            scale: 保存する画像の拡大率
+        """
+        # 描画をメモリ上の画面に行うため、ノードの作成前にヘッドレスモードにする
+        pyxel.use_headless()
+        self.host = NodeHost(node_specs, fps=fps, remote=False)
+        self.fps = fps
+        self.frames_dir = frames_dir
+        self.scale = scale
+        self.now = 0.0  # 仮想時間（秒）
+
+        self.capture_nodes = [node for node in self.host.nodes if capture is None or node.name in capture]
+        if frames_dir is not None:
+            os.makedirs(frames_dir, exist_ok=True)
+
+        # クロックの送信元。RhythmGeneratorNode（クロックエンジンを持つノード）があればそのMIDIノードから送る
+        self.generator = next((node for node in self.host.nodes if hasattr(node, "clock_engine")), None)
+        if self.generator is not None:
+            # 実時間のクロックエンジンで再生を始めないようにする
+            self.generator.autostart = False
+            self.clock_source = self.generator.midi_node
+            self.bpm = bpm or self.generator.bpm
+        else:
+            self.clock_source = MidiNode("offlineclock", lambda msg: None, bus=self.host.bus)
+            self.bpm = bpm or 120
+
+        self.recorder = None
+        self._log_node = None
+        if note_log is not None:
+            self.recorder = BusRecorder(note_log)
+            self._log_node = MidiNode("offlinelog", self._record, bus=self.host.bus)
+
+    def _record(self, msg: MidiMessage):
+        self.recorder.write_message(msg, self.now)
+
+    def _send(self, msg: MidiMessage):
+        """仮想時間のタイムスタンプを付けて送信し、すぐに各ノードで処理する"""
+        msg.timestamp = self.now
+        self.clock_source.send_message(msg)
+        if self.generator is not None and msg.type == MIDI_CLOCK:
+            self.generator.ppq_count = (self.generator.ppq_count + 1) % 24
+        self.host.process_messages()
+
+    def render(self, beats: Optional[float] = None, duration: Optional[float] = None) -> RenderStats:
+        """指定した拍数または秒数だけ再生した場合の処理を仮想時間で行う
+
+        Args:
+            beats: 再生する拍数
+            duration: 再生する秒数（beatsを指定しない場合）
+        """
+        interval = 60.0 / (self.bpm * 24)
+        if beats is not None:
+            duration = beats * 24 * interval
+        if duration is None:
+            raise ValueError("beats or duration is required")
+
+        start = time.perf_counter()
+        total_frames = math.ceil(duration * self.fps)
+        pulses = 0
+        captured = 0
+
+        if self.generator is not None:
+            self.generator.running = True
+            self.generator.ppq_count = 0
+        self.now = 0.0
+        self._send(MidiMessage(type=MIDI_START))
+
+        for frame in range(total_frames):
+            frame_time = frame / self.fps
+            # フレーム時刻までのクロックを送る（最初のクロックは開始から1パルス後）
+            while (pulses + 1) * interval <= frame_time:
+                pulses += 1
+                self.now = pulses * interval
+                self._send(MidiMessage(type=MIDI_CLOCK))
+
+            self.now = frame_time
+            self.host.step()
+            if self.frames_dir is not None:
+                captured += self._capture(frame)
+
+        # 最後のフレーム以降、終了時刻までのクロック
+        while (pulses + 1) * interval <= duration:
+            pulses += 1
+            self.now = pulses * interval
+            self._send(MidiMessage(type=MIDI_CLOCK))
+
+        self.now = duration
+        if self.generator is not None:
+            self.generator.running = False
+        self._send(MidiMessage(type=MIDI_STOP))
+
+        return RenderStats(
+            pulses=pulses,
+            frames=total_frames,
+            captured=captured,
+            simulated_sec=duration,
+            elapsed_sec=time.perf_counter() - start,
+        )
+
+    def _capture(self, frame: int) -> int:
+        """ノードごとにdraw()を描画して画像を保存する"""
+        for node in self.capture_nodes:
+            # ノードごとにウィンドウサイズが異なるため、画面を作り直す
+            pyxel.init(node.window_width, node.window_height)
+            node.draw()
+            pyxel.screen.save(os.path.join(self.frames_dir, f"{node.name}_{frame:06d}.png"), self.scale)
+        return len(self.capture_nodes)
+
+    def close(self):
+        """ノードとログを終了する"""
+        if self._log_node is not None:
+            self._log_node.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.generator is None:
+            self.clock_source.close()
+        self.host.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ノードを仮想時間で実時間より速く動かす")
+    parser.add_argument("nodes", nargs="+", help="実行するノードクラス (例: src.nodes._0004_video:VideoNode)")
+    parser.add_argument("--bpm", type=float, help="テンポ")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--beats", type=float, help="再生する拍数")
+    length.add_argument("--duration", type=float, help="再生する秒数")
+    parser.add_argument("--fps", type=int, default=30, help="仮想時間での1秒あたりのフレーム数")
+    parser.add_argument("--frames-dir", help="フレームの画像（PNG）を保存するディレクトリ")
+    parser.add_argument("--capture", nargs="*", help="画像を保存するノード名（既定はすべて）")
+    parser.add_argument("--scale", type=int, default=1, help="保存する画像の拡大率")
+    parser.add_argument("--note-log", help="バスを流れたメッセージを記録するログファイル")
+    args = parser.parse_args()
+
+    renderer = OfflineRenderer(
+        [load_node_class(path) for path in args.nodes],
+        bpm=args.bpm,
+        fps=args.fps,
+        frames_dir=args.frames_dir,
+        capture=args.capture,
+        note_log=args.note_log,
+        scale=args.scale,
+    )
+    try:
+        stats = renderer.render(beats=args.beats, duration=args.duration)
+    finally:
+        renderer.close()
+    print(
+        f"{stats.simulated_sec:.1f}s ({stats.pulses} pulses, {stats.frames} frames, {stats.captured} images) "
+        f"rendered in {stats.elapsed_sec:.2f}s ({stats.speedup:.0f}x real time)"
+    )
+
+
+if __name__ == "__main__":
+    main()
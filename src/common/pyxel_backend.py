@@ -0,0 +1,346 @@
+import ctypes
+import importlib
+import math
+import re
+import struct
+import zlib
+from functools import lru_cache
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:  # NumPyがない環境では1行ずつ転送する
+    np = None
+
+# Pyxelの既定のパレット（0xRRGGBB）
+DEFAULT_PALETTE = [
+    0x000000,
+    0x2B335F,
+    0x7E2072,
+    0x19959C,
+    0x8B4852,
+    0x395C98,
+    0xA9C1FF,
+    0xEEEEEE,
+    0xD4186C,
+    0xD38441,
+    0xE9C35B,
+    0x70C6A9,
+    0x7696DE,
+    0xA3A3A3,
+    0xFF9798,
+    0xEDC7B0,
+]
+
+
+class HeadlessSound:
+    """ヘッドレスモード用のサウンド。設定値を保持するだけで音は鳴らさない。"""
+
+    def __init__(self):
+        self.notes = ""
+        self.tones = ""
+        self.volumes = ""
+        self.effects = ""
+        self.speed = 0
+
+    def set(self, notes: str, tones: str, volumes: str, effects: str, speed: int):
+        self.notes = notes
+        self.tones = tones
+        self.volumes = volumes
+        self.effects = effects
+        self.speed = speed
+
+
+@lru_cache(maxsize=None)
+def _circle_spans(r: int) -> List[int]:
+    """半径rの円の、中心からの各行（0..r）の半幅。pyxel.circと同じ形（半径15まで一致）になるよう求める"""
+    half = [math.floor(math.sqrt(r * r - d * d) + 0.5) for d in range(r + 1)]
+    spans = []
+    for dy in range(r + 1):
+        width = half[dy]
+        for dx in range(r + 1):
+            if half[dx] >= dy:
+                width = max(width, dx)
+        spans.append(width)
+    return spans
+
+
+class HeadlessImage:
+    """ヘッドレスモード用の画像。パレット番号（0-15）を1ピクセル1バイトでメモリ上に保持する。
+
+    `pyxel.Image` のうちノードが使う図形描画に対応し、`data_ptr()` でピクセルバッファを直接操作できる。
+    文字の描画（text）はフォントを持たないため何もしない。
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.data = bytearray(width * height)
+
+    def data_ptr(self):
+        """ピクセルバッファ（ctypesのuint8配列）"""
+        return (ctypes.c_uint8 * len(self.data)).from_buffer(self.data)
+
+    def _hline(self, x1: int, x2: int, y: int, col: int):
+        """y行目のx1からx2まで（両端を含む）を塗る。画面外は切り捨てる"""
+        if y < 0 or y >= self.height:
+            return
+        x1 = max(x1, 0)
+        x2 = min(x2, self.width - 1)
+        if x1 > x2:
+            return
+        offset = y * self.width
+        self.data[offset + x1 : offset + x2 + 1] = bytes((col,)) * (x2 - x1 + 1)
+
+    def cls(self, col: int):
+        self.data[:] = bytes((col,)) * len(self.data)
+
+    def pget(self, x, y) -> int:
+        x, y = int(x), int(y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.data[y * self.width + x]
+        return 0
+
+    def pset(self, x, y, col: int):
+        x, y = int(x), int(y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.data[y * self.width + x] = col
+
+    def line(self, x1, y1, x2, y2, col: int):
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        steps = max(abs(x2 - x1), abs(y2 - y1))
+        for i in range(steps + 1):
+            t = i / steps if steps else 0.0
+            self.pset(math.floor(x1 + (x2 - x1) * t + 0.5), math.floor(y1 + (y2 - y1) * t + 0.5), col)
+
+    def rect(self, x, y, w, h, col: int):
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        for row in range(y, y + h):
+            self._hline(x, x + w - 1, row, col)
+
+    def rectb(self, x, y, w, h, col: int):
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        if w <= 0 or h <= 0:
+            return
+        self._hline(x, x + w - 1, y, col)
+        self._hline(x, x + w - 1, y + h - 1, col)
+        for row in range(y + 1, y + h - 1):
+            self.pset(x, row, col)
+            self.pset(x + w - 1, row, col)
+
+    def circ(self, x, y, r, col: int):
+        x, y, r = int(x), int(y), int(r)
+        if r < 0:
+            return
+        for dy, width in enumerate(_circle_spans(r)):
+            self._hline(x - width, x + width, y - dy, col)
+            if dy:
+                self._hline(x - width, x + width, y + dy, col)
+
+    def circb(self, x, y, r, col: int):
+        x, y, r = int(x), int(y), int(r)
+        if r < 0:
+            return
+        spans = _circle_spans(r) + [-1]
+        for dy in range(r + 1):
+            # 外側の行より外にはみ出す部分と、行の両端が輪郭
+            width = spans[dy]
+            inner = min(spans[dy + 1], width - 1)
+            for row in {y - dy, y + dy}:
+                self._hline(x - width, x - inner - 1, row, col)
+                self._hline(x + inner + 1, x + width, row, col)
+
+    def text(self, x, y, s, col):
+        pass
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None, **kwargs):
+        """画像imgの (u, v) から幅w・高さhの範囲を (x, y) に転送する。colkeyの色は転送しない（反転・回転は未対応）"""
+        x, y, u, v, w, h = int(x), int(y), int(u), int(v), int(w), int(h)
+        # 転送元・転送先のどちらかからはみ出す部分を切り捨てる
+        left = max(0, -x, -u)
+        top = max(0, -y, -v)
+        w = min(w, self.width - x, img.width - u)
+        h = min(h, self.height - y, img.height - v)
+        if left >= w or top >= h:
+            return
+        if colkey is not None and np is not None:
+            # 透明色以外のピクセルをまとめて転送する
+            src = np.frombuffer(img.data, dtype=np.uint8).reshape(img.height, img.width)[v + top : v + h, u + left : u + w]
+            dst = np.frombuffer(self.data, dtype=np.uint8).reshape(self.height, self.width)[y + top : y + h, x + left : x + w]
+            np.copyto(dst, src, where=src != colkey)
+            return
+        opaque = None if colkey is None else re.compile(b"[^" + re.escape(bytes((colkey,))) + b"]+")
+        for row in range(top, h):
+            src = (v + row) * img.width + u
+            dst = (y + row) * self.width + x
+            if opaque is None:
+                self.data[dst + left : dst + w] = img.data[src + left : src + w]
+                continue
+            # 透明色以外が続く区間だけを転送する
+            line = img.data[src + left : src + w]
+            for match in opaque.finditer(line):
+                start, end = match.span()
+                self.data[dst + left + start : dst + left + end] = line[start:end]
+
+    def save(self, filename: str, scale: int = 1, palette: List[int] = DEFAULT_PALETTE):
+        """パレットを適用してPNG形式で保存する"""
+        rows = []
+        for y in range(self.height):
+            row = self.data[y * self.width : (y + 1) * self.width]
+            if scale > 1:
+                scaled = bytearray(len(row) * scale)
+                for i in range(scale):
+                    scaled[i::scale] = row
+                row = scaled
+            rows.extend([b"\x00" + bytes(row)] * scale)
+
+        def chunk(kind: bytes, body: bytes) -> bytes:
+            return struct.pack("!I", len(body)) + kind + body + struct.pack("!I", zlib.crc32(kind + body))
+
+        width, height = self.width * scale, self.height * scale
+        plte = b"".join(color.to_bytes(3, "big") for color in palette)
+        with open(filename, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+            f.write(chunk(b"PLTE", plte))
+            f.write(chunk(b"IDAT", zlib.compress(b"".join(rows), 1)))
+            f.write(chunk(b"IEND", b""))
+
+
+class HeadlessPyxel:
+    """ウィンドウを開かずに動作するPyxel互換のスタブ。
+
+    ノードが使うPyxelのAPIのうち、音声は何もせず、入力は常に未入力として扱う。
+    描画はメモリ上の画面（`screen`、`HeadlessImage`）に行うため、オフラインレンダリングでフレームを保存できる
+    （ヘッドレスモードの実行ループはdraw()を呼ばないので、通常は描画のコストはかからない）。
+    """
+
+    NUM_SOUNDS = 64
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.frame_count = 0
+        self.mouse_x = 0
+        self.mouse_y = 0
+        self.Sound = HeadlessSound
+        self.Image = HeadlessImage
+        self.images = [HeadlessImage(256, 256) for _ in range(3)]
+        self.sounds = [HeadlessSound() for _ in range(self.NUM_SOUNDS)]
+        self.screen = HeadlessImage(0, 0)
+
+    def __getattr__(self, name):
+        # KEY_SPACE などの定数。入力は常に未入力なので値は何でもよい
+        if name.isupper():
+            return 0
+        raise AttributeError(name)
+
+    def init(self, width: int, height: int, **kwargs):
+        self.width = width
+        self.height = height
+        self.screen = HeadlessImage(width, height)
+
+    def run(self, update, draw):
+        raise RuntimeError("Headless mode is driven by Node.run()")
+
+    def quit(self):
+        pass
+
+    # 入力
+    def btn(self, key) -> bool:
+        return False
+
+    def btnp(self, key, hold=None, repeat=None) -> bool:
+        return False
+
+    def btnr(self, key) -> bool:
+        return False
+
+    def mouse(self, visible: bool):
+        pass
+
+    # 描画（画面に委譲）
+    def cls(self, col):
+        self.screen.cls(col)
+
+    def pget(self, x, y):
+        return self.screen.pget(x, y)
+
+    def pset(self, x, y, col):
+        self.screen.pset(x, y, col)
+
+    def line(self, x1, y1, x2, y2, col):
+        self.screen.line(x1, y1, x2, y2, col)
+
+    def rect(self, x, y, w, h, col):
+        self.screen.rect(x, y, w, h, col)
+
+    def rectb(self, x, y, w, h, col):
+        self.screen.rectb(x, y, w, h, col)
+
+    def circ(self, x, y, r, col):
+        self.screen.circ(x, y, r, col)
+
+    def circb(self, x, y, r, col):
+        self.screen.circb(x, y, r, col)
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None, **kwargs):
+        # 画像バンクの番号も受け付ける
+        self.screen.blt(x, y, self.images[img] if isinstance(img, int) else img, u, v, w, h, colkey)
+
+    def text(self, x, y, s, col):
+        pass
+
+    # 音声
+    def play(self, ch, snd, **kwargs):
+        pass
+
+    def stop(self, ch=None):
+        pass
+
+
+class PyxelBackend:
+    """ノードが使うPyxelの実体を切り替えるプロキシ。
+
+    通常は本物の `pyxel` モジュールに委譲し、ヘッドレスモードでは `HeadlessPyxel` に委譲する。
+    本物のpyxelは最初に使われた時点でimportするため、ヘッドレスモードではpyxelがなくても動作する。
+    関数と定数は初回参照時にキャッシュし、2回目以降はプロキシを経由しない。
+    """
+
+    def __init__(self):
+        self.__dict__["_impl"] = None
+        self.__dict__["headless"] = False
+
+    def use_headless(self):
+        """ヘッドレスモードに切り替える。プロセス内のすべてのノードに影響する。"""
+        if not self.headless:
+            self._switch(HeadlessPyxel(), True)
+
+    def use_pyxel(self):
+        """本物のpyxelに切り替える"""
+        self._switch(importlib.import_module("pyxel"), False)
+
+    def _switch(self, impl, headless: bool):
+        self.__dict__.clear()
+        self.__dict__["_impl"] = impl
+        self.__dict__["headless"] = headless
+
+    def __getattr__(self, name):
+        impl = self.__dict__["_impl"]
+        if impl is None:
+            self.use_pyxel()
+            impl = self.__dict__["_impl"]
+
+        value = getattr(impl, name)
+        # frame_count や mouse_x のように毎フレーム変わる値はキャッシュしない
+        if callable(value) or name.isupper():
+            self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        if self.__dict__["_impl"] is None:
+            self.use_pyxel()
+        setattr(self.__dict__["_impl"], name, value)
+
+
+pyxel = PyxelBackend()
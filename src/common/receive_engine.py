@@ -0,0 +1,230 @@
+import selectors
+import socket
+import struct
+import sys
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from src.common.midi_utils import MAX_DATAGRAM_SIZE
+
+# 受信バッファが溢れてカーネルが捨てたデータグラム数を、受信ごとに補助データで受け取るソケットオプション（Linuxのみ）
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+_DROPS_FIELD = struct.Struct("I")
+
+# 既定の受信バッファの大きさ（クロックとノートのバーストを溜めておける程度）
+DEFAULT_RCVBUF = 1 << 20
+
+
+@dataclass
+class ReceiveStats:
+    """ソケット1つ分の受信の計測結果"""
+
+    datagrams: int = 0  # 受信したデータグラム数
+    wakeups: int = 0  # 受信可能になって読み出した回数
+    max_batch: int = 0  # 1回の読み出しで受信した最大のデータグラム数
+    kernel_drops: int = 0  # 受信バッファが溢れてカーネルが捨てたデータグラム数（SO_RXQ_OVFL対応時のみ）
+    errors: int = 0  # 不正なパケットやコールバックの例外で処理できなかったデータグラム数
+    rcvbuf: int = 0  # 実際に設定された受信バッファの大きさ（バイト）
+
+
+class ReceiveEngine:
+    """複数のMidiNodeの受信ソケットを1つのスレッドでまとめて受信するエンジン。
+
+    ソケットをノンブロッキングにして `selectors` で待ち、受信可能になったソケットからは溜まっている
+    データグラムをすべて読み出してから次の待機に戻る（1回の起床で1データグラムずつ処理しない）。
+    ソケットごとに受信バッファ (SO_RCVBUF) を広げ、Linuxではカーネルが捨てたデータグラム数 (SO_RXQ_OVFL) を数える。
+
+    `start()` で専用スレッドを起動するか、ホストのイベントループから `poll()` を呼ぶか、
+    `attach(loop)` でasyncioのイベントループに組み込んで使う。`close()` は待機中のスレッドをすぐに起こして終了を待つ。
+    """
+
+    def __init__(self, rcvbuf: Optional[int] = DEFAULT_RCVBUF, max_batch: int = 256):
+        """受信エンジンの初期化
+
+        Args:
+            rcvbuf: 各ソケットに設定する受信バッファの大きさ（バイト）。Noneの場合はOSの既定値のまま
+            max_batch: 1回の読み出しで1つのソケットから受信する最大のデータグラム数（他のソケットを待たせないため）
+        """
+        self.rcvbuf = rcvbuf
+        self.max_batch = max_batch
+        self._selector = selectors.DefaultSelector()
+        # 登録状態を守るロック。ノードの処理（コールバック）はロックの外で呼ぶ
+        self._lock = threading.Lock()
+        self._stats: Dict[object, ReceiveStats] = {}
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+        self._loop = None  # attach()したasyncioのイベントループ
+
+        # 待機中のselect()を起こすためのソケットの組
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+    def register(self, node):
+        """MidiNodeの受信ソケットを受信対象に加える"""
+        sock = node.receiver
+        sock.setblocking(False)
+        stats = ReceiveStats()
+        if self.rcvbuf is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            except OSError:
+                pass
+        stats.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        count_drops = False
+        if SO_RXQ_OVFL is not None and hasattr(sock, "recvmsg"):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                count_drops = True
+            except OSError:
+                pass
+
+        with self._lock:
+            self._stats[node] = stats
+            self._selector.register(sock, selectors.EVENT_READ, (node, count_drops))
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._add_reader, sock)
+        self._wake()
+
+    def unregister(self, node):
+        """MidiNodeの受信ソケットを受信対象から外す。戻った後はエンジンがソケットを読まない"""
+        with self._lock:
+            self._stats.pop(node, None)
+            try:
+                key = self._selector.unregister(node.receiver)
+            except (KeyError, ValueError):
+                return
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.remove_reader, key.fd)
+
+    def stats(self, node) -> Optional[ReceiveStats]:
+        """MidiNodeの受信の計測結果を返す。登録されていない場合はNone"""
+        stats = self._stats.get(node)
+        return replace(stats) if stats is not None else None
+
+    def poll(self, timeout: Optional[float] = None) -> int:
+        """受信可能なソケットを待ち、溜まっているデータグラムをすべて処理する
+
+        Args:
+            timeout: 待つ最大の時間（秒）。0の場合は待たない、Noneの場合は受信するかwake()されるまで待つ
+
+        Returns:
+            int: 処理したデータグラム数
+        """
+        count = 0
+        for key, _ in self._selector.select(timeout):
+            if key.data is None:
+                self._drain_wakeups()
+                continue
+            count += self._drain(key.fileobj)
+        return count
+
+    def start(self):
+        """専用の受信スレッドを起動する"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ReceiveEngine", daemon=True)
+        self._thread.start()
+
+    def attach(self, loop):
+        """asyncioのイベントループに組み込む（専用スレッドの代わりにイベントループのスレッドで受信する）
+
+        Args:
+            loop: asyncioのイベントループ。登録済みと以後に登録するソケットをadd_reader()で監視させる
+        """
+        with self._lock:
+            self._loop = loop
+            socks = [key.fileobj for key in self._selector.get_map().values() if key.data is not None]
+        for sock in socks:
+            loop.call_soon_threadsafe(self._add_reader, sock)
+
+    def close(self, timeout: float = 1.0):
+        """受信を終了する。専用スレッドを起動している場合はすぐに起こして終了を待つ"""
+        self._closing = True
+        self._wake()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                for key in list(self._selector.get_map().values()):
+                    if key.data is not None:
+                        self._loop.call_soon_threadsafe(self._loop.remove_reader, key.fd)
+            self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _run(self):
+        """専用の受信スレッドのループ"""
+        while not self._closing:
+            try:
+                self.poll()
+            except (OSError, ValueError):
+                # close()と同時に選択中のソケットが閉じられた
+                if self._closing:
+                    break
+
+    def _add_reader(self, sock):
+        if not self._closing and not self._loop.is_closed():
+            self._loop.add_reader(sock.fileno(), self._drain, sock)
+
+    def _wake(self):
+        """待機中のselect()を起こす"""
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # 起こす要求がすでに溜まっているか、終了済み
+            pass
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain(self, sock) -> int:
+        """ソケットに溜まっているデータグラムを（max_batchまで）読み出して処理する
+
+        読み出しはロックを取って行い（unregister()の後はソケットを読まない）、ノードの処理はロックの外で呼ぶ。
+        1つのパケットの処理が失敗しても、エラーとして数えて残りのデータグラムの処理を続ける。
+        """
+        packets = []
+        with self._lock:
+            # select()の後でunregister()されたソケットは読まない
+            key = self._selector.get_map().get(sock) if not self._closing else None
+            if key is None:
+                return 0
+            node, count_drops = key.data
+            stats = self._stats[node]
+            while len(packets) < self.max_batch:
+                try:
+                    if count_drops:
+                        data, ancdata, _, _ = sock.recvmsg(MAX_DATAGRAM_SIZE, socket.CMSG_SPACE(_DROPS_FIELD.size))
+                        for level, kind, value in ancdata:
+                            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                                # ソケットを作成してからの累計。捨てた後に受信バッファに入ったデータグラムに付く
+                                stats.kernel_drops = _DROPS_FIELD.unpack_from(value)[0]
+                    else:
+                        data = sock.recv(MAX_DATAGRAM_SIZE)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # ソケットが閉じられた
+                    break
+                packets.append(data)
+
+        for data in packets:
+            try:
+                node.handle_packet(data)
+            except Exception as e:
+                # 不正なパケットやコールバックの例外で他のノードの受信を止めない
+                stats.errors += 1
+                print(f"Error in MIDI receive engine: {e}")
+        count = len(packets)
+        if count:
+            stats.datagrams += count
+            stats.wakeups += 1
+            stats.max_batch = max(stats.max_batch, count)
+        return count
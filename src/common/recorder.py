@@ -0,0 +1,376 @@
+"""MIDIバスの通信の記録と再生
+
+使い方:
+    python -m src.common.recorder record show.pxlog [--session ID] [--loopback-only]
+    python -m src.common.recorder play show.pxlog [--speed 2.0 | --fast] [--start SEC] [--end SEC]
+    python -m src.common.recorder info show.pxlog
+"""
+
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from src.common.midi_utils import (
+    MAX_DATAGRAM_SIZE,
+    BroadcastTransport,
+    LocalBus,
+    MidiMessage,
+    MidiNode,
+    MulticastTransport,
+    WIRE_FORMAT_BINARY,
+    decode_packet,
+    encode_message,
+)
+
+LOG_MAGIC = b"PXPL"
+LOG_VERSION = 1
+_LOG_HEADER = struct.Struct("!4sB")
+# 1レコード = 受信時刻（UNIX時間）, パケット長 + パケット（受信したデータグラムそのまま）
+_RECORD_HEADER = struct.Struct("!dH")
+# 索引の1エントリ = レコードの受信時刻, ログファイル内の位置
+_INDEX_ENTRY = struct.Struct("!dQ")
+
+
+def index_path(path: str) -> str:
+    """ログファイルに対応する索引ファイルのパス"""
+    return path + ".idx"
+
+
+class BusRecorder:
+    """MIDIバスを流れるパケットを追記専用のバイナリログに記録する。
+
+    ログはヘッダ（マジック `PXPL` とバージョン）に続けて、受信時刻・パケット長・受信したデータグラムそのものを
+    順に追記する。パケットはデコードせずに記録するため、記録の負荷が小さく、再生時には同じバイト列を送信できる
+    （送信元はパケットに含まれる）。
+    `index_interval` 秒ごとに、その時点のレコードの受信時刻とログ内の位置を索引ファイル（`.idx`）に追記し、
+    再生時に指定した時刻へすぐに移動できるようにする。
+    """
+
+    def __init__(self, path: str, index_interval: float = 1.0):
+        """記録の初期化
+
+        Args:
+            path: ログファイルのパス（既存の場合は追記）
+            index_interval: 索引を追記する間隔（秒）
+        """
+        self.path = path
+        self.index_interval = index_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        self._next_index = 0.0
+        self._listeners: List[Tuple[socket.socket, threading.Thread]] = []
+        self._bus_nodes: List[MidiNode] = []
+        self.running = True
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._log = open(path, "ab")
+        self._index = open(index_path(path), "ab")
+        if new_file:
+            self._log.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+    def write(self, packet: bytes, timestamp: Optional[float] = None):
+        """1パケットを記録する（複数のスレッドから呼んでよい）"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if timestamp >= self._next_index:
+                self._next_index = timestamp + self.index_interval
+                self._index.write(_INDEX_ENTRY.pack(timestamp, self._log.tell()))
+            self._log.write(_RECORD_HEADER.pack(timestamp, len(packet)))
+            self._log.write(packet)
+            self.records += 1
+
+    def write_message(self, msg: MidiMessage, timestamp: Optional[float] = None):
+        """デコード済みのメッセージをバイナリ形式にして記録する（LocalBusからの記録用）"""
+        self.write(encode_message(msg, msg.source, WIRE_FORMAT_BINARY), timestamp)
+
+    def listen(self, transport=None) -> "BusRecorder":
+        """転送方式のポートで受信したパケットをすべて記録する（専用スレッド）
+
+        Args:
+            transport: BroadcastTransport / MulticastTransport。Noneの場合は従来のブロードキャスト
+        """
+        transport = transport or BroadcastTransport(MidiNode.BROADCAST_PORT, MidiNode.BROADCAST_ADDR)
+        receiver = transport.create_receiver()
+        # 停止を確認できるよう、受信待ちに上限を設ける
+        receiver.settimeout(0.2)
+        thread = threading.Thread(target=self._receive_loop, args=(receiver,))
+        thread.daemon = True
+        self._listeners.append((receiver, thread))
+        thread.start()
+        return self
+
+    def attach(self, bus: LocalBus) -> "BusRecorder":
+        """LocalBusでプロセス内に配信されるメッセージを記録する"""
+        self._bus_nodes.append(MidiNode("recorder", self.write_message, bus=bus))
+        return self
+
+    def _receive_loop(self, receiver: socket.socket):
+        while self.running:
+            try:
+                data, _ = receiver.recvfrom(MAX_DATAGRAM_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.write(data)
+
+    def flush(self):
+        """記録した内容をファイルに書き出す"""
+        with self._lock:
+            self._log.flush()
+            self._index.flush()
+
+    def close(self):
+        """記録を終了する"""
+        self.running = False
+        for receiver, thread in self._listeners:
+            thread.join(timeout=1.0)
+            receiver.close()
+        for node in self._bus_nodes:
+            node.close()
+        with self._lock:
+            self._log.close()
+            self._index.close()
+
+
+class LogReader:
+    """BusRecorderのログを読み出す"""
+
+    def __init__(self, path: str):
+        """ログの読み出しの初期化
+
+        Args:
+            path: ログファイルのパス
+        """
+        self.path = path
+        self._file: BinaryIO = open(path, "rb")
+        magic, version = _LOG_HEADER.unpack(self._file.read(_LOG_HEADER.size))
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"Not a MIDI bus log: {path}")
+        self._index = self._load_index()
+
+    def _load_index(self) -> List[Tuple[float, int]]:
+        """索引を読み込む。索引ファイルがない場合は空（先頭から読む）"""
+        try:
+            with open(index_path(self.path), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        return [entry for entry in _INDEX_ENTRY.iter_unpack(data[:usable])]
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        """(受信時刻, パケット) を記録順に返す
+
+        Args:
+            start: この時刻（UNIX時間）以降のレコードだけを返す。索引で読み出し位置を決める
+            end: この時刻より前のレコードだけを返す
+        """
+        offset = _LOG_HEADER.size
+        if start is not None:
+            for timestamp, position in self._index:
+                if timestamp > start:
+                    break
+                offset = position
+        self._file.seek(offset)
+
+        read = self._file.read
+        while True:
+            header = read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            timestamp, length = _RECORD_HEADER.unpack(header)
+            packet = read(length)
+            # 記録中に途切れた最後のレコードは捨てる
+            if len(packet) < length:
+                return
+            if end is not None and timestamp >= end:
+                return
+            if start is not None and timestamp < start:
+                continue
+            yield timestamp, packet
+
+    def messages(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Tuple[float, MidiMessage]]:
+        """(受信時刻, メッセージ) を記録順に返す。バッチのパケットは含まれるメッセージごとに返す"""
+        for timestamp, packet in self.records(start, end):
+            for msg in decode_packet(packet):
+                yield timestamp, msg
+
+    def close(self):
+        """ログファイルを閉じる"""
+        self._file.close()
+
+
+@dataclass
+class ReplayStats:
+    """再生の結果"""
+
+    packets: int  # 再生したパケット数
+    elapsed_sec: float  # 再生にかかった時間（秒）
+    packets_per_sec: float  # 1秒あたりの再生パケット数
+    max_lateness_ms: float  # 目標時刻からの最大の遅れ (ms)。最速再生では0
+
+
+class Replayer:
+    """記録したログのパケットを再送信する
+
+    記録時の間隔のまま（speed=1.0）、速度を変えて（speed=2.0で2倍速）、または待たずに最速で（speed=None）再生する。
+    パケットは記録したバイト列のまま送信するため、メッセージのタイムスタンプは記録時のもの。
+    """
+
+    def __init__(
+        self, path: str, speed: Optional[float] = 1.0, sink: Optional[Callable[[bytes], None]] = None, transport=None
+    ):
+        """再生の初期化
+
+        Args:
+            path: ログファイルのパス
+            speed: 再生速度の倍率。Noneの場合は待たずに最速で再生する
+            sink: パケットを受け取る関数。Noneの場合はtransportで送信する
+            transport: 送信に使う転送方式。Noneの場合は従来のブロードキャスト
+        """
+        self.path = path
+        self.speed = speed
+        self._sender = None
+        if sink is None:
+            transport = transport or BroadcastTransport(MidiNode.BROADCAST_PORT, MidiNode.BROADCAST_ADDR)
+            self._sender = transport.create_sender()
+            destination = transport.destination
+
+            def sink(packet: bytes):
+                self._sender.sendto(packet, destination)
+
+        self.sink = sink
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """再生を中断する（別のスレッドから呼ぶ）"""
+        self._stopped.set()
+
+    def run(self, start: Optional[float] = None, end: Optional[float] = None) -> ReplayStats:
+        """ログを再生する
+
+        Args:
+            start: 再生を始める記録時刻（UNIX時間）。Noneの場合は先頭から
+            end: 再生を終える記録時刻（UNIX時間）。Noneの場合は最後まで
+        """
+        reader = LogReader(self.path)
+        packets = 0
+        max_lateness = 0.0
+        anchor = None
+        first = None
+        begin = time.perf_counter()
+        try:
+            for timestamp, packet in reader.records(start, end):
+                if self._stopped.is_set():
+                    break
+                if self.speed is not None:
+                    if anchor is None:
+                        anchor, first = time.perf_counter(), timestamp
+                    target = anchor + (timestamp - first) / self.speed
+                    delay = target - time.perf_counter()
+                    if delay > 0:
+                        if self._stopped.wait(delay):
+                            break
+                    else:
+                        max_lateness = max(max_lateness, -delay)
+                self.sink(packet)
+                packets += 1
+        finally:
+            reader.close()
+        elapsed = time.perf_counter() - begin
+        return ReplayStats(
+            packets=packets,
+            elapsed_sec=elapsed,
+            packets_per_sec=packets / elapsed if elapsed > 0 else 0.0,
+            max_lateness_ms=max_lateness * 1e3,
+        )
+
+    def close(self):
+        """送信用ソケットを閉じる"""
+        if self._sender is not None:
+            self._sender.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MIDIバスの通信を記録・再生する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="受信したパケットをログに記録する（Ctrl+Cで終了）")
+    record.add_argument("path")
+    play = subparsers.add_parser("play", help="ログを再生する")
+    play.add_argument("path")
+    play.add_argument("--speed", type=float, default=1.0, help="再生速度の倍率")
+    play.add_argument("--fast", action="store_true", help="待たずに最速で再生する")
+    play.add_argument("--start", type=float, help="再生を始める位置（ログの先頭からの秒数）")
+    play.add_argument("--end", type=float, help="再生を終える位置（ログの先頭からの秒数）")
+    info = subparsers.add_parser("info", help="ログの内容をまとめて表示する")
+    info.add_argument("path")
+    for sub in (record, play):
+        sub.add_argument("--session", help="セッションID。指定した場合はセッションごとのマルチキャストグループを使う")
+        sub.add_argument("--loopback-only", action="store_true", help="マルチキャストのパケットを同一マシン内に限定する")
+    args = parser.parse_args()
+
+    transport = None
+    if getattr(args, "session", None) is not None:
+        transport = MulticastTransport.for_session(args.session, loopback_only=args.loopback_only)
+
+    if args.command == "record":
+        recorder = BusRecorder(args.path).listen(transport)
+        try:
+            while True:
+                time.sleep(1.0)
+                recorder.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.close()
+        print(f"{recorder.records} packets recorded")
+
+    elif args.command == "play":
+        reader = LogReader(args.path)
+        first = next(reader.records(), (0.0, b""))[0]
+        reader.close()
+        start = first + args.start if args.start is not None else None
+        end = first + args.end if args.end is not None else None
+
+        replayer = Replayer(args.path, None if args.fast else args.speed, transport=transport)
+        try:
+            stats = replayer.run(start, end)
+        except KeyboardInterrupt:
+            return
+        finally:
+            replayer.close()
+        print(
+            f"{stats.packets} packets in {stats.elapsed_sec:.2f}s "
+            f"({stats.packets_per_sec:.0f}/s, max lateness {stats.max_lateness_ms:.2f}ms)"
+        )
+
+    else:
+        reader = LogReader(args.path)
+        sources = Counter()
+        types = Counter()
+        first = last = None
+        packets = 0
+        for timestamp, packet in reader.records():
+            first = timestamp if first is None else first
+            last = timestamp
+            packets += 1
+            for msg in decode_packet(packet):
+                sources[msg.source] += 1
+                types[msg.type] += 1
+        reader.close()
+        duration = last - first if packets else 0.0
+        print(f"{packets} packets, {duration:.2f}s")
+        print("sources: " + ", ".join(f"{name}={count}" for name, count in sources.most_common()))
+        print("types: " + ", ".join(f"{name}={count}" for name, count in types.most_common()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class SchedulerStats:
+    """スケジューラの計測結果"""
+
+    scheduled: int  # 予約した件数
+    fired: int  # 実行した件数
+    late: int  # 予約時点ですでに目標時刻を過ぎていた件数
+    mean_error_ms: float  # 直近ウィンドウの実行時刻の誤差の平均 (ms)
+    jitter_ms: float  # 直近ウィンドウの実行時刻の誤差の標準偏差 (ms)
+    max_error_ms: float  # 直近ウィンドウの実行時刻の誤差の最大値 (ms)
+    errors: int = 0  # 例外を送出した件数
+
+
+class EventScheduler:
+    """目標時刻に関数を実行するスケジューラ。
+
+    目標時刻はマスタークロックのタイムスタンプと同じUNIX時間（秒）で指定し、
+    内部では `time.perf_counter_ns` に換算して専用スレッドで待つ。
+    `ClockEngine` と同様に、直前まではsleepし最後はスピン待ちで精度を確保する。
+    """
+
+    def __init__(self, spin_ns: int = 1_000_000, stats_window: int = 256):
+        """スケジューラの初期化
+
+        Args:
+            spin_ns: 目標時刻の直前にsleepをやめてスピン待ちに切り替える時間 (ns)
+            stats_window: 誤差の計算に使う直近の件数
+        """
+        self.spin_ns = spin_ns
+        # UNIX時間とperf_counterの差
+        self._wall_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._queue = []
+        self._counter = itertools.count()  # 同時刻の予約を予約順に実行するための連番
+        self._scheduled = 0
+        self._fired = 0
+        self._late = 0
+        self._failed = 0
+        self._errors_ns = deque(maxlen=stats_window)
+
+        self._closed = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def schedule_at(self, wall_time: float, callback: Callable[[], None]):
+        """指定したUNIX時間にcallbackを実行する。過去の時刻の場合はすぐに実行する。"""
+        due_ns = int(wall_time * 1e9) - self._wall_offset_ns
+        with self._lock:
+            self._scheduled += 1
+            if due_ns < time.perf_counter_ns():
+                self._late += 1
+            heapq.heappush(self._queue, (due_ns, next(self._counter), callback))
+            earliest = self._queue[0][0] == due_ns
+        # 先頭が変わった場合のみ待機中のスレッドを起こす
+        if earliest:
+            self._wake.set()
+
+    def clear(self):
+        """未実行の予約をすべて取り消す"""
+        with self._lock:
+            self._queue.clear()
+        self._wake.set()
+
+    def close(self):
+        """スレッドを終了する"""
+        self._closed = True
+        self.clear()
+        self.thread.join(timeout=1.0)
+
+    def stats(self) -> SchedulerStats:
+        """直近の計測結果を返す"""
+        with self._lock:
+            errors = list(self._errors_ns)
+            scheduled = self._scheduled
+            fired = self._fired
+            late = self._late
+            failed = self._failed
+        if errors:
+            mean = sum(errors) / len(errors)
+            jitter = (sum((e - mean) ** 2 for e in errors) / len(errors)) ** 0.5
+            max_error = max(abs(e) for e in errors)
+        else:
+            mean = jitter = max_error = 0.0
+        return SchedulerStats(
+            scheduled=scheduled,
+            fired=fired,
+            late=late,
+            mean_error_ms=mean / 1e6,
+            jitter_ms=jitter / 1e6,
+            max_error_ms=max_error / 1e6,
+            errors=failed,
+        )
+
+    def _run(self):
+        """予約実行ループ"""
+        while not self._closed:
+            with self._lock:
+                due_ns = self._queue[0][0] if self._queue else None
+            if due_ns is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            remaining = due_ns - time.perf_counter_ns()
+            if remaining > self.spin_ns:
+                if self._wake.wait((remaining - self.spin_ns) / 1e9):
+                    # より早い予約が追加された
+                    self._wake.clear()
+                    continue
+            while time.perf_counter_ns() < due_ns:
+                time.sleep(0)  # GILを手放しつつ待つ
+
+            with self._lock:
+                if not self._queue or self._queue[0][0] != due_ns:
+                    continue
+                _, _, callback = heapq.heappop(self._queue)
+                self._errors_ns.append(time.perf_counter_ns() - due_ns)
+                self._fired += 1
+
+            try:
+                callback()
+            except Exception as e:
+                # 1件の失敗で以降の予約をすべて落とさないよう、報告して実行を続ける
+                with self._lock:
+                    self._failed += 1
+                print(f"Error in scheduled event: {e}")
@@ -1,6 +1,9 @@
-import time
-import pyxel
+import threading
+
+from src.common.pyxel_backend import pyxel
 from src.common.base_node import Node
+from src.common.clock_engine import ClockEngine
+from src.common.layer import StaticLayer
 from src.common.midi_utils import MidiMessage
 
 
@@ -8,28 +11,45 @@ class RhythmGeneratorNode(Node):
     """システムのマスタークロックとして動作するリズムジェネレータ。
 
     同期信号を生成し、他のノードに送信することで同期を実現する。
+    クロックは描画フレームとは独立した `ClockEngine` のスレッドから送出される。
     """
 
-    def __init__(self):
-        super().__init__("RhythmGenerator")
+    def __init__(self, bpm=120, autostart=False, **kwargs):
+        """リズムジェネレータの初期化
+
+        Args:
+            bpm: 初期テンポ
+            autostart: Trueの場合、起動と同時に再生を開始する（ヘッドレスモードなどキー操作できない場合）
+            **kwargs: Nodeへ渡す引数
+        """
+        # フォロワーの時刻同期の問い合わせに応答する
+        kwargs.setdefault("clock_master", True)
+        super().__init__("RhythmGenerator", **kwargs)
 
         # テンポ管理
-        self.bpm = 120
+        self.bpm = bpm
         self.running = False
+        # ppq_countはクロックエンジンのスレッドで進め、フレームのスレッドでリセットする
+        self._ppq_lock = threading.Lock()
 
-        # タイミング管理
-        self.last_clock = 0
+        # タイミング管理（クロックは専用スレッドで生成）
         self.clock_interval = self._calculate_clock_interval()
-        self.accumulated_time = 0
+        self.clock_engine = ClockEngine(self.bpm, self._on_clock_pulse)
 
         # UI状態
         self.dragging = False
         self.drag_start_y = 0
         self.drag_start_bpm = 0
 
+        # テンポと操作説明はテンポが変わったときだけ描き直す
+        self.layer = StaticLayer(self.window_width, self.window_height, self._draw_static)
+
         # マウス操作を有効化
         pyxel.mouse(True)
 
+        # 自動再生は最初のupdate()（フレームループの開始時）で開始する。他のノードの準備は待たない
+        self.autostart = autostart
+
     def _calculate_clock_interval(self) -> float:
         """現在のBPMからMIDIクロック間隔を計算"""
         # BPMから1拍の長さ（秒）を計算
@@ -39,6 +59,10 @@ class RhythmGeneratorNode(Node):
 
     def update(self):
         """毎フレーム実行される更新処理"""
+        if self.autostart:
+            self.autostart = False
+            self.start()
+
         # マウス操作によるBPM制御
         if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
             self.dragging = True
@@ -51,12 +75,11 @@ class RhythmGeneratorNode(Node):
                 new_bpm = self.drag_start_bpm + delta_y
                 new_bpm = max(40, min(240, new_bpm))  # BPMを40-240の範囲に制限
 
-                # BPMが変更された場合のみタイミングをリセット
+                # BPMが変更された場合のみタイミングを再設定
                 if new_bpm != self.bpm:
                     self.bpm = new_bpm
                     self.clock_interval = self._calculate_clock_interval()
-                    # タイミング関連の状態をリセット
-                    self.last_clock = time.time()
+                    self.clock_engine.set_bpm(self.bpm)
         else:
             self.dragging = False
 
@@ -67,53 +90,61 @@ class RhythmGeneratorNode(Node):
             else:
                 self.start()
 
-        # クロック信号の生成
-        if self.running:
-            current_time = time.time()
-            expected_time = self.last_clock + self.clock_interval
-
-            # 次のクロックタイミングに達したか確認
-            if current_time >= expected_time:
-                self.send_clock()
-                # 次の期待時刻を設定（現在時刻ではなく理想的なタイミングから計算）
-                self.last_clock = expected_time
-
     def draw(self):
         """毎フレーム実行される描画処理"""
         super().draw()  # 基本的な状態表示
+        self.layer.draw(key=self.bpm)
+
+        # クロックの計測結果を表示
+        stats = self.clock_engine.stats()
+        pyxel.text(10, 50, f"Jitter: {stats.jitter_ms:.2f}ms (max {stats.max_jitter_ms:.2f})", 7)
+        pyxel.text(10, 60, f"Err: {stats.last_error_ms:.2f}ms  Late: {stats.late_pulses}", 7)
 
+    def _draw_static(self, image):
+        """テンポが変わったときだけ描き直す表示"""
         # 現在のBPMを表示
-        pyxel.text(10, 30, f"BPM: {self.bpm:.1f}", 7)
+        image.text(10, 30, f"BPM: {self.bpm:.1f}", 7)
 
         # クロック間隔を表示（デバッグ用）
-        pyxel.text(10, 40, f"Interval: {self.clock_interval * 1000:.1f}ms", 7)
+        image.text(10, 40, f"Interval: {self.clock_interval * 1000:.1f}ms", 7)
 
         # 操作方法を表示
-        pyxel.text(10, 100, "SPACE: Start/Stop", 13)
-        pyxel.text(10, 110, "DRAG: Change BPM (40-240)", 13)
+        image.text(10, 100, "SPACE: Start/Stop", 13)
+        image.text(10, 110, "DRAG: Change BPM (40-240)", 13)
+
+    def _on_clock_pulse(self, pulse: int, deadline_ns: int):
+        """クロックエンジンのスレッドからパルスごとに呼ばれる"""
+        self.send_clock(self.clock_engine.to_wall_time(deadline_ns))
 
-    def send_clock(self):
-        """MIDIクロック信号を送信"""
-        msg = MidiMessage(type="clock")
+    def send_clock(self, timestamp=None):
+        """MIDIクロック信号を送信
+
+        Args:
+            timestamp: パルスの理想送出時刻（UNIX時間）。フォロワーが発音時刻の基準に使う
+        """
+        msg = MidiMessage(type="clock", timestamp=timestamp)
         self.midi_node.send_message(msg)
 
         # PPQカウントを更新
-        self.ppq_count = (self.ppq_count + 1) % 24
+        with self._ppq_lock:
+            self.ppq_count = (self.ppq_count + 1) % 24
 
     def start(self):
         """再生を開始"""
         self.running = True
-        self.last_clock = time.time()
-        self.accumulated_time = 0
-        # 開始信号を送信
-        msg = MidiMessage(type="start")
+        with self._ppq_lock:
+            self.ppq_count = 0
+        # クロックを開始し、開始時刻を付けて開始信号を送信（最初のクロックは1パルス後）
+        start_time = self.clock_engine.start()
+        msg = MidiMessage(type="start", timestamp=start_time)
         self.midi_node.send_message(msg)
 
     def stop(self):
         """再生を停止"""
         self.running = False
-        self.ppq_count = 0
-        self.accumulated_time = 0
+        self.clock_engine.stop()
+        with self._ppq_lock:
+            self.ppq_count = 0
         # 停止信号を送信
         msg = MidiMessage(type="stop")
         self.midi_node.send_message(msg)
@@ -123,6 +154,11 @@ class RhythmGeneratorNode(Node):
         # 現状は外部からのMIDI入力は想定しない
         pass
 
+    def close(self):
+        """クロックエンジンとMIDIノードを終了"""
+        self.clock_engine.close()
+        super().close()
+
 
 if __name__ == "__main__":
     RhythmGeneratorNode().run()
@@ -1,4 +1,4 @@
-import pyxel
+from src.common.pyxel_backend import pyxel
 from src.common.base_node import Node
 from src.common.midi_utils import MidiMessage
 
@@ -8,8 +8,8 @@ class RhythmNode(Node):
     リズムジェネレータからの同期信号に基づいて動作する。
     """
 
-    def __init__(self):
-        super().__init__(name="SimpleRhythm")
+    def __init__(self, **kwargs):
+        super().__init__(name="SimpleRhythm", **kwargs)
 
         # 4ステップの基本パターン [キック, 休符, キック, 休符]
         self.pattern = [1, 0, 1, 0]
@@ -56,14 +56,18 @@ class RhythmNode(Node):
 
             # 新しいステップの音を処理
             if self.pattern[self.step] == 1:
-                # ドラム音を再生
-                pyxel.play(0, 0)
+                # ドラム音を再生（lookahead指定時はクロックのタイムスタンプに合わせて予約）
+                self.schedule_trigger(msg, self._play)
 
         elif msg.type == "start":
             self.step = 0
             # 最初のステップの音を処理
             if self.pattern[self.step] == 1:
-                pyxel.play(0, 0)
+                self.schedule_trigger(msg, self._play)
+
+    def _play(self):
+        """ドラム音を再生"""
+        pyxel.play(0, 0)
 
 
 if __name__ == "__main__":
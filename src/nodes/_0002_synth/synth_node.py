@@ -1,23 +1,45 @@
-import pyxel
+from src.common.pyxel_backend import pyxel
 from src.common.base_node import Node
-from src.common.midi_utils import MidiMessage
+from src.common.midi_utils import MidiMessage, MIDI_NOTE_OFF, MIDI_NOTE_ON, MIDI_START, MIDI_STOP
+from src.nodes._0002_synth.voices import STEAL_OLDEST, SoundCache, VoiceAllocator, velocity_to_volume
 
 
 class SynthNode(Node):
     """シンプルなシンセノード。
     リズムジェネレータからの同期信号に対応。
-    """
-
-    def __init__(self):
-        super().__init__(name="SimpleSynth", in_channels=[1])
 
-        # 現在鳴っている音
-        self.current_note = None
+    受信したノートの音程で、Pyxelのチャンネル数まで同時に発音する（ポリフォニック）。
+    ノートはノートオフを受信するまで鳴らし続け、空いているチャンネルがなければ発音中のボイスを置き換える。
+    """
 
-        # シンセ音を設定
-        self.sound = pyxel.Sound()
-        self.sound.set("c3", "t", "7", "n", 10)
-        pyxel.sounds[1] = self.sound
+    # 前もってSoundを作っておく音域（MIDIノート番号、C3-C6）
+    PRELOAD_NOTES = range(48, 85)
+
+    def __init__(self, channels=(0, 1, 2, 3), voice_steal=STEAL_OLDEST, tone="t", max_sounds=512, **kwargs):
+        """シンセノードの初期化
+
+        Args:
+            channels: 発音に使うPyxelのチャンネル番号（同時発音数）
+            voice_steal: 空いているチャンネルがない場合に置き換えるボイスの選び方 (STEAL_OLDEST / STEAL_QUIETEST)
+            tone: 音色 (t: 三角波 / s: 矩形波 / p: パルス波 / n: ノイズ)
+            max_sounds: キャッシュする (ノート, 音量, 音色) ごとのSoundの最大数
+            **kwargs: Nodeへ渡す引数
+        """
+        # クロックは使わないため、ノートと再生制御のメッセージだけを受信する
+        super().__init__(
+            name="SimpleSynth",
+            in_channels=[1],
+            subscribe_types=[MIDI_NOTE_ON, MIDI_NOTE_OFF, MIDI_START, MIDI_STOP],
+            **kwargs,
+        )
+
+        # ボイスの割り当て
+        self.voices = VoiceAllocator(channels, voice_steal)
+        self.tone = tone
+
+        # ノートオンでSoundを作らないよう、よく使う音域を前もって作っておく
+        self.sound_cache = SoundCache(max_sounds)
+        self.sound_cache.preload(self.PRELOAD_NOTES, range(1, 8), tone)
 
     def on_midi(self, msg: MidiMessage):
         """MIDIメッセージを受信した際の処理"""
@@ -26,13 +48,34 @@ class SynthNode(Node):
         if not self.enabled:
             return
 
-        if msg.type == "note_on" and msg.velocity > 0:
-            self.current_note = msg.note
-            # 音を鳴らす
-            pyxel.play(1, 1)
+        if msg.type in (MIDI_NOTE_ON, MIDI_NOTE_OFF) and msg.note is None:
+            # ノート番号のないメッセージは鳴らすノートも止めるノートも決まらないため無視する
+            return
+
+        if msg.type == MIDI_NOTE_ON and msg.velocity:
+            self.note_on(msg, msg.note, msg.velocity)
+
+        elif msg.type in (MIDI_NOTE_OFF, MIDI_NOTE_ON):
+            # ノートオフはリリースベロシティにかかわらず、ノートオンはベロシティ0（またはなし）で止める
+            self.note_off(msg, msg.note)
+
+        elif msg.type == MIDI_STOP:
+            # 鳴っているノートをすべて止める
+            for channel in self.voices.release_all():
+                pyxel.stop(channel)
+
+    def note_on(self, msg: MidiMessage, note: int, velocity: int):
+        """ノートにチャンネルを割り当てて鳴らし始める（ノートオフまでループ再生）"""
+        volume = velocity_to_volume(velocity)
+        sound = self.sound_cache.get(note, volume, self.tone)
+        channel = self.voices.note_on(note, volume)
+        self.schedule_trigger(msg, lambda: pyxel.play(channel, sound, loop=True))
 
-        elif msg.type in ["note_off", "note_on"] and msg.velocity == 0:
-            self.current_note = None
+    def note_off(self, msg: MidiMessage, note: int):
+        """ノートを鳴らしているチャンネルを止める"""
+        channel = self.voices.note_off(note)
+        if channel is not None:
+            self.schedule_trigger(msg, lambda: pyxel.stop(channel))
 
     def update(self):
         """毎フレーム実行されるメインロジック"""
@@ -50,12 +93,16 @@ class SynthNode(Node):
         """シンセの状態を可視化"""
         super().draw()  # 基本的な状態表示
 
-        # 現在の音を表示
+        # 現在鳴っている音をチャンネルごとに表示
         y = 30
-        if self.current_note is not None:
-            pyxel.text(5, y, f"Note: {self.current_note}", 7)
-        else:
-            pyxel.text(5, y, "Note: None", 5)
+        notes = dict(self.voices.active_notes())
+        for i, voice in enumerate(self.voices.voices):
+            note = notes.get(voice.channel)
+            if note is not None:
+                pyxel.text(5, y + i * 10, f"CH{voice.channel}: {note}", 7)
+            else:
+                pyxel.text(5, y + i * 10, f"CH{voice.channel}: None", 5)
+        pyxel.text(5, y + len(self.voices.voices) * 10, f"STOLEN: {self.voices.stolen}", 5)
 
         # 操作説明
         pyxel.text(5, 100, "Z: Play Synth", 7)
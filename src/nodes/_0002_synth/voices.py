@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from src.common.pyxel_backend import pyxel
+
+
+# 空いているボイスがない場合に置き換えるボイスの選び方
+STEAL_OLDEST = "oldest"  # 最も前に発音したボイス
+STEAL_QUIETEST = "quietest"  # 最も音量の小さいボイス（同じ音量なら最も前に発音したボイス）
+STEAL_POLICIES = (STEAL_OLDEST, STEAL_QUIETEST)
+
+# Pyxelのノート番号（0-59, 33がA2 = 440Hz）とMIDIノート番号の差
+PYXEL_NOTE_OFFSET = 36
+_NOTE_NAMES = ["c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b"]
+
+
+def midi_to_pyxel_note(note: int) -> int:
+    """MIDIノート番号をPyxelのノート番号にする。範囲外の音はオクターブ単位で範囲内に移す"""
+    pyxel_note = note - PYXEL_NOTE_OFFSET
+    while pyxel_note < 0:
+        pyxel_note += 12
+    while pyxel_note > 59:
+        pyxel_note -= 12
+    return pyxel_note
+
+
+def velocity_to_volume(velocity: int) -> int:
+    """MIDIのベロシティ（1-127）をPyxelの音量（1-7）にする"""
+    return max(1, min(7, (velocity * 7 + 63) // 127))
+
+
+class SoundCache:
+    """(ノート, 音量, 音色) ごとの `pyxel.Sound` のキャッシュ
+
+    ノートオンのたびにSoundを作らないよう、作ったSoundを最大数まで保持し、
+    最大数を超えた場合は最も長く使われていないものから捨てる。`preload()` で前もって作っておける。
+    """
+
+    def __init__(self, capacity: int = 512, speed: int = 30):
+        """キャッシュの初期化
+
+        Args:
+            capacity: 保持するSoundの最大数
+            speed: Soundの再生速度（1音の長さ。ループ再生するため音の長さには影響しない）
+        """
+        self.capacity = capacity
+        self.speed = speed
+        self._sounds: "OrderedDict[Tuple[int, int, str], object]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sounds)
+
+    def get(self, note: int, volume: int, tone: str):
+        """MIDIノート番号・音量（1-7）・音色（t/s/p/n）のSoundを返す。なければ作る"""
+        key = (note, volume, tone)
+        with self._lock:
+            sound = self._sounds.get(key)
+            if sound is not None:
+                self.hits += 1
+                self._sounds.move_to_end(key)
+                return sound
+
+            self.misses += 1
+            pyxel_note = midi_to_pyxel_note(note)
+            sound = pyxel.Sound()
+            sound.set(f"{_NOTE_NAMES[pyxel_note % 12]}{pyxel_note // 12}", tone, str(volume), "n", self.speed)
+            self._sounds[key] = sound
+            if len(self._sounds) > self.capacity:
+                self._sounds.popitem(last=False)
+            return sound
+
+    def preload(self, notes: Iterable[int], volumes: Iterable[int], tone: str):
+        """指定したノートと音量の組み合わせのSoundを前もって作る"""
+        volumes = list(volumes)
+        for note in notes:
+            for volume in volumes:
+                self.get(note, volume, tone)
+        # 前もって作った分はキャッシュの効果に含めない
+        self.hits = 0
+        self.misses = 0
+
+
+@dataclass
+class Voice:
+    """Pyxelのチャンネル1つ分の発音状態"""
+
+    channel: int  # Pyxelのチャンネル番号
+    note: Optional[int] = None  # 発音中のMIDIノート番号（Noneは空き）
+    volume: int = 0  # 発音中の音量（1-7）
+    order: int = 0  # 発音した順番
+
+
+class VoiceAllocator:
+    """ノートをPyxelのチャンネルに割り当てる
+
+    同じノートは同じチャンネルで鳴らし直し、空いているチャンネルがなければ方針に従って
+    発音中のボイスを置き換える（ボイススティール）。受信スレッドとフレームループの両方から呼ばれる。
+    """
+
+    def __init__(self, channels: Sequence[int] = (0, 1, 2, 3), steal: str = STEAL_OLDEST):
+        """ボイスの割り当ての初期化
+
+        Args:
+            channels: 使用するPyxelのチャンネル番号
+            steal: 空いているボイスがない場合の方針 (STEAL_OLDEST / STEAL_QUIETEST)
+        """
+        if steal not in STEAL_POLICIES:
+            raise ValueError(f"unknown voice steal policy: {steal}")
+        self.voices = [Voice(channel) for channel in channels]
+        self.steal = steal
+        self.stolen = 0  # 置き換えたボイスの数
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def note_on(self, note: int, volume: int) -> int:
+        """ノートにボイスを割り当て、そのチャンネル番号を返す"""
+        with self._lock:
+            voice = self._find(note)
+            if voice is None:
+                voice = self._find(None)
+            if voice is None:
+                if self.steal == STEAL_QUIETEST:
+                    voice = min(self.voices, key=lambda v: (v.volume, v.order))
+                else:
+                    voice = min(self.voices, key=lambda v: v.order)
+                self.stolen += 1
+            self._counter += 1
+            voice.note = note
+            voice.volume = volume
+            voice.order = self._counter
+            return voice.channel
+
+    def note_off(self, note: int) -> Optional[int]:
+        """ノートのボイスを空け、そのチャンネル番号を返す。発音していないノートはNone"""
+        with self._lock:
+            voice = self._find(note)
+            if voice is None:
+                return None
+            voice.note = None
+            voice.volume = 0
+            return voice.channel
+
+    def release_all(self) -> List[int]:
+        """すべてのボイスを空け、発音していたチャンネル番号を返す"""
+        with self._lock:
+            channels = [voice.channel for voice in self.voices if voice.note is not None]
+            for voice in self.voices:
+                voice.note = None
+                voice.volume = 0
+            return channels
+
+    def active_notes(self) -> List[Tuple[int, int]]:
+        """発音中の (チャンネル番号, ノート番号) の一覧"""
+        return [(voice.channel, voice.note) for voice in self.voices if voice.note is not None]
+
+    def _find(self, note: Optional[int]) -> Optional[Voice]:
+        for voice in self.voices:
+            if voice.note == note:
+                return voice
+        return None
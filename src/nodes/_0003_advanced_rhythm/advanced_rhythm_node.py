@@ -1,95 +1,212 @@
-import pyxel
-from dataclasses import dataclass
-from typing import Dict, List
+from src.common.pyxel_backend import pyxel
+from typing import Any, Dict, Optional, Sequence, Tuple
 from src.common.base_node import Node
-from src.common.midi_utils import MidiMessage
-
-
-@dataclass
-class DrumSound:
-    """ドラム音の設定を保持するデータクラス"""
-
-    name: str
-    note: int  # MIDIノート番号
-    sound_id: int  # Pyxel sound ID
-    volume: int  # 0-100
-    pattern: List[int]  # ステップパターン
-    muted: bool  # ミュート状態
+from src.common.layer import StaticLayer
+from src.common.midi_utils import MidiMessage, MIDI_CONTROL_CHANGE, MIDI_PROGRAM_CHANGE
+from .patterns import DrumSound, PatternBank, StepTable, steps_to_mask
 
 
 class AdvancedRhythmNode(Node):
     """高度な機能を持つリズムノード。
 
     - 複数の音色（キック、スネア、ハイハット、クラップ）
-    - パターン切り替え機能
-    - 音量調整機能
+    - パターン切り替え機能（パターンバンクから次の小節の頭で切り替え）
+    - 音量調整機能（ドラムごとの音量とステップごとのアクセントを、前もって作った音量の段階ごとのSoundで鳴らし分ける）
+    - 受信したnote_onでのドラムの発音
     """
 
-    def __init__(self):
-        super().__init__(name="AdvancedRhythm", window_size=(240, 180))
+    # 発音したドラムを送信する際のMIDIチャンネル（GMのドラムチャンネル）
+    DRUM_CHANNEL = 10
+
+    # パターン表示の配置（1行目のy座標・行の間隔・1ステップ目のx座標・ステップの間隔・セルの大きさ）
+    ROW_Y = 40
+    ROW_PITCH = 30
+    CELL_X = 60
+    CELL_PITCH = 10
+    CELL_SIZE = 8
+
+    def __init__(
+        self,
+        emit_notes=False,
+        pattern_bank: Optional[str] = None,
+        pattern_cc: Optional[int] = None,
+        trigger_channel: Optional[int] = None,
+        **kwargs,
+    ):
+        """リズムノードの初期化
+
+        Args:
+            emit_notes: Trueの場合、ステップで鳴らしたドラムをnote_onとして送信する
+                （同じステップのノートは1つのデータグラムにまとめて送信）
+            pattern_bank: パターンファイル（JSON）のパス。Noneの場合は組み込みのパターン1つだけを使う
+            pattern_cc: パターンを切り替えるコントロールチェンジの番号（値がパターン番号）。
+                Noneの場合はプログラムチェンジでのみ切り替える
+            trigger_channel: このMIDIチャンネルのnote_onで、ノート番号が一致するドラムをベロシティに応じた音量で鳴らす。
+                Noneの場合はnote_onでは鳴らさない
+            **kwargs: Nodeへ渡す引数
+        """
+        super().__init__(name="AdvancedRhythm", window_size=(240, 180), **kwargs)
+        self.emit_notes = emit_notes
+        self.pattern_cc = pattern_cc
+        self.trigger_channel = trigger_channel
+        self.step = 0
+        # ラベル・パターンのセル・操作説明は状態が変わったときだけ描き直す
+        self.layer = StaticLayer(self.window_width, self.window_height, self._draw_static)
         # ドラム音の初期化
         self._init_drum_sounds()
-        self.step = 0
+        if pattern_bank is not None:
+            self.load_pattern_bank(PatternBank.load(pattern_bank))
 
         # マウス操作を有効化
         pyxel.mouse(True)
 
     def _init_drum_sounds(self):
         """ドラム音の初期化"""
-        self.drums: Dict[str, DrumSound] = {
+        drums = {
             "kick": DrumSound(
                 name="Kick",
                 note=36,  # C1
                 sound_id=0,
                 volume=100,
-                pattern=[1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],
+                pattern=steps_to_mask([1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0]),
                 muted=False,
+                accents=steps_to_mask([1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+                sound=("c2", "p", "n", 5),
             ),
             "snare": DrumSound(
                 name="Snare",
                 note=38,  # D1
                 sound_id=1,
                 volume=100,
-                pattern=[0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0],
+                pattern=steps_to_mask([0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0]),
                 muted=False,
+                sound=("c3", "n", "n", 8),
             ),
             "hihat": DrumSound(
                 name="HiHat",
                 note=42,  # F#1
                 sound_id=2,
                 volume=100,
-                pattern=[1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                pattern=steps_to_mask([1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]),
                 muted=False,
+                accents=steps_to_mask([1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0]),
+                sound=("f3", "s", "n", 2),
             ),
             "clap": DrumSound(
                 name="Clap",
                 note=39,  # D#1
                 sound_id=3,
                 volume=100,
-                pattern=[0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0],
+                pattern=steps_to_mask([0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0]),
                 muted=False,
+                sound=("d3", "n", "f", 3),
             ),
         }
+        self.set_drums(drums, 16)
+
+    def set_drums(self, drums: Dict[str, DrumSound], num_steps: int):
+        """ドラムの構成とステップ数を設定する
+
+        ドラムごとに音量の段階（1-7）ごとのSoundをここで作っておき、発音はSoundを選んで再生するだけにする。
+
+        Args:
+            drums: ドラム名からドラム音の設定への辞書（表示・発音はこの順序）
+            num_steps: 1小節のステップ数
+        """
+        for drum in drums.values():
+            drum.build_variants()
+        self.drums = drums
+        self.drum_names = list(drums)
+        self.num_steps = num_steps
+        self.step %= num_steps
+        self.step_table = StepTable(num_steps)
+        # 現在のパターンだけのパターンバンク
+        self.pattern_names = ["Default"]
+        self.pattern_index = 0
+        self.pending_pattern: Optional[int] = None
+        self._bank_patterns = [[drum.pattern for drum in drums.values()]]
+        self._bank_accents = [[drum.accents for drum in drums.values()]]
+        self._bank_tables = [self.step_table]
+        self._build_note_triggers()
+        self.layer.invalidate()
+
+    def _build_note_triggers(self):
+        """受信したnote_onで鳴らすドラムの表（ノート番号 -> (チャンネル, ベロシティごとのSound)）を作る"""
+        self._note_triggers: Dict[int, Tuple[int, Tuple[Any, ...]]] = {
+            drum.note: (drum.sound_id, drum.velocity_table()) for drum in self.drums.values() if not drum.muted
+        }
 
-        # キックドラム
-        kick = pyxel.Sound()
-        kick.set("c2", "p", "7", "n", 5)
-        pyxel.sounds[0] = kick
+    def set_volume(self, drum_name: str, volume: int):
+        """ドラムの音量（0-100）を設定する"""
+        if drum_name in self.drums:
+            self.drums[drum_name].volume = max(0, min(100, volume))
+            # 音量はすべてのパターンに影響する
+            for table in self._bank_tables:
+                table.invalidate()
+            self._compile_tables()
+            self._build_note_triggers()
 
-        # スネアドラム
-        snare = pyxel.Sound()
-        snare.set("c3", "n", "7", "n", 8)
-        pyxel.sounds[1] = snare
+    def load_pattern_bank(self, bank: PatternBank):
+        """パターンバンクを読み込み、最初のパターンに切り替える
 
-        # ハイハット
-        hihat = pyxel.Sound()
-        hihat.set("f3", "s", "7", "n", 2)
-        pyxel.sounds[2] = hihat
+        パターンごとのビットマスクと発音の一覧はここですべて作っておき、
+        切り替えではドラムのパターンと発音の一覧の参照を入れ替えるだけにする。
+        """
+        for pattern in bank.patterns:
+            unknown = set(pattern) - set(self.drums)
+            if unknown:
+                raise ValueError(f"unknown drums in pattern bank: {sorted(unknown)}")
+        self.num_steps = bank.num_steps
+        self.step %= bank.num_steps
+        self.pattern_names = list(bank.names)
+        self._bank_patterns = [[pattern.get(name, 0) for name in self.drum_names] for pattern in bank.patterns]
+        self._bank_accents = [[accents.get(name, 0) for name in self.drum_names] for accents in bank.accents]
+        self._bank_tables = [StepTable(bank.num_steps) for _ in bank.patterns]
+        self.pattern_index = 0
+        self.pending_pattern = None
+        for drum, mask, accents in zip(self.drums.values(), self._bank_patterns[0], self._bank_accents[0]):
+            drum.pattern = mask
+            drum.accents = accents
+        self.step_table = self._bank_tables[0]
+        self._compile_tables()
+        self.layer.invalidate()
+
+    def select_pattern(self, index: int):
+        """パターンを切り替える。再生中は次の小節の頭で、停止中はすぐに切り替える"""
+        if not 0 <= index < len(self._bank_patterns):
+            return
+        if self.running:
+            self.pending_pattern = index
+        else:
+            self._switch_pattern(index)
+
+    def _switch_pattern(self, index: int):
+        """パターンを切り替える（ステップの処理から呼ばれるため、メモリの確保や音の設定は行わない）"""
+        self.pending_pattern = None
+        if index == self.pattern_index:
+            return
+        # 編集したステップを残すため、現在のパターンをバンクに書き戻してから入れ替える
+        current = self._bank_patterns[self.pattern_index]
+        current_accents = self._bank_accents[self.pattern_index]
+        patterns = self._bank_patterns[index]
+        accents = self._bank_accents[index]
+        for i, drum in enumerate(self.drums.values()):
+            current[i] = drum.pattern
+            current_accents[i] = drum.accents
+            drum.pattern = patterns[i]
+            drum.accents = accents[i]
+        self.pattern_index = index
+        self.step_table = self._bank_tables[index]
 
-        # クラップ
-        clap = pyxel.Sound()
-        clap.set("d3", "n", "7", "f", 3)
-        pyxel.sounds[3] = clap
+    def _compile_tables(self):
+        """作り直しが必要なパターンの発音の一覧を作る（ステップの処理の前に済ませておく）"""
+        drums = list(self.drums.values())
+        for index, table in enumerate(self._bank_tables):
+            if table.dirty:
+                if index == self.pattern_index:
+                    table.compile(drums)
+                else:
+                    table.compile(drums, self._bank_patterns[index], self._bank_accents[index])
 
     def update(self):
         """毎フレーム実行されるメインロジック"""
@@ -97,46 +214,81 @@ class AdvancedRhythmNode(Node):
         if pyxel.btnp(pyxel.KEY_SPACE):
             self.toggle_enabled()
 
+        # 左右キーでパターン切り替え
+        if pyxel.btnp(pyxel.KEY_LEFT):
+            self.select_pattern((self.pattern_index - 1) % len(self._bank_patterns))
+        if pyxel.btnp(pyxel.KEY_RIGHT):
+            self.select_pattern((self.pattern_index + 1) % len(self._bank_patterns))
+
         # 1-4キーでミュート切り替え
-        for i, key in enumerate([pyxel.KEY_1, pyxel.KEY_2, pyxel.KEY_3, pyxel.KEY_4]):
+        for name, key in zip(self.drum_names, (pyxel.KEY_1, pyxel.KEY_2, pyxel.KEY_3, pyxel.KEY_4)):
             if pyxel.btnp(key):
-                self._toggle_mute(list(self.drums.keys())[i])
-
-        # マウスクリックでパターンのON/OFF切り替え
-        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-            # クリックされた位置を確認
-            for i, (name, drum) in enumerate(self.drums.items()):
-                base_y = 40 + i * 30
-                if base_y <= pyxel.mouse_y <= base_y + 8:
-                    # パターン領域内でのクリックを確認
-                    pattern_x = (pyxel.mouse_x - 60) // 10
-                    if 0 <= pattern_x < 16:
-                        self._toggle_step(name, pattern_x)
+                self._toggle_mute(name)
+
+        # マウスの左クリックでパターンのON/OFF、右クリックでアクセントを切り替え
+        left = pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT)
+        if left or pyxel.btnp(pyxel.MOUSE_BUTTON_RIGHT):
+            # クリックされた位置から行とステップを求める
+            row, offset = divmod(pyxel.mouse_y - self.ROW_Y, self.ROW_PITCH)
+            if 0 <= row < len(self.drum_names) and offset <= self.CELL_SIZE:
+                pattern_x = (pyxel.mouse_x - self.CELL_X) // self.CELL_PITCH
+                if 0 <= pattern_x < self.num_steps:
+                    if left:
+                        self._toggle_step(self.drum_names[row], pattern_x)
+                    else:
+                        self._toggle_accent(self.drum_names[row], pattern_x)
 
     def draw(self):
         """パターンの可視化"""
         super().draw()  # 基本的な状態表示
 
+        # パターンの切り替えで変わる表示はレイヤーの描き直しで反映する
+        self.layer.draw(key=(self.pattern_index, self.pending_pattern))
+
+        # 現在のステップの列だけを毎フレーム重ねて描く（赤/暗赤）
+        step = self.step
+        x = self.CELL_X + step * self.CELL_PITCH
+        for i, drum in enumerate(self.drums.values()):
+            color = 8 if (drum.pattern >> step) & 1 else 2
+            pyxel.rect(x, self.ROW_Y + i * self.ROW_PITCH, self.CELL_SIZE, self.CELL_SIZE, color)
+
+    def _draw_static(self, image):
+        """状態が変わったときだけ描き直す表示（パターン名・ドラム名・パターンのセル・操作説明）"""
+        # パターン名（切り替え待ちのパターンがあれば併せて表示）
+        pattern_text = f"PATTERN {self.pattern_index + 1}/{len(self.pattern_names)} {self.pattern_names[self.pattern_index]}"
+        pending = self.pending_pattern
+        if pending is not None:
+            pattern_text += f" -> {pending + 1}"
+        image.text(5, 25, pattern_text, 10)
+
         # 各ドラム音のパターンを表示
-        base_y = 40
-        for i, (name, drum) in enumerate(self.drums.items()):
+        for i, drum in enumerate(self.drums.values()):
             # ドラム名
             color = 5 if drum.muted else 7
-            pyxel.text(5, base_y + i * 30, f"{drum.name}", color)
+            image.text(5, self.ROW_Y + i * self.ROW_PITCH, f"{drum.name}", color)
 
             # パターン表示
-            for j, val in enumerate(drum.pattern):
-                x = 60 + j * 10
-                y = base_y + i * 30
-                color = 5 if val == 0 else (13 if drum.muted else 7)
-                if j == self.step:
-                    color = 8 if val == 1 else 2  # 現在のステップは赤/暗赤
-                pyxel.rect(x, y, 8, 8, color)
+            for j in range(self.num_steps):
+                self._draw_cell(image, i, j)
 
         # 操作説明
-        pyxel.text(5, 160, "SPACE: Toggle Rhythm", 13)
-        pyxel.text(5, 170, "1-4: Toggle Mute", 13)
-        pyxel.text(120, 170, "CLICK: Toggle Step", 13)
+        image.text(5, 160, "SPACE: Toggle Rhythm", 13)
+        image.text(120, 160, "LEFT/RIGHT: Pattern", 13)
+        image.text(5, 170, "1-4: Toggle Mute", 13)
+        image.text(120, 170, "CLICK: Step/Accent", 13)
+
+    def _draw_cell(self, image, row: int, step: int):
+        """パターンのセルを1つ描く"""
+        drum = self.drums[self.drum_names[row]]
+        if not (drum.pattern >> step) & 1:
+            color = 5
+        elif drum.muted:
+            color = 13
+        else:
+            color = 10 if (drum.accents >> step) & 1 else 7
+        image.rect(
+            self.CELL_X + step * self.CELL_PITCH, self.ROW_Y + row * self.ROW_PITCH, self.CELL_SIZE, self.CELL_SIZE, color
+        )
 
     def on_midi(self, msg: MidiMessage):
         """MIDIメッセージを受信した際の処理"""
@@ -148,34 +300,103 @@ class AdvancedRhythmNode(Node):
         # 6PPQごと（16分音符）にステップを進める
         if msg.type == "clock" and self.running and self.ppq_count % 6 == 0:
             # 次のステップへ
-            self.step = (self.step + 1) % 16
+            self.step = (self.step + 1) % self.num_steps
+            # 小節の頭で切り替え待ちのパターンに切り替える
+            if self.step == 0 and self.pending_pattern is not None:
+                self._switch_pattern(self.pending_pattern)
             # 新しいステップの音を処理
-            self._process_step()
+            self._process_step(msg)
 
         elif msg.type == "start":
             self.step = 0
+            if self.pending_pattern is not None:
+                self._switch_pattern(self.pending_pattern)
             # 最初のステップの音を処理
-            self._process_step()
+            self._process_step(msg)
+
+        elif msg.type == MIDI_PROGRAM_CHANGE and msg.value is not None:
+            self.select_pattern(msg.value)
 
-    def _process_step(self):
-        """現在のステップの音を処理"""
-        for name, drum in self.drums.items():
-            if drum.muted:
-                continue
+        elif msg.type == MIDI_CONTROL_CHANGE and self.pattern_cc is not None and msg.control == self.pattern_cc:
+            if msg.value is not None:
+                self.select_pattern(msg.value)
 
-            if drum.pattern[self.step] == 1:
-                # ドラム音を再生
-                pyxel.play(drum.sound_id, drum.sound_id)
+        elif msg.type == "note_on" and self.trigger_channel is not None and msg.channel == self.trigger_channel:
+            self._trigger_note(msg)
+
+    def _trigger_note(self, msg: MidiMessage):
+        """受信したnote_onのノート番号のドラムを、ベロシティに応じた音量で鳴らす"""
+        trigger = self._note_triggers.get(msg.note)
+        if trigger is None:
+            return
+        channel, sounds = trigger
+        # 範囲外のベロシティで表の後ろから引かないよう0-127に収める（0は鳴らさない）
+        sound = sounds[max(0, min(msg.velocity or 0, 127))]
+        if sound is not None:
+            hits = ((channel, sound),)
+            self.schedule_trigger(msg, lambda: self._play(hits))
+
+    def _process_step(self, msg: MidiMessage):
+        """現在のステップの音を処理
+
+        Args:
+            msg: ステップを進めたメッセージ。lookahead指定時はそのタイムスタンプに合わせて発音を予約する
+        """
+        table = self.step_table
+        if table.dirty:
+            table.compile(self.drums.values())
+
+        # 同じステップのドラム音をまとめて再生
+        hits = table.hits[self.step]
+        if hits:
+            self.schedule_trigger(msg, lambda: self._play(hits))
+
+        # 同じステップのノートを1つのデータグラムで送信
+        if self.emit_notes:
+            for note, velocity in table.notes[self.step]:
+                self.emit(MidiMessage(type="note_on", note=note, velocity=velocity, channel=self.DRUM_CHANNEL))
+            self.flush_output()
+
+    def _play(self, hits: Sequence[Tuple[int, Any]]):
+        """ドラム音を再生
+
+        Args:
+            hits: (チャンネル, 音量に応じたSound) の列
+        """
+        for channel, sound in hits:
+            pyxel.play(channel, sound)
 
     def _toggle_mute(self, drum_name: str):
         """指定したドラム音のミュート状態を切り替え"""
         if drum_name in self.drums:
             self.drums[drum_name].muted = not self.drums[drum_name].muted
+            # ミュートはすべてのパターンに影響する
+            for table in self._bank_tables:
+                table.invalidate()
+            self._compile_tables()
+            self._build_note_triggers()
+            self.layer.invalidate()
 
     def _toggle_step(self, drum_name: str, step: int):
         """指定したドラム音の指定ステップのON/OFFを切り替え"""
         if drum_name in self.drums:
-            self.drums[drum_name].pattern[step] = 1 - self.drums[drum_name].pattern[step]  # 0 -> 1, 1 -> 0
+            drum = self.drums[drum_name]
+            drum.pattern ^= 1 << step  # 0 -> 1, 1 -> 0
+            drum.accents &= drum.pattern  # OFFにしたステップのアクセントは外す
+            self.step_table.invalidate()
+            self._compile_tables()
+            # 変わったセルだけを描き直す
+            self.layer.patch(self._draw_cell, self.drum_names.index(drum_name), step)
+
+    def _toggle_accent(self, drum_name: str, step: int):
+        """指定したドラム音の指定ステップのアクセントを切り替え（OFFのステップはONにする）"""
+        if drum_name in self.drums:
+            drum = self.drums[drum_name]
+            drum.accents ^= 1 << step
+            drum.pattern |= drum.accents
+            self.step_table.invalidate()
+            self._compile_tables()
+            self.layer.patch(self._draw_cell, self.drum_names.index(drum_name), step)
 
 
 if __name__ == "__main__":
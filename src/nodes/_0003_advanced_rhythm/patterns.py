@@ -0,0 +1,214 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from src.common.pyxel_backend import pyxel
+
+# 音量の段階の数（Pyxelの音量1-7。0は鳴らさない）
+NUM_LEVELS = 7
+# パターンのステップで鳴らすベロシティ（通常のステップ・アクセントのステップ）
+STEP_VELOCITY = 100
+ACCENT_VELOCITY = 127
+
+
+def steps_to_mask(steps: Iterable[int]) -> int:
+    """ステップのON/OFFの列（[1, 0, 0, 0, ...]）をビットマスク（ビットiがステップi）にする"""
+    mask = 0
+    for i, val in enumerate(steps):
+        if val:
+            mask |= 1 << i
+    return mask
+
+
+def mask_to_steps(mask: int, num_steps: int) -> List[int]:
+    """ビットマスクをステップのON/OFFの列にする"""
+    return [(mask >> i) & 1 for i in range(num_steps)]
+
+
+def velocity_to_level(velocity: int, volume: int = 100) -> int:
+    """MIDIのベロシティ（0-127）とドラムの音量（0-100）から音量の段階（0-7, 0は鳴らさない）を求める"""
+    velocity = velocity * volume // 100
+    if velocity <= 0:
+        return 0
+    return max(1, min(NUM_LEVELS, (velocity * NUM_LEVELS + 63) // 127))
+
+
+@dataclass
+class DrumSound:
+    """ドラム音の設定を保持するデータクラス"""
+
+    name: str
+    note: int  # MIDIノート番号
+    sound_id: int  # 再生するPyxelのチャンネル
+    volume: int  # 0-100
+    pattern: int  # ステップパターン（ビットiがステップiのON/OFF）
+    muted: bool  # ミュート状態
+    accents: int = 0  # アクセントのステップ（ビットiがステップiのアクセント）
+    sound: Tuple[str, str, str, int] = ("c2", "p", "n", 5)  # Pyxelの音の設定 (notes, tones, effects, speed)
+    # 音量の段階ごとのSound（build_variants()で作る。0番目は鳴らさないためNone）
+    variants: Tuple[Any, ...] = field(default=(), repr=False, compare=False)
+
+    def hit(self, step: int) -> bool:
+        """指定したステップで鳴るかどうか（ミュートは考慮しない）"""
+        return (self.pattern >> step) & 1 == 1
+
+    def accented(self, step: int) -> bool:
+        """指定したステップがアクセントかどうか"""
+        return (self.accents >> step) & 1 == 1
+
+    def build_variants(self):
+        """音量の段階（1-7）ごとのSoundを作る（起動時と音色の構成を変えたときだけ呼ぶ）"""
+        notes, tones, effects, speed = self.sound
+        variants: List[Any] = [None]
+        for level in range(1, NUM_LEVELS + 1):
+            sound = pyxel.Sound()
+            sound.set(notes, tones, str(level), effects, speed)
+            variants.append(sound)
+        self.variants = tuple(variants)
+
+    def velocity_table(self) -> Tuple[Any, ...]:
+        """ベロシティ（0-127）から鳴らすSoundへの表（ドラムの音量を反映。Noneは鳴らさない）"""
+        if not self.variants:
+            self.build_variants()
+        return tuple(self.variants[velocity_to_level(velocity, self.volume)] for velocity in range(128))
+
+
+class StepTable:
+    """ステップごとに鳴らすドラムの前計算表
+
+    ステップの処理でドラムを1つずつ調べる代わりに、パターン・アクセント・ミュート・音量が変わったときだけ
+    ステップごとの ((チャンネル, 音量に応じたSound)の列, (ノート, ベロシティ)の列) を作り直す。
+    ステップあたりの処理はドラムやステップの数によらず、鳴らすドラムの数だけになる。
+    """
+
+    def __init__(self, num_steps: int):
+        """前計算表の初期化
+
+        Args:
+            num_steps: 1小節のステップ数
+        """
+        self.num_steps = num_steps
+        self.hits: List[Tuple[Tuple[int, Any], ...]] = [()] * num_steps
+        self.notes: List[Tuple[Tuple[int, int], ...]] = [()] * num_steps
+        self.dirty = True
+
+    def invalidate(self):
+        """次に使う前に作り直すようにする（パターン・ミュート・音量を変えたときに呼ぶ）"""
+        self.dirty = True
+
+    def compile(
+        self,
+        drums: Iterable[DrumSound],
+        patterns: Optional[Sequence[int]] = None,
+        accents: Optional[Sequence[int]] = None,
+    ):
+        """ドラムの設定からステップごとの発音の一覧を作る（ドラムの順序を保つ）
+
+        Args:
+            drums: ドラム音の設定
+            patterns: ドラムと同じ順序のパターン。Noneの場合は各ドラムのpatternを使う
+            accents: ドラムと同じ順序のアクセント。Noneの場合は各ドラムのaccentsを使う
+        """
+        hits: List[List[Tuple[int, Any]]] = [[] for _ in range(self.num_steps)]
+        notes: List[List[Tuple[int, int]]] = [[] for _ in range(self.num_steps)]
+        step_mask = (1 << self.num_steps) - 1
+        for i, drum in enumerate(drums):
+            if drum.muted:
+                continue
+            if not drum.variants:
+                drum.build_variants()
+            # 通常のステップとアクセントのステップの (Sound, ベロシティ)。音量0のドラムは鳴らさない
+            levels = [
+                (drum.variants[velocity_to_level(velocity, drum.volume)], velocity * drum.volume // 100)
+                for velocity in (STEP_VELOCITY, ACCENT_VELOCITY)
+            ]
+            accent_mask = drum.accents if accents is None else accents[i]
+            # ONのステップ（立っているビット）だけをたどる
+            mask = (drum.pattern if patterns is None else patterns[i]) & step_mask
+            while mask:
+                low = mask & -mask
+                step = low.bit_length() - 1
+                sound, velocity = levels[1 if accent_mask & low else 0]
+                if sound is not None:
+                    hits[step].append((drum.sound_id, sound))
+                    notes[step].append((drum.note, velocity))
+                mask ^= low
+        self.hits = [tuple(step_hits) for step_hits in hits]
+        self.notes = [tuple(step_notes) for step_notes in notes]
+        self.dirty = False
+
+
+# パターンファイルでステップをONとみなす文字とアクセントとみなす文字（それ以外の "." や "-" などはOFF）
+_STEP_ON_CHARS = "x1*"
+_STEP_ACCENT_CHARS = "X>"
+
+
+def _parse_steps(steps: Union[str, Sequence[int]], num_steps: int) -> Tuple[int, int]:
+    """パターンファイルのステップ（"X...x..." または [2, 0, 1, ...]）を (パターン, アクセント) のビットマスクにする"""
+    if isinstance(steps, str):
+        steps = [2 if c in _STEP_ACCENT_CHARS else int(c in _STEP_ON_CHARS) for c in steps.replace(" ", "")]
+    if len(steps) != num_steps:
+        raise ValueError(f"pattern has {len(steps)} steps, expected {num_steps}")
+    return steps_to_mask(steps), steps_to_mask(val >= 2 for val in steps)
+
+
+class PatternBank:
+    """切り替えて使う複数のパターン（ドラムごとのビットマスクの組）
+
+    パターンファイルはJSONで、すべてのパターンが同じステップ数を持つ。
+    パターンに含まれないドラムはそのパターンでは鳴らさない。
+    ステップの "x" は通常のステップ、"X" はアクセントのステップ（リストの場合は1と2）。
+
+        {
+          "steps": 16,
+          "patterns": [
+            {"name": "Basic", "drums": {"kick": "X...x...X...x...", "snare": "..x...x...x...x."}},
+            {"name": "Half", "drums": {"kick": "x.......x.......", "snare": "........x......."}}
+          ]
+        }
+    """
+
+    def __init__(
+        self,
+        num_steps: int,
+        names: List[str],
+        patterns: List[Dict[str, int]],
+        accents: Optional[List[Dict[str, int]]] = None,
+    ):
+        """パターンバンクの初期化
+
+        Args:
+            num_steps: 1小節のステップ数
+            names: パターン名の一覧
+            patterns: パターンごとの、ドラム名からビットマスクへの辞書
+            accents: パターンごとの、ドラム名からアクセントのビットマスクへの辞書。Noneの場合はアクセントなし
+        """
+        self.num_steps = num_steps
+        self.names = names
+        self.patterns = patterns
+        self.accents = accents if accents is not None else [{} for _ in patterns]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PatternBank":
+        """パターンファイルの内容からパターンバンクを作る"""
+        num_steps = int(data.get("steps", 16))
+        names = []
+        patterns = []
+        accents = []
+        for i, entry in enumerate(data["patterns"]):
+            names.append(entry.get("name", f"Pattern {i + 1}"))
+            parsed = {name: _parse_steps(steps, num_steps) for name, steps in entry["drums"].items()}
+            patterns.append({name: mask for name, (mask, _) in parsed.items()})
+            accents.append({name: accent for name, (_, accent) in parsed.items() if accent})
+        if not patterns:
+            raise ValueError("pattern bank has no patterns")
+        return cls(num_steps, names, patterns, accents)
+
+    @classmethod
+    def load(cls, path: str) -> "PatternBank":
+        """パターンファイル（JSON）を読み込む"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,311 @@
+import heapq
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from src.common.pyxel_backend import pyxel
+
+try:
+    import numpy as np
+except ImportError:  # NumPyがない環境ではリストによる実装を使う
+    np = None
+
+
+# pyxel.circ(x, y, r, col) が塗るピクセルの相対座標（r=1, r=2）
+_STAMP_OFFSETS = {
+    1: [(0, -1), (-1, 0), (0, 0), (1, 0), (0, 1)],
+    2: [(dx, dy) for dy in range(-2, 3) for dx in range(-2, 3) if dx * dx + dy * dy <= 5],
+}
+
+
+# 容量を超えて生成する場合の方針
+EVICT_NONE = "none"  # 新しい生成を破棄する
+EVICT_OLDEST = "oldest"  # 最も古いパーティクルから置き換える
+EVICT_LOWEST_LIFE = "lowest_life"  # 残り寿命が最も短いパーティクルから置き換える
+EVICTION_POLICIES = (EVICT_NONE, EVICT_OLDEST, EVICT_LOWEST_LIFE)
+
+
+@dataclass
+class ParticleStats:
+    """パーティクル群の計測結果"""
+
+    live: int  # 生存しているパーティクル数
+    capacity: int  # 同時に存在できる最大数
+    spawned: int  # 生成したパーティクル数
+    dropped: int  # 容量を超えて破棄した生成数
+    recycled: int  # 新しい生成のために置き換えたパーティクル数
+
+
+class Particle:
+    """パーティクルクラス - 視覚効果用の動的な点を表現"""
+
+    __slots__ = ("x", "y", "dx", "dy", "life", "color", "original_life")
+
+    def __init__(self, x: float, y: float, dx: float, dy: float, life: int, color: int):
+        self.reset(x, y, dx, dy, life, color)
+
+    def reset(self, x: float, y: float, dx: float, dy: float, life: int, color: int):
+        """プールから再利用する際に状態を初期化する"""
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.life = life
+        self.color = color
+        self.original_life = life
+
+    def update(self) -> bool:
+        """パーティクルの位置を更新し、生存しているかを返す"""
+        self.x += self.dx
+        self.y += self.dy
+        self.dy += 0.1  # 重力効果
+        self.life -= 1
+        return self.life > 0
+
+    def draw(self):
+        """パーティクルを描画"""
+        alpha = self.life / self.original_life
+        size = max(1, int(2 * alpha))
+        pyxel.circ(int(self.x), int(self.y), size, self.color)
+
+
+class ParticleSystem:
+    """固定容量のパーティクル群をまとめて更新・描画する。
+
+    NumPyが使える場合は位置・速度・寿命・色を事前確保した配列（Structure of Arrays）で保持し、
+    移動と寿命切れの除去を配列演算でまとめて行う。生存しているパーティクルは常に配列の先頭 `count` 個に
+    生成順に詰めて保持する（寿命切れは毎フレームの圧縮で取り除く）。
+    描画は画面のピクセルバッファ（`pyxel.screen.data_ptr()`）へ円の形をまとめて書き込むため、
+    パーティクル数によらずPyxelの呼び出しは1フレーム数回で済む。
+    NumPyがない場合や画面バッファを使えない場合（ヘッドレスモードなど）は `Particle` のリストと
+    `pyxel.circ` による従来の実装で動作する（寿命が尽きた `Particle` はプールに戻して再利用する）。
+
+    同時に存在できる数は `capacity` までで、超えて生成する場合は `eviction` の方針に従い、
+    新しい生成を破棄するか既存のパーティクルを置き換える。これによりメモリ使用量と1フレームの処理時間に上限ができる。
+
+    受信スレッドからの `spawn()` とフレームループの `update()` はロックで直列化する。
+    """
+
+    GRAVITY = 0.1
+
+    def __init__(self, capacity: int = 16384, use_numpy: Optional[bool] = None, eviction: str = EVICT_OLDEST):
+        """パーティクル群の初期化
+
+        Args:
+            capacity: 同時に存在できるパーティクルの最大数
+            use_numpy: NumPyの配列で保持するか。Noneの場合はNumPyがあれば使う
+            eviction: 容量を超えて生成する場合の方針 (EVICT_NONE / EVICT_OLDEST / EVICT_LOWEST_LIFE)
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ImportError("numpy is required for use_numpy=True")
+
+        self.capacity = capacity
+        self.use_numpy = use_numpy
+        self.eviction = eviction
+        self._lock = threading.Lock()
+        self.count = 0
+        self.spawned = 0
+        self.dropped = 0
+        self.recycled = 0
+
+        if use_numpy:
+            self._x = np.zeros(capacity, dtype=np.float64)
+            self._y = np.zeros(capacity, dtype=np.float64)
+            self._dx = np.zeros(capacity, dtype=np.float64)
+            self._dy = np.zeros(capacity, dtype=np.float64)
+            self._life = np.zeros(capacity, dtype=np.int32)
+            self._original_life = np.ones(capacity, dtype=np.int32)
+            self._color = np.zeros(capacity, dtype=np.uint8)
+            self._arrays = (self._x, self._y, self._dx, self._dy, self._life, self._original_life, self._color)
+        else:
+            self._particles: List[Particle] = []
+            self._pool: List[Particle] = []  # 寿命が尽きて再利用を待つパーティクル
+
+    def __len__(self) -> int:
+        return self.count
+
+    def spawn(self, x: float, y: float, dx: Sequence[float], dy: Sequence[float], life: int, color: int) -> int:
+        """同じ位置・寿命・色のパーティクルを速度ごとにまとめて生成する
+
+        Args:
+            x, y: 生成位置
+            dx, dy: 各パーティクルの速度
+            life: 寿命（フレーム数）
+            color: 色（0-15）
+
+        Returns:
+            int: 生成した数
+        """
+        with self._lock:
+            requested = len(dx)
+            num = min(requested, self.capacity)
+            overflow = self.count + num - self.capacity
+            if overflow > 0:
+                if self.eviction == EVICT_NONE:
+                    num -= overflow
+                else:
+                    self._evict(overflow)
+                    self.recycled += overflow
+            self.dropped += requested - num
+            if num <= 0:
+                return 0
+
+            start = self.count
+            if self.use_numpy:
+                end = start + num
+                self._x[start:end] = x
+                self._y[start:end] = y
+                self._dx[start:end] = dx[:num]
+                self._dy[start:end] = dy[:num]
+                self._life[start:end] = life
+                self._original_life[start:end] = life
+                self._color[start:end] = color
+            else:
+                pool = self._pool
+                for i in range(num):
+                    if pool:
+                        particle = pool.pop()
+                        particle.reset(x, y, dx[i], dy[i], life, color)
+                    else:
+                        particle = Particle(x, y, dx[i], dy[i], life, color)
+                    self._particles.append(particle)
+            self.count = start + num
+            self.spawned += num
+            return num
+
+    def _evict(self, num: int):
+        """方針に従ってnum個のパーティクルを取り除く（ロック内で呼ぶ）"""
+        count = self.count
+        if self.use_numpy:
+            if self.eviction == EVICT_OLDEST:
+                # 生成順に並んでいるので先頭から取り除く
+                for array in self._arrays:
+                    array[: count - num] = array[num:count]
+            else:
+                keep = np.ones(count, dtype=bool)
+                keep[np.argpartition(self._life[:count], num - 1)[:num]] = False
+                for array in self._arrays:
+                    array[: count - num] = array[:count][keep]
+        else:
+            particles = self._particles
+            if self.eviction == EVICT_OLDEST:
+                evicted = particles[:num]
+                self._particles = particles[num:]
+            else:
+                lowest = set(heapq.nsmallest(num, range(count), key=lambda i: particles[i].life))
+                evicted = [particles[i] for i in lowest]
+                self._particles = [p for i, p in enumerate(particles) if i not in lowest]
+            self._pool.extend(evicted)
+        self.count = count - num
+
+    def update(self):
+        """全パーティクルを1フレーム進め、寿命が尽きたものを取り除く"""
+        with self._lock:
+            if not self.use_numpy:
+                alive = []
+                for particle in self._particles:
+                    if particle.update():
+                        alive.append(particle)
+                    else:
+                        self._pool.append(particle)
+                self._particles = alive
+                self.count = len(alive)
+                return
+
+            count = self.count
+            if count == 0:
+                return
+            x, y, dx, dy, life = self._x[:count], self._y[:count], self._dx[:count], self._dy[:count], self._life[:count]
+            x += dx
+            y += dy
+            dy += self.GRAVITY
+            life -= 1
+
+            alive = life > 0
+            remaining = int(np.count_nonzero(alive))
+            if remaining != count:
+                # 生存しているものを生成順のまま先頭に詰める
+                for array in self._arrays:
+                    array[:remaining] = array[:count][alive]
+            self.count = remaining
+
+    def clear(self):
+        """全パーティクルを取り除く"""
+        with self._lock:
+            if not self.use_numpy:
+                self._pool.extend(self._particles)
+                self._particles = []
+            self.count = 0
+
+    def stats(self) -> ParticleStats:
+        """計測結果を返す"""
+        return ParticleStats(
+            live=self.count,
+            capacity=self.capacity,
+            spawned=self.spawned,
+            dropped=self.dropped,
+            recycled=self.recycled,
+        )
+
+    def draw(self):
+        """全パーティクルを描画する。寿命に応じて半径2から1に縮む。"""
+        if not self.use_numpy:
+            for particle in self._particles:
+                particle.draw()
+            return
+
+        count = self.count
+        if count == 0:
+            return
+        buffer = _screen_buffer()
+        if buffer is None:
+            self._draw_circles(count)
+        else:
+            self._rasterize(buffer, count)
+
+    def _sizes(self, count: int):
+        return np.maximum(1, (2 * self._life[:count]) // self._original_life[:count])
+
+    def _draw_circles(self, count: int):
+        """画面バッファを使えない場合はパーティクルごとにpyxel.circで描画する"""
+        xs = self._x[:count].astype(np.int64).tolist()
+        ys = self._y[:count].astype(np.int64).tolist()
+        sizes = self._sizes(count).tolist()
+        colors = self._color[:count].tolist()
+        circ = pyxel.circ
+        for x, y, size, color in zip(xs, ys, sizes, colors):
+            circ(x, y, size, color)
+
+    def _rasterize(self, buffer, count: int):
+        """画面のピクセルバッファへ円の形をまとめて書き込む（画面外のピクセルは捨てる）"""
+        height, width = buffer.shape
+        xs = self._x[:count].astype(np.int64)
+        ys = self._y[:count].astype(np.int64)
+        sizes = self._sizes(count)
+        colors = self._color[:count]
+
+        # 新しいパーティクル（半径2）が上に重なるよう、半径1から書き込む
+        for size, offsets in _STAMP_OFFSETS.items():
+            selected = sizes == size
+            if not selected.any():
+                continue
+            offsets = np.array(offsets, dtype=np.int64)
+            px = (xs[selected, None] + offsets[None, :, 0]).ravel()
+            py = (ys[selected, None] + offsets[None, :, 1]).ravel()
+            pc = np.repeat(colors[selected], len(offsets))
+            inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+            buffer[py[inside], px[inside]] = pc[inside]
+
+
+def _screen_buffer():
+    """Pyxelの画面のピクセルバッファをNumPy配列として返す。使えない場合はNone。"""
+    if np is None:
+        return None
+    screen = getattr(pyxel, "screen", None)
+    if screen is None or not hasattr(screen, "data_ptr"):
+        return None
+    return np.ctypeslib.as_array(screen.data_ptr()).reshape(screen.height, screen.width)
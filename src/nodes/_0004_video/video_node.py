@@ -1,47 +1,27 @@
 import random
 import math
-import pyxel
-from typing import List
+from src.common.pyxel_backend import pyxel
 
 from src.common.base_node import Node
 from src.common.midi_utils import MidiMessage
-
-
-class Particle:
-    """パーティクルクラス - 視覚効果用の動的な点を表現"""
-
-    def __init__(self, x: float, y: float, dx: float, dy: float, life: int, color: int):
-        self.x = x
-        self.y = y
-        self.dx = dx
-        self.dy = dy
-        self.life = life
-        self.color = color
-        self.original_life = life
-
-    def update(self) -> bool:
-        """パーティクルの位置を更新し、生存しているかを返す"""
-        self.x += self.dx
-        self.y += self.dy
-        self.dy += 0.1  # 重力効果
-        self.life -= 1
-        return self.life > 0
-
-    def draw(self):
-        """パーティクルを描画"""
-        alpha = self.life / self.original_life
-        size = max(1, int(2 * alpha))
-        pyxel.circ(int(self.x), int(self.y), size, self.color)
+from src.nodes._0004_video.particles import EVICT_OLDEST, ParticleSystem
 
 
 class VideoNode(Node):
     """MIDIイベントに反応して視覚効果を生成するノード"""
 
-    def __init__(self):
-        super().__init__(name="VideoNode")
+    def __init__(self, max_particles=16384, particle_eviction=EVICT_OLDEST, **kwargs):
+        """映像ノードの初期化
+
+        Args:
+            max_particles: 同時に存在できるパーティクルの最大数
+            particle_eviction: 最大数を超えて生成する場合の方針 (EVICT_NONE / EVICT_OLDEST / EVICT_LOWEST_LIFE)
+            **kwargs: Nodeへ渡す引数
+        """
+        super().__init__(name="VideoNode", **kwargs)
 
-        # パーティクル管理
-        self.particles: List[Particle] = []
+        # パーティクル管理（NumPyがあれば配列でまとめて更新・描画）
+        self.particles = ParticleSystem(max_particles, eviction=particle_eviction)
 
         # ビジュアルエフェクト用の状態管理
         self.flash_intensity = 0.0  # フラッシュ効果の強度
@@ -73,14 +53,14 @@ class VideoNode(Node):
 
             # パーティクルを放射状に生成
             num_particles = int(velocity * 10) + 5
+            dx = []
+            dy = []
             for _ in range(num_particles):
                 angle = random.random() * math.pi * 2
                 speed = random.random() * 3 + 2
-                dx = math.cos(angle) * speed
-                dy = math.sin(angle) * speed
-
-                particle = Particle(self.center_x, self.center_y, dx, dy, life=30, color=color)
-                self.particles.append(particle)
+                dx.append(math.cos(angle) * speed)
+                dy.append(math.sin(angle) * speed)
+            self.particles.spawn(self.center_x, self.center_y, dx, dy, life=30, color=color)
 
             # フラッシュ効果を設定
             self.flash_intensity = velocity
@@ -91,12 +71,14 @@ class VideoNode(Node):
         self.base_color = (self.base_color + 1) % 15 + 1
 
         # 中央から外側に向かってパーティクルを生成
-        for i in range(8):
-            angle = (i / 8.0) * math.pi * 2
-            particle = Particle(
-                self.center_x, self.center_y, math.cos(angle) * 2, math.sin(angle) * 2, life=20, color=self.base_color
-            )
-            self.particles.append(particle)
+        angles = [(i / 8.0) * math.pi * 2 for i in range(8)]
+        dx = [math.cos(angle) * 2 for angle in angles]
+        dy = [math.sin(angle) * 2 for angle in angles]
+        self.particles.spawn(self.center_x, self.center_y, dx, dy, life=20, color=self.base_color)
+
+    def is_idle(self) -> bool:
+        """停止中でも、パーティクルやフラッシュ効果が残っている間はフレームレートを下げない"""
+        return super().is_idle() and len(self.particles) == 0 and self.flash_intensity <= 0.1
 
     def update(self):
         """毎フレーム実行されるメインロジック"""
@@ -105,7 +87,7 @@ class VideoNode(Node):
             self.toggle_enabled()
 
         # パーティクルの更新
-        self.particles = [p for p in self.particles if p.update()]
+        self.particles.update()
 
         # フラッシュ効果の減衰
         self.flash_intensity *= 0.9
@@ -122,8 +104,7 @@ class VideoNode(Node):
         pyxel.circ(self.center_x, self.center_y, radius, self.base_color)
 
         # パーティクルの描画
-        for particle in self.particles:
-            particle.draw()
+        self.particles.draw()
 
         # フラッシュ効果
         if self.flash_intensity > 0.1:
@@ -132,6 +113,10 @@ class VideoNode(Node):
             pyxel.circb(self.center_x, self.center_y, size, flash_color)
             pyxel.circb(self.center_x, self.center_y, size + 1, flash_color)
 
+        # パーティクル数と、上限を超えて破棄・置き換えた数
+        stats = self.particles.stats()
+        pyxel.text(5, 90, f"P:{stats.live} DROP:{stats.dropped} RCY:{stats.recycled}", 5)
+
         # 操作説明
         pyxel.text(5, 100, "SPACE: Toggle Visual", 7)
 
@@ -0,0 +1,203 @@
+import threading
+import time
+
+import pytest
+
+from src.common.base_node import Node
+from src.common.midi_utils import LocalBus, MidiMessage, SequenceStats, WIRE_FORMAT_BINARY, decode_packet, encode_batch
+from src.common.pyxel_backend import pyxel
+
+
+@pytest.fixture
+def node():
+    node = Node("TestNode", headless=True, inbox=True, fps=100)
+    yield node
+    node.close()
+
+
+def test_headless_init(node):
+    assert pyxel.headless
+    assert (pyxel.width, pyxel.height) == (160, 120)
+    assert not pyxel.btnp(pyxel.KEY_SPACE)
+
+
+def test_on_midi_sync_state(node):
+    node.on_midi(MidiMessage(type="start"))
+    assert node.running
+    # 同期状態はクロックの受信でのみ変わる
+    assert not node.synced
+    for _ in range(25):
+        node.on_midi(MidiMessage(type="clock"))
+    assert node.synced
+    assert node.ppq_count == 1
+    node.on_midi(MidiMessage(type="stop"))
+    assert not node.running
+    assert node.ppq_count == 0
+
+
+def test_ready_after_first_clock_unless_clock_is_not_subscribed(node):
+    assert not node.is_ready()
+    node.on_midi(MidiMessage(type="clock"))
+    assert node.is_ready()
+
+    notes_only = Node("NotesOnly", headless=True, subscribe_types=["note_on", "start"], metrics=True)
+    try:
+        assert notes_only.is_ready()
+        assert notes_only.stats_snapshot()["ready"]
+    finally:
+        notes_only.close()
+
+
+def test_stats_snapshot_without_metrics(node):
+    record = node.stats_snapshot()
+    assert record["node"] == "TestNode" and "inbox" in record
+    assert "update" not in record
+
+
+def test_inbox_is_processed_in_frame_update(node):
+    node.inbox.push(MidiMessage(type="start"))
+    assert not node.running
+    node._frame_update()
+    assert node.running
+
+
+def test_headless_run_loop(node):
+    frames = []
+
+    def update():
+        frames.append(pyxel.frame_count)
+        if len(frames) == 5:
+            node.quit()
+
+    node.update = update
+
+    thread = threading.Thread(target=node.run)
+    thread.start()
+    node.inbox.push(MidiMessage(type="start"))
+    thread.join(timeout=2.0)
+
+    assert not thread.is_alive()
+    assert len(frames) == 5
+    assert node.running
+
+
+def test_schedule_trigger_with_lookahead():
+    node = Node("LookaheadNode", headless=True, lookahead=0.02)
+    fired = threading.Event()
+    try:
+        node.schedule_trigger(MidiMessage(type="clock", timestamp=time.time()), fired.set)
+        assert not fired.is_set()
+        assert fired.wait(1.0)
+
+        # タイムスタンプのないメッセージはすぐに実行する
+        immediate = []
+        node.schedule_trigger(MidiMessage(type="clock"), lambda: immediate.append(True))
+        assert immediate == [True]
+    finally:
+        node.close()
+
+
+def test_clock_sync_with_master_over_bus():
+    bus = LocalBus(remote=False)
+    master = Node("Master", headless=True, bus=bus, clock_master=True)
+    follower = Node("Follower", headless=True, inbox=True, bus=bus, clock_sync=True, subscribe_types=["clock", "start"])
+    try:
+        # pingはマスターが受信スレッドで即座に応答し、on_midi()には渡さない
+        follower._frame_update()
+        stats = follower.sync_stats()
+        assert stats.pings_sent == 1
+        assert stats.pongs_received == 1
+        assert stats.rtt_ms >= 0
+        assert len(follower.inbox) == 0
+        assert master.sync_stats().pings_sent == 0
+    finally:
+        bus.close()
+
+
+def test_recovered_pulses_get_their_own_timestamps():
+    node = Node("Follower", headless=True, clock_sync=True, bus=LocalBus(remote=False))
+    received = []
+    node._deliver = received.append
+    interval = 60.0 / (120 * 24)
+    try:
+        for pulse in (0, 1, 4):
+            node._receive(MidiMessage(type="clock", timestamp=100.0 + pulse * interval))
+    finally:
+        node.close()
+
+    # 欠落した2パルスは1間隔ずつ前のタイムスタンプで補う
+    assert [msg.timestamp for msg in received] == pytest.approx([100.0 + pulse * interval for pulse in range(5)])
+
+
+def test_idle_throttling_wakes_on_midi():
+    bus = LocalBus(remote=False)
+    node = Node("IdleNode", headless=True, bus=bus, fps=100, idle_fps=2, idle_after=0.0)
+    sender = Node("Sender", headless=True, bus=bus)
+    frames = []
+    node.update = lambda: frames.append(time.perf_counter())
+
+    thread = threading.Thread(target=node.run)
+    thread.start()
+    try:
+        # 停止中は2fpsに下がる
+        time.sleep(0.3)
+        assert node.idle and len(frames) <= 2
+        # MIDIを受信するとすぐに起きて、再生中は通常のフレームレートに戻る
+        sent = time.perf_counter()
+        sender.midi_node.send_message(MidiMessage(type="start"))
+        time.sleep(0.2)
+        assert node.running and not node.idle
+        assert frames[-1] - sent > 0.1 and [t for t in frames if t > sent][0] - sent < 0.05
+        assert len([t for t in frames if t > sent]) >= 10
+    finally:
+        node.quit()
+        thread.join(timeout=2.0)
+        sender.close()
+    assert not thread.is_alive()
+
+
+def test_idle_frames_are_skipped_between_pyxel_updates():
+    node = Node("IdleNode", headless=True, idle_fps=10, idle_after=0.0)
+    drawn = []
+    node.draw = lambda: drawn.append(1)
+    try:
+        # Pyxelが遅れを取り戻すために続けて呼ぶupdate()は、アイドル中は最初の1回だけ処理する
+        for _ in range(5):
+            node._frame_update()
+        assert node.idle
+        start = time.perf_counter()
+        node._frame_draw()
+        assert len(drawn) == 0 and time.perf_counter() - start > 0.05
+        node._frame_update()
+        node._frame_draw()
+        assert len(drawn) == 1
+    finally:
+        node.close()
+
+
+def test_follower_recovers_lost_transport_within_one_tick():
+    bus = LocalBus(remote=False)
+    master = Node("Master", headless=True, bus=bus, reliable=True)
+    follower = Node("Follower", headless=True, bus=LocalBus(remote=False))
+    datagrams = []
+    # 他プロセスへ送るデータグラムを記録する
+    bus.uplink = object()
+    bus.send_remote = lambda sender, msgs: datagrams.append(encode_batch(msgs, sender.node_name, WIRE_FORMAT_BINARY))
+    try:
+        master.midi_node.send_message(MidiMessage(type="start"))
+        master.midi_node.send_message(MidiMessage(type="clock"))
+        master.midi_node.send_message(MidiMessage(type="stop"))
+        master._frame_update()  # 停止後は送信がなくても次のフレームでstopを繰り返す
+        assert [len(decode_packet(data)) for (data,) in datagrams] == [1, 2, 2, 1]
+
+        # startを失っても次のクロックで再生状態とPPQが揃う
+        follower.midi_node.handle_packet(datagrams[1][0])
+        assert follower.running and follower.ppq_count == 1
+        # stopを失っても次のフレームの繰り返しで止まる
+        follower.midi_node.handle_packet(datagrams[3][0])
+        assert not follower.running
+        assert follower.midi_node.sequences.stats()["master"] == SequenceStats(received=3, lost=0)
+    finally:
+        bus.uplink = None
+        master.close()
+        follower.close()
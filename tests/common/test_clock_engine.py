@@ -0,0 +1,51 @@
+import threading
+import time
+
+from src.common.clock_engine import ClockEngine
+
+
+def test_clock_engine_emits_pulses_at_tempo():
+    pulses = []
+    done = threading.Event()
+
+    def on_pulse(pulse, deadline_ns):
+        pulses.append((pulse, deadline_ns))
+        if len(pulses) == 48:
+            done.set()
+
+    # 240 BPM = 約10.4msごとのパルス（30fpsのフレーム間隔より短い）
+    engine = ClockEngine(240, on_pulse)
+    try:
+        engine.start()
+        assert done.wait(2.0)
+        engine.stop()
+    finally:
+        engine.close()
+
+    assert [p for p, _ in pulses[:48]] == list(range(48))
+    # 締め切りは開始時刻からの絶対時刻で等間隔に並ぶ
+    intervals = {b - a for (_, a), (_, b) in zip(pulses, pulses[1:48])}
+    assert intervals == {engine._calculate_interval_ns(240)}
+
+    stats = engine.stats()
+    assert stats.pulses >= 48
+    assert stats.jitter_ms >= 0.0
+
+
+def test_clock_engine_stop_and_bpm_change():
+    pulses = []
+    engine = ClockEngine(120, lambda pulse, deadline_ns: pulses.append(deadline_ns))
+    try:
+        engine.start()
+        time.sleep(0.1)
+        engine.set_bpm(240)
+        time.sleep(0.1)
+        engine.stop()
+        count = len(pulses)
+        time.sleep(0.05)
+        assert len(pulses) == count
+    finally:
+        engine.close()
+
+    assert engine.interval == engine._calculate_interval_ns(240) / 1e9
+    assert not engine.thread.is_alive()
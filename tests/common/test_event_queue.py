@@ -0,0 +1,54 @@
+import threading
+
+from src.common.event_queue import EventInbox
+from src.common.midi_utils import MidiMessage
+
+
+def test_drain_in_order_and_latency():
+    inbox = EventInbox(capacity=8)
+    for i in range(5):
+        assert inbox.push(MidiMessage(type="note_on", note=i))
+
+    received = []
+    assert inbox.drain(lambda msg: received.append(msg.note)) == 5
+    assert received == [0, 1, 2, 3, 4]
+    assert len(inbox) == 0
+
+    stats = inbox.stats()
+    assert stats.delivered == 5
+    assert stats.overflows == 0
+    assert stats.max_latency_ms >= stats.last_latency_ms >= 0.0
+
+
+def test_overflow_drops_newest():
+    inbox = EventInbox(capacity=4)
+    results = [inbox.push(MidiMessage(type="clock", value=i)) for i in range(6)]
+    assert results == [True, True, True, True, False, False]
+    assert inbox.overflows == 2
+
+    received = []
+    inbox.drain(lambda msg: received.append(msg.value), max_items=3)
+    assert received == [0, 1, 2]
+    # 空きができたので再び追加できる（リングバッファの折り返し）
+    assert inbox.push(MidiMessage(type="clock", value=9))
+    inbox.drain(lambda msg: received.append(msg.value))
+    assert received == [0, 1, 2, 3, 9]
+
+
+def test_producer_thread():
+    inbox = EventInbox(capacity=64)
+    total = 10_000
+    received = []
+
+    def produce():
+        for i in range(total):
+            while not inbox.push(MidiMessage(type="clock", value=i)):
+                pass
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while len(received) < total:
+        inbox.drain(lambda msg: received.append(msg.value))
+    producer.join()
+
+    assert received == list(range(total))
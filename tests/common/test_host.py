@@ -0,0 +1,51 @@
+import threading
+import time
+
+from src.common.base_node import Node
+from src.common.host import NodeHost, load_node_class
+from src.common.midi_utils import MidiMessage
+from src.nodes._0000_rhythm_gen import RhythmGeneratorNode
+from src.nodes._0001_rhythm import RhythmNode
+
+
+def test_load_node_class():
+    assert load_node_class("src.nodes._0001_rhythm:RhythmNode") is RhythmNode
+
+
+class SenderNode(Node):
+    def __init__(self, **kwargs):
+        super().__init__("Sender", **kwargs)
+
+
+def test_local_delivery_without_udp():
+    host = NodeHost([RhythmNode, SenderNode], remote=False)
+    try:
+        rhythm, sender = host.nodes
+        msg = MidiMessage(type="start")
+        sender.midi_node.send_message(msg)
+
+        # 送信元には配信されず、他のノードには同じオブジェクトが渡る
+        assert len(sender.inbox) == 0
+        assert len(rhythm.inbox) == 1
+        host.process_messages()
+        assert rhythm.running
+        assert msg.source == "sender"
+    finally:
+        host.close()
+
+
+def test_host_runs_generator_and_follower_in_one_loop():
+    host = NodeHost([(RhythmGeneratorNode, {"bpm": 240, "autostart": True}), RhythmNode], fps=60, remote=False)
+    generator, follower = host.nodes
+
+    thread = threading.Thread(target=host.run)
+    thread.start()
+    time.sleep(0.3)
+    host.quit()
+    thread.join(timeout=2.0)
+
+    assert not thread.is_alive()
+    assert follower.running
+    assert follower.synced
+    # フォロワーにはすべてのクロックが届いている（終了直前の分は受信キューに残る）
+    assert generator.clock_engine.stats().pulses % 24 == (follower.ppq_count + len(follower.inbox)) % 24
@@ -0,0 +1,125 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.common.launcher import Patch, Supervisor
+
+CLOCK = "src.nodes._0000_rhythm_gen:RhythmGeneratorNode"
+RHYTHM = "src.nodes._0001_rhythm:RhythmNode"
+
+
+def _poll_until(supervisor, predicate, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        supervisor.wait(0.05)
+    return predicate()
+
+
+def test_patch_merges_bus_settings_and_validates():
+    patch = Patch.from_dict(
+        {
+            "bus": {"session": "live", "wire_format": "binary"},
+            "supervisor": {"restart_delay": 0.1},
+            "nodes": [
+                {"name": "clock", "class": CLOCK, "params": {"bpm": 90}},
+                {"name": "rhythm", "class": RHYTHM, "bus": {"wire_format": "json"}, "restart": False},
+            ],
+        }
+    )
+    clock, rhythm = patch.nodes
+    assert clock.params == {"bpm": 90} and clock.bus == {"session": "live", "wire_format": "binary"}
+    assert rhythm.bus == {"session": "live", "wire_format": "json"} and not rhythm.restart
+    assert patch.supervisor.restart_delay == 0.1 and patch.supervisor.health_timeout == 5.0
+
+    with pytest.raises(ValueError, match="duplicate"):
+        Patch.from_dict({"nodes": [{"name": "a", "class": RHYTHM}, {"name": "a", "class": RHYTHM}]})
+    with pytest.raises(ValueError, match="module:Class"):
+        Patch.from_dict({"nodes": [{"name": "a", "class": "RhythmNode"}]})
+    with pytest.raises(ValueError, match="unknown keys in bus"):
+        Patch.from_dict({"bus": {"port": 5000}, "nodes": [{"name": "a", "class": RHYTHM}]})
+    with pytest.raises(ValueError, match="wire format"):
+        Patch.from_dict({"nodes": [{"name": "a", "class": RHYTHM, "bus": {"wire_format": "xml"}}]})
+    with pytest.raises(ValueError, match="no nodes"):
+        Patch.from_dict({"nodes": []})
+
+
+def test_health_timeout_covers_idle_heartbeat_gap():
+    patch = Patch.from_dict(
+        {
+            "supervisor": {"heartbeat": 1.0, "health_timeout": 5.0},
+            "nodes": [
+                {"name": "busy", "class": RHYTHM, "params": {"idle_fps": 2}},
+                {"name": "sleepy", "class": RHYTHM, "params": {"idle_fps": 0.1}},
+            ],
+        }
+    )
+    busy, sleepy = patch.nodes
+    assert busy.health_timeout == 5.0
+    assert sleepy.health_timeout == 21.0
+
+    # アイドル中の状態の間隔より短い時間で応答なしとみなさない
+    supervisor = Supervisor(patch, log=lambda line: None)
+    node = supervisor.nodes["sleepy"]
+    node.process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        node.started_at = node.last_heartbeat = 100.0
+        supervisor._check(node, 115.0)
+        assert node.process is not None
+        supervisor._check(node, 122.0)
+        assert node.process is None and node.next_start is not None
+    finally:
+        supervisor.stop()
+
+    with pytest.raises(ValueError, match="idle_fps"):
+        Patch.from_dict({"nodes": [{"name": "a", "class": RHYTHM, "params": {"idle_fps": 0}}]})
+
+
+def test_nodes_start_in_parallel_and_crashed_node_is_restarted():
+    patch = Patch.from_dict(
+        {
+            "bus": {"session": "launcher-test", "loopback_only": True, "reliable": True},
+            "supervisor": {"heartbeat": 0.2, "restart_delay": 0.1},
+            "nodes": [
+                {"name": "clock", "class": CLOCK, "params": {"headless": True, "autostart": True, "bpm": 240}},
+                {"name": "rhythm", "class": RHYTHM, "params": {"headless": True, "inbox": True}},
+            ],
+        }
+    )
+    logs = []
+    supervisor = Supervisor(patch, log=logs.append)
+    try:
+        supervisor.start()
+        assert supervisor.wait_ready(20.0), logs
+
+        rhythm = supervisor.nodes["rhythm"]
+        os.kill(rhythm.process.pid, signal.SIGKILL)
+        assert _poll_until(supervisor, lambda: rhythm.restarts == 1 and rhythm.ready), logs
+        assert supervisor.nodes["clock"].restarts == 0
+        assert any("rhythm: exited with code" in line and "restarting in 0.10s" in line for line in logs)
+    finally:
+        supervisor.stop()
+    assert all(node.process is None for node in supervisor.nodes.values())
+
+
+def test_failing_node_is_restarted_with_backoff():
+    patch = Patch.from_dict(
+        {
+            "supervisor": {"restart_delay": 0.05, "max_restart_delay": 0.2},
+            "nodes": [{"name": "broken", "class": "src.nodes._0001_rhythm:MissingNode"}],
+        }
+    )
+    logs = []
+    supervisor = Supervisor(patch, log=logs.append)
+    try:
+        supervisor.start()
+        broken = supervisor.nodes["broken"]
+        assert _poll_until(supervisor, lambda: broken.restarts >= 3 and broken.process is None)
+        delays = [line.rsplit(" ", 1)[1] for line in logs if "restarting in" in line]
+        assert delays[:4] == ["0.05s", "0.10s", "0.20s", "0.20s"][: len(delays[:4])]
+        assert len(delays) >= 3
+    finally:
+        supervisor.stop()
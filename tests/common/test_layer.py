@@ -0,0 +1,70 @@
+import pytest
+
+from src.common import pyxel_backend
+from src.common.layer import StaticLayer
+from src.common.pyxel_backend import HeadlessImage, pyxel
+from src.nodes._0003_advanced_rhythm import AdvancedRhythmNode
+
+
+@pytest.fixture(autouse=True)
+def headless():
+    pyxel.use_headless()
+    pyxel.init(16, 8)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_blt_skips_colkey_and_clips(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(pyxel_backend, "np", None)
+    image = HeadlessImage(4, 4)
+    image.rect(1, 1, 2, 2, 7)
+    pyxel.cls(1)
+    pyxel.blt(-1, 5, image, 0, 0, 4, 4, 0)
+    assert [pyxel.pget(x, 6) for x in range(3)] == [7, 7, 1]
+    assert pyxel.pget(0, 5) == 1  # 透明色
+    pyxel.blt(0, 0, image, 0, 0, 4, 4)
+    assert pyxel.pget(0, 0) == 0
+
+
+def test_layer_is_rebuilt_only_on_change():
+    calls = []
+
+    def render(image):
+        calls.append(1)
+        image.rect(0, 0, 2, 2, 7)
+
+    layer = StaticLayer(16, 8, render)
+    for _ in range(3):
+        pyxel.cls(0)
+        layer.draw(key=1)
+    assert layer.rebuilds == 1 and pyxel.pget(1, 1) == 7
+
+    layer.patch(lambda image, x: image.pset(x, 0, 8), 5)
+    layer.draw(key=1)
+    assert layer.rebuilds == 1 and pyxel.pget(5, 0) == 8
+
+    layer.draw(key=2)
+    layer.invalidate()
+    pyxel.cls(0)
+    layer.draw(key=2)
+    assert layer.rebuilds == 3 and pyxel.pget(5, 0) == 0
+
+
+def test_advanced_rhythm_redraws_only_toggled_cell():
+    node = AdvancedRhythmNode(headless=True)
+    try:
+        node.draw()
+        rebuilds = node.layer.rebuilds
+        node._toggle_step("kick", 1)
+        node.step = 4
+        node.draw()
+        assert node.layer.rebuilds == rebuilds
+        x, y = node.CELL_X + node.CELL_PITCH, node.ROW_Y
+        assert pyxel.pget(x, y) == 7  # 描き直したセル
+        assert pyxel.pget(x + 3 * node.CELL_PITCH, y) == 8  # 現在のステップ
+        node._toggle_mute("kick")
+        node.draw()
+        assert node.layer.rebuilds == rebuilds + 1
+        assert pyxel.pget(x, y) == 13
+    finally:
+        node.close()
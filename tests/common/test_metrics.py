@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from src.common.base_node import Node
+from src.common.metrics import NodeMetrics, RateMeter, RollingHistogram, StatsExporter, format_header, format_row
+from src.common.midi_utils import LocalBus, MidiMessage, MidiNode, WIRE_FORMAT_BINARY, encode_message
+
+
+def test_rolling_histogram_summary():
+    histogram = RollingHistogram(window=100)
+    for value in range(200):
+        histogram.add(float(value))
+
+    summary = histogram.summary()
+    assert histogram.total == 200
+    assert summary.count == 100
+    assert summary.mean == pytest.approx(149.5)
+    assert (summary.p50, summary.p95, summary.p99, summary.max) == (150.0, 195.0, 199.0, 199.0)
+    assert histogram.buckets([120.0, 180.0]) == [20, 60, 20]
+
+
+def test_rate_meter_counts_recent_events():
+    meter = RateMeter(window=1.0)
+    for i in range(12):
+        meter.mark(i * 0.25)
+    assert meter.rate(2.75) == 5.0
+
+
+def test_midi_node_records_decode_and_callback_time():
+    bus = LocalBus(remote=False)
+    node = MidiNode("synth", lambda msg: None, bus=bus)
+    node.metrics = NodeMetrics()
+    try:
+        for _ in range(3):
+            node.handle_packet(encode_message(MidiMessage(type="clock"), "gen", WIRE_FORMAT_BINARY))
+    finally:
+        node.close()
+
+    assert node.metrics.decode.summary().count == 3
+    assert node.metrics.callback.summary().count == 3
+    assert node.metrics.clock_interval.summary().count == 2
+
+
+def test_node_exports_stats_to_jsonl(tmp_path):
+    path = tmp_path / "stats.jsonl"
+    node = Node("TestNode", headless=True, inbox=True, metrics_export=str(path), metrics_interval=0.0)
+    try:
+        node.midi_node.handle_packet(encode_message(MidiMessage(type="start"), "gen"))
+        node._frame_update()
+        node._frame_update()
+        node._frame_draw()
+    finally:
+        node.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[-1]["node"] == "TestNode"
+    assert records[-1]["frame_interval"]["count"] == 1
+    assert records[-1]["inbox"]["delivered"] == 1
+    assert node.metrics.draw.total == 1
+
+
+def test_stats_exporter_sends_datagrams():
+    import socket
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1.0)
+    exporter = StatsExporter(f"udp://127.0.0.1:{receiver.getsockname()[1]}", interval=10.0)
+    try:
+        assert exporter.maybe_export({"node": "a"}, now=100.0)
+        assert not exporter.maybe_export({"node": "a"}, now=105.0)
+        assert json.loads(receiver.recv(65536)) == {"time": 100.0, "node": "a"}
+    finally:
+        exporter.close()
+        receiver.close()
+
+
+def test_format_row_with_and_without_metrics():
+    metrics = NodeMetrics()
+    metrics.update.add(1.5)
+    row = format_row({"node": "Synth", **metrics.snapshot()})
+    assert row.split()[0] == "Synth" and "1.500" in row
+    assert len(row) == len(format_header())
+
+    # 計測していないノード（ハートビートのみ）は値を "-" で表示する
+    row = format_row({"node": "Video", "pid": 123, "ready": True, "running": False})
+    assert row.split() == ["Video"] + ["-"] * 6
+    assert len(row) == len(format_header())
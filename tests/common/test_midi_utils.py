@@ -0,0 +1,332 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import pytest
+
+from src.common.midi_utils import (
+    BINARY_HEADER_SIZE,
+    ClockSync,
+    MidiMessage,
+    MidiNode,
+    MulticastTransport,
+    LocalBus,
+    MAX_DATAGRAM_SIZE,
+    SequenceStats,
+    SequenceTracker,
+    Subscription,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_JSON,
+    WIRE_FORMAT_JSON_EXT,
+    decode_message,
+    decode_packet,
+    encode_batch,
+    encode_message,
+    session_group,
+)
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_FORMAT_JSON, WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY])
+@pytest.mark.parametrize(
+    "msg",
+    [
+        MidiMessage(type="clock"),
+        MidiMessage(type="start"),
+        MidiMessage(type="note_on", note=60, velocity=127, channel=1),
+        MidiMessage(type="note_off", note=60, velocity=0, channel=1),
+        MidiMessage(type="control_change", control=7, value=0, channel=16),
+        MidiMessage(type="song_position", value=1024),
+        MidiMessage(type="clock", timestamp=1735689600.123456),
+        MidiMessage(type="ping", value=2**31 - 1, timestamp=1735689600.5),
+        MidiMessage(type="start", seq=2**32 - 1),
+        MidiMessage(type="clock", timestamp=1735689600.5, seq=7),
+    ],
+)
+def test_round_trip(msg, wire_format):
+    decoded = decode_message(encode_message(msg, "rhythmgenerator", wire_format))
+    expected = MidiMessage(**{**msg.__dict__, "source": "rhythmgenerator"})
+    if wire_format == WIRE_FORMAT_JSON:
+        expected.timestamp = expected.seq = None
+    assert decoded == expected
+
+
+@dataclass
+class BaselineMidiMessage:
+    """拡張フィールドを知らない従来のノードのMidiMessage"""
+
+    type: str
+    note: Optional[int] = None
+    velocity: Optional[int] = None
+    channel: Optional[int] = None
+    control: Optional[int] = None
+    value: Optional[int] = None
+    source: Optional[str] = None
+
+
+def test_json_stays_readable_by_baseline_nodes():
+    msgs = [MidiMessage(type="start", timestamp=1735689600.5, seq=3), MidiMessage(type="clock", timestamp=1735689600.52)]
+    for msg in msgs:
+        # 従来の受信ループと同じく MidiMessage(**辞書) で復元できる
+        assert BaselineMidiMessage(**json.loads(encode_message(msg, "gen", WIRE_FORMAT_JSON))).type == msg.type
+    with pytest.raises(TypeError):
+        BaselineMidiMessage(**json.loads(encode_message(msgs[0], "gen", WIRE_FORMAT_JSON_EXT)))
+
+    # reliableのJSONは連番を送るため拡張フィールド付きになる
+    node = MidiNode("gen", lambda msg: None, bus=LocalBus(remote=False), reliable=True)
+    assert node.wire_format == WIRE_FORMAT_JSON_EXT
+    node.close()
+
+
+def test_binary_is_compact():
+    msg = MidiMessage(type="clock")
+    data = encode_message(msg, "gen", WIRE_FORMAT_BINARY)
+    assert len(data) == BINARY_HEADER_SIZE + len("gen")
+    assert len(data) < len(encode_message(msg, "gen", WIRE_FORMAT_JSON))
+
+
+def test_binary_falls_back_to_json_for_unknown_type():
+    msg = MidiMessage(type="custom", value=1)
+    data = encode_message(msg, "gen", WIRE_FORMAT_BINARY)
+    assert data.startswith(b"{")
+    assert decode_message(data).type == "custom"
+
+
+def test_binary_rejects_unknown_version():
+    data = bytearray(encode_message(MidiMessage(type="clock"), "gen", WIRE_FORMAT_BINARY))
+    data[1] = 99
+    with pytest.raises(ValueError):
+        decode_message(bytes(data))
+
+
+def test_subscription_matches():
+    sub = Subscription(types=["note_on", "clock"], channels=[1], sources=["gen"])
+    assert sub.matches(MidiMessage(type="clock", source="gen"))
+    assert sub.matches(MidiMessage(type="note_on", channel=1, source="gen"))
+    assert not sub.matches(MidiMessage(type="note_on", channel=2, source="gen"))
+    assert not sub.matches(MidiMessage(type="stop", source="gen"))
+    assert not sub.matches(MidiMessage(type="clock", source="other"))
+
+
+def test_binary_packets_are_filtered_before_decode():
+    bus = LocalBus(remote=False)
+    node = MidiNode("synth", lambda msg: None, bus=bus, subscription=Subscription(types=["note_on"], channels=[1]))
+    try:
+        clock = encode_message(MidiMessage(type="clock"), "gen", WIRE_FORMAT_BINARY)
+        note_ch1 = encode_message(MidiMessage(type="note_on", note=60, velocity=1, channel=1), "gen", WIRE_FORMAT_BINARY)
+        note_ch2 = encode_message(MidiMessage(type="note_on", note=60, velocity=1, channel=2), "gen", WIRE_FORMAT_BINARY)
+        own = encode_message(MidiMessage(type="note_on", channel=1), "synth", WIRE_FORMAT_BINARY)
+        json_clock = encode_message(MidiMessage(type="clock"), "gen", WIRE_FORMAT_JSON)
+
+        assert not node._accept_packet(clock)
+        assert node._accept_packet(note_ch1)
+        assert not node._accept_packet(note_ch2)
+        assert not node._accept_packet(own)
+        # JSONはデコード後に判定する
+        assert node._accept_packet(json_clock)
+        assert not node.accepts(decode_message(json_clock))
+        assert node.filtered == 3
+    finally:
+        node.close()
+
+
+def test_local_bus_applies_subscription():
+    bus = LocalBus(remote=False)
+    received = []
+    sender = MidiNode("gen", lambda msg: None, bus=bus)
+    receiver = MidiNode("synth", received.append, bus=bus, subscription=Subscription(types=["note_on"]))
+
+    sender.send_message(MidiMessage(type="clock"))
+    sender.send_message(MidiMessage(type="note_on", note=60, velocity=100))
+
+    assert [msg.type for msg in received] == ["note_on"]
+    receiver.close()
+    sender.close()
+
+
+def test_session_group():
+    assert session_group("show-a") == session_group("show-a")
+    assert session_group("show-a") != session_group("show-b")
+    assert session_group(0) == "239.255.1.1"
+
+
+def test_multicast_sessions_are_isolated():
+    received_a = []
+    received_b = []
+    transport_a = MulticastTransport.for_session("test-a", port=5099, loopback_only=True)
+    transport_b = MulticastTransport.for_session("test-b", port=5099, loopback_only=True)
+    sender = MidiNode("sender", lambda msg: None, transport=transport_a)
+    node_a = MidiNode("node_a", received_a.append, transport=transport_a)
+    node_b = MidiNode("node_b", received_b.append, transport=transport_b)
+    try:
+        sender.send_message(MidiMessage(type="start"))
+        for _ in range(100):
+            if received_a:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+    finally:
+        sender.close()
+        node_a.close()
+        node_b.close()
+
+    assert [msg.type for msg in received_a] == ["start"]
+    assert received_b == []
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_FORMAT_JSON, WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY])
+def test_batch_round_trip_and_split(wire_format):
+    msgs = [MidiMessage(type="note_on", note=i, velocity=100, channel=10) for i in range(40)]
+    datagrams = encode_batch(msgs, "adv", wire_format)
+
+    assert all(len(data) <= MAX_DATAGRAM_SIZE for data in datagrams)
+    decoded = [msg for data in datagrams for msg in decode_packet(data)]
+    assert [msg.note for msg in decoded] == list(range(40))
+    assert {msg.source for msg in decoded} == {"adv"}
+
+
+def test_json_batch_stays_readable_by_baseline_nodes():
+    msgs = [MidiMessage(type="note_on", note=36, velocity=100, timestamp=1735689600.5), MidiMessage(type="clock")]
+    datagrams = encode_batch(msgs, "adv", WIRE_FORMAT_JSON)
+
+    # 従来の受信ループと同じく、1データグラムずつ MidiMessage(**辞書) で復元できる
+    assert len(datagrams) == 2
+    decoded = [BaselineMidiMessage(**json.loads(data)) for data in datagrams]
+    assert [(msg.type, msg.note, msg.source) for msg in decoded] == [("note_on", 36, "adv"), ("clock", None, "adv")]
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY])
+def test_handle_batch_packet_in_order_with_filter(wire_format):
+    bus = LocalBus(remote=False)
+    received = []
+    node = MidiNode("synth", received.append, bus=bus, subscription=Subscription(channels=[1]))
+    try:
+        msgs = [
+            MidiMessage(type="note_on", note=60, velocity=100, channel=1),
+            MidiMessage(type="note_on", note=61, velocity=100, channel=2),
+            MidiMessage(type="clock"),
+            MidiMessage(type="note_off", note=60, velocity=0, channel=1),
+        ]
+        (data,) = encode_batch(msgs, "adv", wire_format)
+        node.handle_packet(data)
+    finally:
+        node.close()
+
+    assert [(msg.type, msg.note) for msg in received] == [("note_on", 60), ("clock", None), ("note_off", 60)]
+
+
+def test_local_bus_batch_delivery():
+    bus = LocalBus(remote=False)
+    received = []
+    sender = MidiNode("adv", lambda msg: None, bus=bus)
+    receiver = MidiNode("video", received.append, bus=bus)
+
+    sender.send_batch([MidiMessage(type="note_on", note=36), MidiMessage(type="note_on", note=42)])
+
+    assert [(msg.note, msg.source) for msg in received] == [(36, "adv"), (42, "adv")]
+    receiver.close()
+    sender.close()
+
+
+def test_clock_sync_estimates_offset_and_rtt():
+    master = ClockSync(master=True)
+    follower = ClockSync(ping_interval=1.0)
+
+    # マスターの時計が2秒進んでおり、片道10msかかる
+    ping = follower.poll(100.0)
+    assert follower.poll(100.5) is None
+    pong = master.on_ping(ping, 102.010)
+    follower.on_pong(pong, 100.020)
+
+    stats = follower.stats()
+    assert stats.rtt_ms == pytest.approx(20.0)
+    assert stats.offset_ms == pytest.approx(2000.0)
+    assert follower.to_local_time(102.010) == pytest.approx(100.010)
+    # 自分宛てでない応答は無視する
+    follower.on_pong(MidiMessage(type="pong", value=pong.value, timestamp=0.0), 100.030)
+    assert follower.stats().pongs_received == 1
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_FORMAT_JSON, WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY])
+def test_clock_sync_over_the_wire(wire_format):
+    master = ClockSync(master=True)
+    follower = ClockSync(ping_interval=1.0)
+
+    ping = decode_message(encode_message(follower.poll(100.0), "follower", wire_format))
+    data = encode_message(master.on_ping(ping, 102.010), "gen", wire_format)
+    if wire_format == WIRE_FORMAT_JSON:
+        # 従来のノードもpongを受信できる
+        assert BaselineMidiMessage(**json.loads(data)).type == "pong"
+    follower.on_pong(decode_message(data), 100.020)
+
+    stats = follower.stats()
+    assert stats.pongs_received == 1
+    assert stats.rtt_ms == pytest.approx(20.0)
+    assert stats.offset_ms == pytest.approx(2000.0)
+
+
+def test_clock_sync_recovers_missing_pulses_and_flywheels():
+    sync = ClockSync()
+    interval = 60.0 / (120 * 24)
+
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=0.0), 0.0) == 1
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=interval), interval) == 1
+    assert sync.bpm == pytest.approx(120.0)
+
+    # 2パルス分が欠落
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=4 * interval), 4 * interval) == 3
+    assert sync.stats().recovered_pulses == 2
+
+    # クロックが途絶えたら推定したテンポで自走し、後から届いたクロックで相殺する
+    assert sync.flywheel(4.6 * interval) == 0
+    assert sync.flywheel(6.6 * interval) == 2
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=5 * interval), 6.7 * interval) == 0
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=6 * interval), 6.8 * interval) == 0
+    assert sync.on_clock(MidiMessage(type="clock", timestamp=7 * interval), 7 * interval) == 1
+    assert sync.stats().flywheel_pulses == 2
+
+
+def test_sequence_tracker_counts_gaps_duplicates_and_resets():
+    tracker = SequenceTracker()
+    accepted = [tracker.accept("gen", seq) for seq in [2**32 - 2, 2**32 - 1, 2, 2, 0, 0, 1]]
+    # 一周した連番の飛び（0と1の欠け）は、後から届くと欠落から差し引く
+    assert accepted == [True, True, True, False, True, False, True]
+    assert tracker.stats()["gen"] == SequenceStats(received=5, lost=0, duplicates=2, reordered=2, resets=0)
+
+    assert tracker.accept("gen", 10)  # 3-9が欠けた
+    assert tracker.accept("gen", 5000)  # 送信元の再起動
+    assert tracker.accept("gen", 5001)
+    assert tracker.accept("other", 10)
+    stats = tracker.stats()
+    assert (stats["gen"].lost, stats["gen"].resets) == (7, 1)
+    assert stats["other"] == SequenceStats(received=1)
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_FORMAT_JSON_EXT, WIRE_FORMAT_BINARY])
+def test_reliable_transport_messages_survive_loss(wire_format):
+    bus = LocalBus(remote=False)
+    sender = MidiNode("gen", lambda msg: None, bus=bus, reliable=True, repeats=2)
+    received = []
+    receiver = MidiNode("synth", received.append, bus=bus, subscription=Subscription(types=["start", "stop"]))
+    try:
+        msgs = [MidiMessage(type="start")] + [MidiMessage(type="clock") for _ in range(3)]
+        datagrams = [encode_batch(sender.sequence_outgoing([msg]), "gen", wire_format) for msg in msgs]
+        assert [len(decode_packet(data)) for (data,) in datagrams] == [1, 2, 2, 1]
+
+        # startのデータグラムを失っても、次のクロックのデータグラムで届く（以降の繰り返しは重複として捨てる）
+        for (data,) in datagrams[1:]:
+            receiver.handle_packet(data)
+        assert [msg.type for msg in received] == ["start"]
+        # 受信条件で捨てたクロックは欠落に数えない
+        assert receiver.sequence_stats() == {}  # バス経由では他プロセスからの受信分だけを数える
+        assert receiver.sequences.stats()["gen"] == SequenceStats(received=4, duplicates=1)
+
+        # 停止後に送信がなくても、resend_pending()で繰り返し送る
+        sent = []
+        bus.send_remote = lambda node, msgs: sent.append([msg.type for msg in msgs])
+        sender.sequence_outgoing([MidiMessage(type="stop")])
+        assert sender.resend_pending() == 1 and sender.resend_pending() == 1 and sender.resend_pending() == 0
+        assert sent == [["stop"], ["stop"]]
+    finally:
+        receiver.close()
+        sender.close()
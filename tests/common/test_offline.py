@@ -0,0 +1,54 @@
+from src.common.offline import OfflineRenderer
+from src.common.pyxel_backend import HeadlessImage
+from src.common.recorder import LogReader
+from src.nodes._0000_rhythm_gen.rhythm_generator_node import RhythmGeneratorNode
+from src.nodes._0001_rhythm.rhythm_node import RhythmNode
+
+
+def test_headless_image_draws_into_buffer(tmp_path):
+    image = HeadlessImage(16, 8)
+    image.cls(1)
+    image.rect(2, 2, 3, 2, 7)
+    image.circ(12, 4, 1, 8)
+    assert image.pget(0, 0) == 1
+    assert [image.pget(x, 2) for x in range(1, 6)] == [1, 7, 7, 7, 1]
+    assert image.pget(12, 4) == 8 and image.pget(12, 3) == 8 and image.pget(11, 3) == 1
+    # 画面外への描画は切り捨てる
+    image.rect(-4, -4, 100, 1, 9)
+    assert image.pget(15, 0) == 1
+
+    path = tmp_path / "image.png"
+    image.save(str(path), scale=2)
+    assert path.read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
+
+
+def test_render_with_generator_sends_clocks_on_virtual_time(tmp_path):
+    log = tmp_path / "notes.pxlog"
+    renderer = OfflineRenderer(
+        [(RhythmGeneratorNode, {"bpm": 120}), RhythmNode],
+        fps=10,
+        frames_dir=str(tmp_path / "frames"),
+        capture=["SimpleRhythm"],
+        note_log=str(log),
+    )
+    rhythm = renderer.host.nodes[1]
+    try:
+        stats = renderer.render(beats=8)
+    finally:
+        renderer.close()
+
+    # 120BPMで8拍 = 4秒
+    assert stats.simulated_sec == 4.0
+    assert stats.pulses == 8 * 24
+    assert stats.frames == 40
+    assert stats.captured == 40
+    assert len(list((tmp_path / "frames").glob("SimpleRhythm_*.png"))) == 40
+    assert rhythm.ppq_count == 0 and not rhythm.running
+
+    reader = LogReader(str(log))
+    records = list(reader.messages())
+    reader.close()
+    clocks = [timestamp for timestamp, msg in records if msg.type == "clock"]
+    assert len(clocks) == 8 * 24
+    assert abs(clocks[-1] - 4.0) < 1e-9
+    assert records[0][1].type == "start" and records[-1][1].type == "stop"
@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import pytest
+
+from src.common.midi_utils import MidiMessage, MidiNode, MulticastTransport
+from src.common.receive_engine import SO_RXQ_OVFL, ReceiveEngine
+
+
+def _transport(name: str) -> MulticastTransport:
+    return MulticastTransport.for_session(name, port=5098, loopback_only=True)
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_one_thread_receives_many_sockets_and_closes_quickly():
+    engine = ReceiveEngine()
+    engine.start()
+    received_a = []
+    received_b = []
+    transport = _transport("engine-many")
+    sender = MidiNode("sender", lambda msg: None, transport=transport)
+    node_a = MidiNode("node_a", received_a.append, transport=transport, receive_engine=engine)
+    node_b = MidiNode("node_b", received_b.append, transport=transport, receive_engine=engine)
+    try:
+        for i in range(50):
+            sender.send_message(MidiMessage(type="note_on", note=i, velocity=100, channel=1))
+        assert _wait(lambda: len(received_a) == 50 and len(received_b) == 50)
+        assert [msg.note for msg in received_a] == list(range(50))
+        stats = node_a.receive_stats()
+        assert stats.datagrams == 50 and stats.wakeups <= 50 and stats.rcvbuf > 0
+        assert stats.kernel_drops == 0 and stats.errors == 0
+        assert sender.receive_stats() is None
+    finally:
+        sender.close()
+        node_a.close()
+        node_b.close()
+        start = time.perf_counter()
+        engine.close()
+    assert time.perf_counter() - start < 0.5
+    assert not engine._thread.is_alive()
+
+
+@pytest.mark.skipif(SO_RXQ_OVFL is None, reason="SO_RXQ_OVFL is Linux only")
+def test_kernel_drops_are_counted():
+    # 受信バッファを小さくし、読み出す前に溢れさせる
+    engine = ReceiveEngine(rcvbuf=4096)
+    received = []
+    transport = _transport("engine-drops")
+    sender = MidiNode("sender", lambda msg: None, transport=transport)
+    node = MidiNode("node", received.append, transport=transport, receive_engine=engine)
+    try:
+        for _ in range(500):
+            sender.send_message(MidiMessage(type="clock"))
+        time.sleep(0.05)
+        while engine.poll(0):
+            pass
+        # 捨てた数は、その後に受信バッファに入ったデータグラムとともに届く
+        sender.send_message(MidiMessage(type="clock"))
+        time.sleep(0.05)
+        while engine.poll(0):
+            pass
+        stats = node.receive_stats()
+        assert stats.kernel_drops > 0
+        assert stats.datagrams == len(received) and stats.datagrams + stats.kernel_drops == 501
+        # 1回の起床でまとめて読み出す
+        assert stats.max_batch > 1
+    finally:
+        sender.close()
+        node.close()
+        engine.close()
+
+
+def test_attach_to_asyncio_loop():
+    engine = ReceiveEngine()
+    received = []
+    transport = _transport("engine-asyncio")
+    sender = MidiNode("sender", lambda msg: None, transport=transport)
+    node = MidiNode("node", received.append, transport=transport, receive_engine=engine)
+
+    async def main():
+        engine.attach(asyncio.get_running_loop())
+        await asyncio.sleep(0.01)
+        sender.send_message(MidiMessage(type="start"))
+        for _ in range(200):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        node.close()
+        engine.close()
+        await asyncio.sleep(0)
+
+    try:
+        asyncio.run(main())
+    finally:
+        sender.close()
+    assert [msg.type for msg in received] == ["start"]
+
+
+def test_receive_thread_is_joined_on_close():
+    node = MidiNode("node", lambda msg: None, transport=_transport("engine-legacy"))
+    start = time.perf_counter()
+    node.close()
+    assert time.perf_counter() - start < 0.5
+    assert not node.thread.is_alive()
+
+
+def test_failing_callback_is_counted_and_does_not_stop_the_engine():
+    engine = ReceiveEngine()
+    engine.start()
+    received = []
+
+    def callback(msg):
+        if msg.note == 1:
+            raise RuntimeError("broken handler")
+        received.append(msg.note)
+
+    transport = _transport("engine-errors")
+    sender = MidiNode("sender", lambda msg: None, transport=transport)
+    node = MidiNode("node", callback, transport=transport, receive_engine=engine)
+    try:
+        for i in range(3):
+            sender.send_message(MidiMessage(type="note_on", note=i, velocity=100, channel=1))
+        assert _wait(lambda: len(received) == 2)
+        assert received == [0, 2]
+        assert node.receive_stats().errors == 1
+        assert engine._thread.is_alive()
+    finally:
+        sender.close()
+        node.close()
+        engine.close()
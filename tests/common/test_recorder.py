@@ -0,0 +1,64 @@
+from src.common.midi_utils import LocalBus, MidiMessage, MidiNode, WIRE_FORMAT_JSON, encode_message
+from src.common.recorder import BusRecorder, LogReader, Replayer
+
+
+def record_sample(path, count=10):
+    recorder = BusRecorder(str(path), index_interval=1.0)
+    for i in range(count):
+        recorder.write(encode_message(MidiMessage(type="clock"), "gen", WIRE_FORMAT_JSON), timestamp=100.0 + i * 0.5)
+    recorder.close()
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    path = tmp_path / "show.pxlog"
+    record_sample(path)
+
+    reader = LogReader(str(path))
+    try:
+        timestamps = [timestamp for timestamp, _ in reader.records()]
+        assert timestamps == [100.0 + i * 0.5 for i in range(10)]
+        # 索引で途中から読み出す
+        assert [timestamp for timestamp, _ in reader.records(start=102.2, end=103.5)] == [102.5, 103.0]
+        assert {msg.source for _, msg in reader.messages()} == {"gen"}
+    finally:
+        reader.close()
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = tmp_path / "show.pxlog"
+    record_sample(path, count=3)
+    with open(path, "ab") as f:
+        f.write(b"\x00\x01")
+
+    reader = LogReader(str(path))
+    assert len(list(reader.records())) == 3
+    reader.close()
+
+
+def test_records_local_bus_messages(tmp_path):
+    path = tmp_path / "bus.pxlog"
+    bus = LocalBus(remote=False)
+    recorder = BusRecorder(str(path)).attach(bus)
+    sender = MidiNode("gen", lambda msg: None, bus=bus)
+    sender.send_message(MidiMessage(type="note_on", note=60, velocity=100, channel=1))
+    sender.close()
+    recorder.close()
+
+    reader = LogReader(str(path))
+    [(_, msg)] = list(reader.messages())
+    reader.close()
+    assert (msg.type, msg.note, msg.source) == ("note_on", 60, "gen")
+
+
+def test_replay_as_fast_as_possible_and_scaled(tmp_path):
+    path = tmp_path / "show.pxlog"
+    record_sample(path)
+
+    packets = []
+    stats = Replayer(str(path), speed=None, sink=packets.append).run()
+    assert stats.packets == len(packets) == 10
+
+    # 4.5秒分の記録を100倍速で再生
+    stats = Replayer(str(path), speed=100.0, sink=packets.append).run()
+    assert stats.packets == 10
+    assert 0.04 <= stats.elapsed_sec < 0.5
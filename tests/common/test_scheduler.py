@@ -0,0 +1,61 @@
+import threading
+import time
+
+from src.common.scheduler import EventScheduler
+
+
+def test_callbacks_fire_in_time_order():
+    scheduler = EventScheduler()
+    fired = []
+    done = threading.Event()
+    try:
+        now = time.time()
+        scheduler.schedule_at(now + 0.06, lambda: (fired.append("c"), done.set()))
+        scheduler.schedule_at(now + 0.02, lambda: fired.append("a"))
+        scheduler.schedule_at(now + 0.04, lambda: fired.append("b"))
+        assert done.wait(1.0)
+        stats = scheduler.stats()
+    finally:
+        scheduler.close()
+
+    assert fired == ["a", "b", "c"]
+    assert stats.scheduled == stats.fired == 3
+    assert stats.late == 0
+
+
+def test_past_deadline_fires_immediately_and_clear_cancels():
+    scheduler = EventScheduler()
+    fired = threading.Event()
+    cancelled = []
+    try:
+        scheduler.schedule_at(time.time() + 0.05, lambda: cancelled.append(True))
+        scheduler.clear()
+        scheduler.schedule_at(time.time() - 1.0, fired.set)
+        assert fired.wait(1.0)
+        time.sleep(0.1)
+        assert scheduler.stats().late == 1
+    finally:
+        scheduler.close()
+
+    assert cancelled == []
+    assert not scheduler.thread.is_alive()
+
+
+def test_failing_callback_does_not_stop_later_events():
+    scheduler = EventScheduler()
+    fired = threading.Event()
+
+    def fail():
+        raise TypeError("broken trigger")
+
+    try:
+        now = time.time()
+        scheduler.schedule_at(now + 0.01, fail)
+        scheduler.schedule_at(now + 0.02, fired.set)
+        assert fired.wait(1.0)
+        assert scheduler.thread.is_alive()
+        stats = scheduler.stats()
+    finally:
+        scheduler.close()
+
+    assert stats.fired == 2 and stats.errors == 1
@@ -1,2 +1,21 @@
+from src.common.midi_utils import MidiMessage
+from src.nodes._0001_rhythm import RhythmNode
+
+
 def test_dummy():
     assert True
+
+
+def test_rhythm_node_steps_on_sixteenth_notes():
+    node = RhythmNode(headless=True)
+    try:
+        node.on_midi(MidiMessage(type="start"))
+        assert node.step == 0
+        for _ in range(6):
+            node.on_midi(MidiMessage(type="clock"))
+        assert node.step == 1
+        for _ in range(18):
+            node.on_midi(MidiMessage(type="clock"))
+        assert node.step == 0
+    finally:
+        node.close()
@@ -0,0 +1,96 @@
+import pytest
+
+from src.common.midi_utils import LocalBus, MidiMessage
+from src.common.pyxel_backend import pyxel
+from src.nodes._0002_synth import SynthNode
+from src.nodes._0002_synth.voices import STEAL_QUIETEST, SoundCache, VoiceAllocator, midi_to_pyxel_note
+
+
+@pytest.fixture
+def played(monkeypatch):
+    events = []
+    pyxel.use_headless()
+    monkeypatch.setitem(pyxel.__dict__, "play", lambda ch, snd, **kwargs: events.append(("play", ch, snd.notes)))
+    monkeypatch.setitem(pyxel.__dict__, "stop", lambda ch=None: events.append(("stop", ch)))
+    return events
+
+
+def note_on(note, velocity=100):
+    return MidiMessage(type="note_on", note=note, velocity=velocity, channel=1)
+
+
+def test_chord_is_played_on_separate_channels_until_note_off(played):
+    node = SynthNode(headless=True, bus=LocalBus(remote=False))
+    try:
+        for note in (60, 64, 67):
+            node.on_midi(note_on(note))
+        assert played == [("play", 0, "c2"), ("play", 1, "e2"), ("play", 2, "g2")]
+        assert node.sound_cache.misses == 0
+
+        node.on_midi(MidiMessage(type="note_off", note=64, velocity=0, channel=1))
+        node.on_midi(note_on(64, velocity=0))  # 発音していないノートは無視
+        assert played[-1] == ("stop", 1)
+        assert node.voices.active_notes() == [(0, 60), (2, 67)]
+
+        node.on_midi(MidiMessage(type="stop"))
+        assert sorted(played[-2:]) == [("stop", 0), ("stop", 2)]
+    finally:
+        node.close()
+
+
+@pytest.mark.parametrize(
+    "release",
+    [
+        MidiMessage(type="note_off", note=60, velocity=64, channel=1),
+        MidiMessage(type="note_off", note=60, channel=1),
+        MidiMessage(type="note_on", note=60, channel=1),
+    ],
+)
+def test_note_is_released_regardless_of_release_velocity(played, release):
+    node = SynthNode(headless=True, bus=LocalBus(remote=False))
+    try:
+        node.on_midi(note_on(60))
+        node.on_midi(release)
+        assert played == [("play", 0, "c2"), ("stop", 0)]
+        assert node.voices.active_notes() == []
+    finally:
+        node.close()
+
+
+def test_note_without_note_number_is_ignored(played):
+    node = SynthNode(headless=True, bus=LocalBus(remote=False))
+    try:
+        node.on_midi(note_on(60))
+        node.on_midi(MidiMessage(type="note_on", velocity=100, channel=1))
+        node.on_midi(MidiMessage(type="note_off", channel=1))
+        assert played == [("play", 0, "c2")]
+        assert node.voices.active_notes() == [(0, 60)]
+    finally:
+        node.close()
+
+
+def test_voice_stealing_policies():
+    oldest = VoiceAllocator(channels=(0, 1), steal="oldest")
+    quietest = VoiceAllocator(channels=(0, 1), steal=STEAL_QUIETEST)
+    for allocator in (oldest, quietest):
+        allocator.note_on(60, 3)
+        allocator.note_on(62, 1)
+    assert oldest.note_on(64, 7) == 0
+    assert quietest.note_on(64, 7) == 1
+    # 同じノートは同じチャンネルで鳴らし直す
+    assert quietest.note_on(64, 5) == 1
+    assert oldest.stolen == quietest.stolen == 1
+    with pytest.raises(ValueError):
+        VoiceAllocator(steal="newest")
+
+
+def test_sound_cache_is_bounded():
+    pyxel.use_headless()
+    cache = SoundCache(capacity=2)
+    first = cache.get(60, 7, "t")
+    cache.get(62, 7, "t")
+    assert cache.get(60, 7, "t") is first
+    cache.get(64, 7, "t")  # 最も長く使われていない (62, 7, "t") を捨てる
+    assert len(cache) == 2 and cache.misses == 3 and cache.hits == 1
+    assert cache.get(60, 7, "t") is first
+    assert (midi_to_pyxel_note(69), midi_to_pyxel_note(12), midi_to_pyxel_note(127)) == (33, 0, 55)
@@ -0,0 +1,177 @@
+import json
+from pathlib import Path
+
+from src.common.midi_utils import LocalBus, MidiMessage
+from src.nodes._0003_advanced_rhythm import AdvancedRhythmNode
+from src.nodes._0003_advanced_rhythm.patterns import (
+    DrumSound,
+    PatternBank,
+    StepTable,
+    mask_to_steps,
+    steps_to_mask,
+    velocity_to_level,
+)
+
+
+def _channels(hits):
+    return tuple(channel for channel, _ in hits)
+
+
+def _volumes(hits):
+    return tuple(sound.volumes for _, sound in hits)
+
+
+def test_step_notes_are_sent_as_one_batch():
+    bus = LocalBus(remote=False)
+    batches = []
+    bus.publish_batch = lambda sender, msgs: batches.append([(msg.note, msg.channel) for msg in msgs])
+
+    node = AdvancedRhythmNode(headless=True, emit_notes=True, bus=bus)
+    try:
+        node.on_midi(MidiMessage(type="start"))
+    finally:
+        node.close()
+
+    # ステップ0ではキックとハイハットが同時に鳴る
+    assert batches == [[(36, 10), (42, 10)]]
+
+
+def test_toggles_recompile_step_table():
+    node = AdvancedRhythmNode(headless=True, bus=LocalBus(remote=False))
+    played = []
+    node._play = played.append
+    try:
+        node._process_step(MidiMessage(type="clock"))
+        assert _channels(played[-1]) == (0, 2)
+        node._toggle_mute("hihat")
+        node._toggle_step("snare", 0)
+        node._process_step(MidiMessage(type="clock"))
+        assert _channels(played[-1]) == (0, 1)
+        assert not node.step_table.dirty
+    finally:
+        node.close()
+
+
+def test_step_table_with_many_tracks():
+    drums = [
+        DrumSound(
+            name=f"d{i}",
+            note=i,
+            sound_id=i,
+            volume=50,
+            pattern=steps_to_mask(s % (i + 1) == 0 for s in range(64)),
+            muted=i == 3,
+        )
+        for i in range(64)
+    ]
+    table = StepTable(64)
+    table.compile(drums)
+    # ステップ0では（ミュート以外の）すべてのドラムが鳴る
+    assert len(table.hits[0]) == 63
+    assert table.notes[0][0] == (0, 50)
+    assert _channels(table.hits[63]) == (0, 2, 6, 8, 20, 62)
+    assert [d.hit(s) for d in drums[:1] for s in range(3)] == [True, True, True]
+    assert mask_to_steps(drums[2].pattern, 7) == [1, 0, 0, 1, 0, 0, 1]
+
+
+def test_pattern_bank_switches_on_next_bar(tmp_path):
+    bank = tmp_path / "bank.json"
+    bank.write_text(
+        json.dumps(
+            {
+                "steps": 8,
+                "patterns": [
+                    {"name": "A", "drums": {"kick": "x...x..."}},
+                    {"name": "B", "drums": {"snare": "x.x.x.x."}},
+                ],
+            }
+        )
+    )
+    node = AdvancedRhythmNode(headless=True, bus=LocalBus(remote=False), pattern_bank=str(bank), pattern_cc=20)
+    played = []
+    node._play = played.append
+    try:
+        node.on_midi(MidiMessage(type="start"))
+        assert [_channels(hits) for hits in played] == [(0,)]
+        # 再生中の切り替えは次の小節の頭まで待つ
+        node.on_midi(MidiMessage(type="program_change", value=1, channel=1))
+        assert node.pending_pattern == 1 and node.pattern_index == 0
+        for _ in range(6 * 7):
+            node.on_midi(MidiMessage(type="clock"))
+        assert node.pattern_index == 0
+        node._toggle_step("kick", 1)  # 切り替え前の編集はパターンAに残る
+        for _ in range(6):
+            node.on_midi(MidiMessage(type="clock"))
+        assert node.pattern_index == 1 and node.step == 0
+        assert _channels(played[-1]) == (1,)
+
+        # コントロールチェンジで戻すと、編集したステップが残っている
+        node.on_midi(MidiMessage(type="control_change", control=20, value=0, channel=1))
+        for _ in range(6 * 8):
+            node.on_midi(MidiMessage(type="clock"))
+        assert node.pattern_index == 0
+        assert mask_to_steps(node.drums["kick"].pattern, 8) == [1, 1, 0, 0, 1, 0, 0, 0]
+    finally:
+        node.close()
+
+
+def test_bundled_pattern_bank_loads():
+    bank = PatternBank.load(str(Path(__file__).parents[3] / "src" / "nodes" / "_0003_advanced_rhythm" / "patterns.json"))
+    assert len(bank) == 3 and bank.num_steps == 16
+
+
+def test_volume_and_accents_select_sound_variants():
+    bus = LocalBus(remote=False)
+    batches = []
+    bus.publish_batch = lambda sender, msgs: batches.append([(msg.note, msg.velocity) for msg in msgs])
+    node = AdvancedRhythmNode(headless=True, emit_notes=True, bus=bus)
+    played = []
+    node._play = played.append
+    try:
+        kick = node.drums["kick"]
+        assert len(kick.variants) == 8 and kick.variants[3].volumes == "3"
+        # ステップ0はキックとハイハットのアクセント、ステップ4はハイハットのアクセントとキック
+        node.step = 0
+        node._process_step(MidiMessage(type="clock"))
+        node.step = 4
+        node._process_step(MidiMessage(type="clock"))
+        assert [_volumes(hits) for hits in played] == [("7", "7"), ("6", "7")]
+        assert batches[-1] == [(36, 100), (42, 127)]
+
+        # 音量を下げると前計算した別の段階のSoundを鳴らす
+        node.set_volume("kick", 50)
+        node._process_step(MidiMessage(type="clock"))
+        assert _volumes(played[-1]) == ("3", "7")
+        assert played[-1][0][1] is kick.variants[velocity_to_level(100, 50)]
+        node.set_volume("kick", 0)
+        node._process_step(MidiMessage(type="clock"))
+        assert _channels(played[-1]) == (2,)
+    finally:
+        node.close()
+
+
+def test_note_on_triggers_drum_by_note():
+    node = AdvancedRhythmNode(headless=True, bus=LocalBus(remote=False), trigger_channel=10)
+    played = []
+    node._play = played.append
+    try:
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=127, channel=10))
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=20, channel=10))
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=0, channel=10))  # ノートオフ扱い
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=127, channel=1))  # 別のチャンネル
+        node.on_midi(MidiMessage(type="note_on", note=60, velocity=127, channel=10))  # 対応するドラムなし
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=-5, channel=10))  # 範囲外
+        node.on_midi(MidiMessage(type="note_on", note=38, channel=10))  # ベロシティなし
+        assert [(_channels(hits), _volumes(hits)) for hits in played] == [((1,), ("7",)), ((1,), ("1",))]
+        node._toggle_mute("snare")
+        node.on_midi(MidiMessage(type="note_on", note=38, velocity=127, channel=10))
+        assert len(played) == 2
+    finally:
+        node.close()
+
+
+def test_pattern_bank_accents():
+    bank = PatternBank.from_dict({"steps": 4, "patterns": [{"drums": {"kick": "X.x>", "snare": [2, 0, 1, 0]}}]})
+    assert bank.patterns == [{"kick": 0b1101, "snare": 0b0101}]
+    assert bank.accents == [{"kick": 0b1001, "snare": 0b0001}]
+    assert velocity_to_level(0) == 0 and velocity_to_level(1) == 1 and velocity_to_level(127, 50) == 3
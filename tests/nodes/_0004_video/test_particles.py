@@ -0,0 +1,91 @@
+import pytest
+
+from src.nodes._0004_video.particles import EVICT_LOWEST_LIFE, EVICT_NONE, EVICT_OLDEST, ParticleSystem
+
+np = pytest.importorskip("numpy")
+
+
+def spawn_and_run(system, frames):
+    system.spawn(80, 60, [1.0, -1.0, 0.5], [0.0, -2.0, 1.0], life=3, color=8)
+    system.spawn(80, 60, [2.0], [2.0], life=5, color=9)
+    counts = []
+    for _ in range(frames):
+        system.update()
+        counts.append(len(system))
+    return counts
+
+
+def test_numpy_and_list_backends_match():
+    numpy_system = ParticleSystem(64, use_numpy=True)
+    list_system = ParticleSystem(64, use_numpy=False)
+
+    assert spawn_and_run(numpy_system, 6) == spawn_and_run(list_system, 6) == [4, 4, 1, 1, 0, 0]
+
+
+def test_positions_follow_gravity():
+    system = ParticleSystem(8, use_numpy=True)
+    system.spawn(10, 10, [1.0], [0.0], life=10, color=7)
+    system.update()
+    system.update()
+    assert (system._x[0], system._y[0]) == pytest.approx((12.0, 10.1))
+
+
+def test_spawns_beyond_capacity_are_dropped():
+    system = ParticleSystem(4, use_numpy=True, eviction=EVICT_NONE)
+    assert system.spawn(0, 0, [0.0] * 3, [0.0] * 3, life=10, color=1) == 3
+    assert system.spawn(0, 0, [0.0] * 3, [0.0] * 3, life=10, color=1) == 1
+    assert len(system) == 4
+    assert system.dropped == 2
+
+
+def lives(system):
+    if system.use_numpy:
+        return system._life[: len(system)].tolist()
+    return [particle.life for particle in system._particles]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+@pytest.mark.parametrize(
+    "eviction, expected",
+    [
+        (EVICT_OLDEST, [5, 20, 30, 40]),
+        (EVICT_LOWEST_LIFE, [10, 20, 30, 40]),
+    ],
+)
+def test_eviction_policy(use_numpy, eviction, expected):
+    system = ParticleSystem(4, use_numpy=use_numpy, eviction=eviction)
+    for life in (10, 5, 20, 30, 40):
+        system.spawn(0, 0, [0.0], [0.0], life=life, color=1)
+
+    stats = system.stats()
+    assert (stats.live, stats.spawned, stats.dropped, stats.recycled) == (4, 5, 0, 1)
+    assert sorted(lives(system)) == expected
+
+
+def test_dead_particles_are_reused():
+    system = ParticleSystem(8, use_numpy=False)
+    system.spawn(0, 0, [0.0, 0.0], [0.0, 0.0], life=1, color=1)
+    first = set(map(id, system._particles))
+    system.update()
+    system.spawn(0, 0, [1.0, 1.0], [1.0, 1.0], life=5, color=2)
+
+    assert set(map(id, system._particles)) == first
+    assert [particle.life for particle in system._particles] == [5, 5]
+
+
+def test_rasterize_matches_circle_shapes():
+    system = ParticleSystem(8, use_numpy=True)
+    system.spawn(2, 2, [0.0], [0.0], life=10, color=5)  # 生成直後は半径2
+    system.spawn(6, 2, [0.0], [0.0], life=10, color=6)
+    system._life[1] = 4  # 寿命が減ると半径1
+
+    buffer = np.zeros((5, 9), dtype=np.uint8)
+    system._rasterize(buffer, len(system))
+
+    assert buffer.tolist() == [
+        [0, 5, 5, 5, 0, 0, 0, 0, 0],
+        [5, 5, 5, 5, 5, 0, 6, 0, 0],
+        [5, 5, 5, 5, 5, 6, 6, 6, 0],
+        [5, 5, 5, 5, 5, 0, 6, 0, 0],
+        [0, 5, 5, 5, 0, 0, 0, 0, 0],
+    ]